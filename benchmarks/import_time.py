@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Import time benchmark of the CLI entry script, based on python -X importtime.
+
+    python benchmarks/import_time.py                      # akamai-mediaservices --help
+    python benchmarks/import_time.py -- list-domains --help
+    python benchmarks/import_time.py --max-ms 80          # exit 1 when over budget
+"""
+from __future__ import print_function
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, 'bin', 'akamai-mediaservices')
+
+
+def importTimes(python, command):
+    """ Runs the entry script once and returns {module: cumulative microseconds} of the top level imports """
+    process = subprocess.run([python, '-X', 'importtime', ENTRY] + command,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        # Nested imports are indented, their time is already in the cumulative of their parent
+        if not module.startswith('  '):
+            times[module.strip()] = int(cumulative_us)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of akamai-mediaservices.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs, the median is reported')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter to benchmark')
+    parser.add_argument('--top', type=int, default=10, help='Number of modules to list')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail when the median total exceeds this budget')
+    parser.add_argument('command', nargs='*', default=['--help'], help='Arguments passed to the CLI')
+    args = parser.parse_args()
+
+    runs = [importTimes(args.python, args.command) for run in range(args.runs)]
+    totals = sorted(sum(times.values()) for times in runs)
+    median = totals[len(totals) // 2] / 1000.0
+
+    modules = {}
+    for times in runs:
+        for module, cumulative_us in times.items():
+            modules.setdefault(module, []).append(cumulative_us)
+    ranking = sorted(((sorted(values)[len(values) // 2], module) for module, values in modules.items()), reverse=True)
+
+    print("akamai-mediaservices %s" % ' '.join(args.command))
+    print("median import time over %d runs: %.1f ms" % (args.runs, median))
+    for cumulative_us, module in ranking[:args.top]:
+        print("  %8.1f ms  %s" % (cumulative_us / 1000.0, module))
+
+    if args.max_ms is not None and median > args.max_ms:
+        print("FAIL: import time %.1f ms is over the %.1f ms budget" % (median, args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
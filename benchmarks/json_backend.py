@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Micro-benchmark of the JSON backends (orjson when installed, the standard
+ library) on listcpcodes and listmslStreams payloads of the mock API fixtures.
+
+    python benchmarks/json_backend.py                 # 100000 records
+    python benchmarks/json_backend.py --records 10000 --repeat 5
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bin'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import jsonbackend
+import outputformat
+from mock_api import Fixtures
+
+
+class NullOutput():
+    """ Swallows the formatter output, only the encoding is measured """
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def best(function, repeat):
+    """ Best wall time of repeat calls in milliseconds """
+    times = []
+    for run in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times) * 1000.0
+
+
+def cases(payloads):
+    """ Name and function of every measured operation """
+    for name, (key, body) in sorted(payloads.items()):
+        document = jsonbackend.loads(body)
+        records = document[key] if key else document
+        yield '%s decode' % name, lambda body=body: jsonbackend.loads(body)
+        yield '%s encode json' % name, lambda document=document: jsonbackend.dumps(document, indent=True)
+        yield '%s encode compact' % name, lambda document=document: jsonbackend.dumps(document)
+        yield '%s printJsonList json' % name, lambda records=records: outputformat.printJsonList('records', records, 'json')
+        yield '%s printJsonList ndjson' % name, lambda records=records: outputformat.printJsonList('records', records, 'ndjson')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the JSON backends on large API payloads.')
+    parser.add_argument('--records', type=int, default=100000, help='Number of cpcodes and MSL streams')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per operation, the best one is reported')
+    args = parser.parse_args()
+
+    fixtures = Fixtures(streams=args.records)
+    payloads = {
+        'listcpcodes': (None, fixtures.cpcodesJson('INGEST', 'false').encode('utf-8')),
+        'listmslStreams': ('streams', fixtures.mslStreamsPage(1, args.records, 'createdDate', 'DESC', {}).encode('utf-8')),
+    }
+    backends = ['json'] + (['orjson'] if jsonbackend.backend() == 'orjson' else [])
+    if len(backends) == 1:
+        print("orjson is not installed, only the standard library is measured")
+
+    results = {}
+    stdout = sys.stdout
+    for backend in backends:
+        jsonbackend.useBackend(backend)
+        sys.stdout = NullOutput()
+        try:
+            for name, function in cases(payloads):
+                results[(name, backend)] = best(function, args.repeat)
+        finally:
+            sys.stdout = stdout
+
+    print("%d records, best of %d runs" % (args.records, args.repeat))
+    print("%-40s %s" % ('operation', ''.join('%12s' % backend for backend in backends) + ('     speedup' if len(backends) > 1 else '')))
+    for name, function in cases(payloads):
+        line = "%-40s %s" % (name, ''.join('%10.1fms' % results[(name, backend)] for backend in backends))
+        if len(backends) > 1:
+            line += '%11.1fx' % (results[(name, 'json')] / max(results[(name, 'orjson')], 1e-6))
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#! /usr/bin/env python
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Local stand-in for the config-media-live API, serving the v1 XML and v2 JSON
+ endpoints from synthetic fixtures. EdgeGrid signatures are not checked.
+
+    python benchmarks/mock_api.py --port 8080 --streams 10000
+    python benchmarks/mock_api.py --latency 50 --jitter 20 --rate-429 0.05 --rate-5xx 0.01
+
+ Point a .edgerc section at it with host = http://127.0.0.1:8080
+ GET /__stats returns the number of requests served per status. Responses carry
+ an ETag and If-None-Match is answered with 304.
+"""
+from __future__ import print_function
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+from xml.sax.saxutils import escape
+
+if sys.version_info[0] >= 3:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs, urlencode
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+    from urllib import urlencode
+
+V1 = '/config-media-live/v1/live'
+V2 = '/config-media-live/v2/msl-origin'
+CPCODE_TYPES = ['INGEST', 'STORAGE', 'DELIVERY']
+
+
+def xmlElement(tag, value):
+    """ Serializes a dict, list or scalar the way the v1 API nests its XML """
+    if isinstance(value, dict):
+        return '<%s>%s</%s>' % (tag, ''.join(xmlElement(key, item) for key, item in value.items()), tag)
+    if isinstance(value, list):
+        return ''.join(xmlElement(tag, item) for item in value)
+    return '<%s>%s</%s>' % (tag, escape(str(value)), tag)
+
+
+class Fixtures():
+    """ Synthetic account: domains with their streams and events, RTMP configs, MSL streams and cpcodes """
+
+    def __init__(self, domains=10, streams=1000, events=2, cpcodes=None, seed=0):
+        self.domainCount = max(1, domains)
+        self.streamCount = streams
+        self.eventCount = events
+        self.cpcodeCount = streams if cpcodes is None else cpcodes
+        self.seed = seed
+        self.rendered = {}
+        self.lock = threading.Lock()
+
+    def memoized(self, key, build):
+        """ List responses are deterministic, each one is rendered once """
+        body = self.rendered.get(key)
+        if body is None:
+            body = build()
+            with self.lock:
+                self.rendered[key] = body
+        return body
+
+    def domainName(self, index):
+        return 'live%d.example.com' % index
+
+    def domain(self, index):
+        return {'configuration-details': {'configuration-name': 'live-config-%d' % index,
+                                          'hostname': self.domainName(index),
+                                          'reporting-cpcode': 100000 + index},
+                'domain-name': self.domainName(index)}
+
+    def streamIds(self, domainIndex):
+        """ The v1 streams are spread over the domains """
+        return range(domainIndex, self.streamCount, self.domainCount)
+
+    def stream(self, streamId):
+        return {'stream-id': streamId, 'stream-type': 'Universal' if streamId % 2 else 'HD',
+                'stream-name': 'stream-%d' % streamId, 'primary-encoder-ip': '10.0.%d.%d' % (streamId // 250 % 250, streamId % 250)}
+
+    def event(self, streamId, index):
+        return {'event-name': 'event-%d-%d' % (streamId, index),
+                'event-start-time': '2020-01-%02dT10:00:00Z' % (index % 28 + 1),
+                'event-end-time': '2020-01-%02dT12:00:00Z' % (index % 28 + 1)}
+
+    def rtmpConfig(self, cpcode):
+        return {'cpcode': cpcode, 'storage-group': 'sg-%d' % (cpcode % 10), 'archive-duration': 7}
+
+    def mslStream(self, streamId):
+        return {'id': streamId, 'name': 'msl-stream-%d' % streamId, 'format': 'HLS' if streamId % 3 else 'DASH',
+                'cpcode': 200000 + streamId, 'originHostName': 'origin-%d.akamaized.net' % streamId,
+                'createdDate': '2020-01-%02dT00:00:00Z' % (streamId % 28 + 1),
+                'modifiedDate': '2020-02-%02dT00:00:00Z' % ((streamId * 7) % 28 + 1),
+                'dvrWindowInMin': 30, 'encoderZone': ['US_EAST', 'US_WEST', 'EUROPE', 'ASIA'][streamId % 4]}
+
+    def mslStreamDetails(self, streamId):
+        stream = self.mslStream(streamId)
+        stream.update({'origin': {'hostName': stream.pop('originHostName')},
+                       'storageGroup': {'cpcode': 300000 + streamId % 50},
+                       'primaryPublishingUrl': 'rtmp://p.ep%d.i.akamaientrypoint.net/EntryPoint' % streamId,
+                       'backupPublishingUrl': 'rtmp://b.ep%d.i.akamaientrypoint.net/EntryPoint' % streamId,
+                       'allowedIps': ['192.0.2.%d' % (streamId % 250)]})
+        return stream
+
+    def cpcode(self, index, cpcodeType):
+        return {'id': 400000 + index, 'name': '%s-cpcode-%d' % (cpcodeType.lower(), index),
+                'contractIds': ['C-%d' % (index % 5)], 'type': cpcodeType, 'unused': index % 4 == 0}
+
+    # v1, XML
+
+    def domainsXml(self):
+        return self.memoized('domains', lambda: xmlElement('domains', {'domain': [self.domain(index) for index in range(self.domainCount)]}))
+
+    def streamsXml(self, domainIndex):
+        return self.memoized(('streams', domainIndex), lambda: xmlElement(
+            'streams', {'stream': [self.stream(streamId) for streamId in self.streamIds(domainIndex)]}))
+
+    def eventsXml(self, streamId):
+        return xmlElement('events', {'event': [self.event(streamId, index) for index in range(self.eventCount)]})
+
+    def rtmpConfigsXml(self):
+        return self.memoized('rtmp', lambda: xmlElement(
+            'configurations', {'configuration': [self.rtmpConfig(100000 + index) for index in range(self.domainCount)]}))
+
+    def rtmpStreamsXml(self):
+        return self.memoized('rtmp-streams', lambda: xmlElement(
+            'streams', {'stream': [self.stream(streamId) for streamId in range(min(self.streamCount, 1000))]}))
+
+    def storageGroupsXml(self):
+        return xmlElement('storage-groups', {'storage-group': [{'name': 'sg-%d' % index, 'cpcode': 300000 + index}
+                                                              for index in range(10)]})
+
+    # v2, JSON
+
+    def mslStreamsPage(self, page, pageSize, sortKey, sortOrder, query):
+        def order():
+            ids = list(range(self.streamCount))
+            if sortKey == 'modifiedDate':
+                ids.sort(key=lambda streamId: self.mslStream(streamId)['modifiedDate'])
+            if sortOrder == 'DESC':
+                ids.reverse()
+            return ids
+        ids = self.memoized(('order', sortKey, sortOrder), order)
+        start = (page - 1) * pageSize
+        document = {'page': page, 'pageSize': pageSize, 'totalItems': self.streamCount,
+                    'streams': [self.mslStream(streamId) for streamId in ids[start:start + pageSize]], 'links': []}
+        if start + pageSize < self.streamCount:
+            next_query = dict(query, page=page + 1, pageSize=pageSize)
+            document['links'].append({'rel': 'next', 'href': '%s/streams?%s' % (V2, urlencode(sorted(next_query.items())))})
+        return json.dumps(document)
+
+    def cdnsJson(self):
+        return json.dumps([{'code': 'AKAMAI', 'name': 'Akamai'}, {'code': 'OTHER', 'name': 'Other CDN'}])
+
+    def cpcodesJson(self, cpcodeType, unused):
+        def build():
+            cpcodes = [self.cpcode(index, cpcodeType) for index in range(self.cpcodeCount)]
+            if unused == 'true':
+                cpcodes = [cpcode for cpcode in cpcodes if cpcode['unused']]
+            return json.dumps(cpcodes)
+        return self.memoized(('cpcodes', cpcodeType, unused), build)
+
+
+# Path pattern, fixture builder and content type
+ROUTES = [
+    (V1 + r'$', lambda f, m, q: f.domainsXml(), 'application/xml'),
+    (V1 + r'/rtmp/configuration$', lambda f, m, q: f.rtmpConfigsXml(), 'application/xml'),
+    (V1 + r'/rtmp/configuration/(\d+)$', lambda f, m, q: xmlElement('configuration', f.rtmpConfig(int(m.group(1)))), 'application/xml'),
+    (V1 + r'/rtmp/stream$', lambda f, m, q: f.rtmpStreamsXml(), 'application/xml'),
+    (V1 + r'/rtmp/stream/(\d+)$', lambda f, m, q: xmlElement('stream', f.stream(int(m.group(1)))), 'application/xml'),
+    (V1 + r'/rtmp/storage-group$', lambda f, m, q: f.storageGroupsXml(), 'application/xml'),
+    (V1 + r'/live(\d+)\.example\.com$', lambda f, m, q: xmlElement('domain', f.domain(int(m.group(1)))), 'application/xml'),
+    (V1 + r'/live(\d+)\.example\.com/stream$', lambda f, m, q: f.streamsXml(int(m.group(1))), 'application/xml'),
+    (V1 + r'/live(\d+)\.example\.com/stream/(\d+)$', lambda f, m, q: xmlElement('stream', f.stream(int(m.group(2)))), 'application/xml'),
+    (V1 + r'/live(\d+)\.example\.com/stream/(\d+)/event$', lambda f, m, q: f.eventsXml(int(m.group(2))), 'application/xml'),
+    (V1 + r'/live(\d+)\.example\.com/stream/(\d+)/event/event-\d+-(\d+)$',
+     lambda f, m, q: xmlElement('event', f.event(int(m.group(2)), int(m.group(3)))), 'application/xml'),
+    (V2 + r'/streams$', lambda f, m, q: f.mslStreamsPage(int(q.get('page', 1)), int(q.get('pageSize', 100)),
+                                                         q.get('sortKey'), q.get('sortOrder'), q), 'application/json'),
+    (V2 + r'/streams/(\d+)$', lambda f, m, q: json.dumps(f.mslStreamDetails(int(m.group(1)))), 'application/json'),
+    (V2 + r'/cdns$', lambda f, m, q: f.cdnsJson(), 'application/json'),
+    (V2 + r'/cpcodes$', lambda f, m, q: f.cpcodesJson(q.get('type', 'INGEST'), q.get('unused', 'false')), 'application/json'),
+]
+ROUTES = [(re.compile(pattern), build, content_type) for pattern, build, content_type in ROUTES]
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this delayed ACKs add 40ms to every keep-alive request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send(self, status, body, content_type, headers=None, counted=True):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if counted:
+            self.server.count(status)
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        if url.path == '/__stats':
+            return self.send(200, json.dumps(server.stats()), 'application/json', counted=False)
+
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)) / 1000.0)
+        draw = server.random()
+        if draw < server.rate_429:
+            return self.send(429, json.dumps({'title': 'Too Many Requests', 'status': 429}), 'application/problem+json',
+                             {'Retry-After': str(server.retry_after)})
+        if draw < server.rate_429 + server.rate_5xx:
+            return self.send(503, '<html><body>Service Unavailable</body></html>', 'text/html')
+
+        for pattern, build, content_type in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                body = build(server.fixtures, match, query)
+                # Conditional requests, as the real API does for its lists
+                etag = '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    return self.send(304, '', content_type, {'ETag': etag})
+                return self.send(200, body, content_type, {'ETag': etag})
+        self.send(404, json.dumps({'title': 'Not Found', 'detail': 'No such resource %s' % url.path}), 'application/problem+json')
+
+
+class MockApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures, latency=0.0, jitter=0.0, rate_429=0.0, rate_5xx=0.0, retry_after=1,
+                 seed=0, verbose=False):
+        HTTPServer.__init__(self, address, MockApiHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.generator = random.Random(seed)
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def random(self):
+        with self.lock:
+            return self.generator.random()
+
+    def count(self, status):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            statuses = dict((str(status), count) for status, count in self.statuses.items())
+        return {'requests': sum(statuses.values()), 'statuses': statuses}
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the config-media-live API.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on, 0 picks a free one')
+    parser.add_argument('--domains', type=int, default=10, help='Number of v1 domains')
+    parser.add_argument('--streams', type=int, default=1000, help='Number of v1 and MSL streams (10 to 100000)')
+    parser.add_argument('--events', type=int, default=2, help='Number of events per v1 stream')
+    parser.add_argument('--cpcodes', type=int, default=None, help='Number of cpcodes per type, defaults to --streams')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per request in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random latency variation in milliseconds')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the error injection')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    fixtures = Fixtures(args.domains, args.streams, args.events, args.cpcodes, args.seed)
+    server = MockApiServer((args.host, args.port), fixtures, args.latency, args.jitter, args.rate_429,
+                           args.rate_5xx, args.retry_after, args.seed, args.verbose)
+    # The benchmark runner reads the port from this line
+    print("Serving http://%s:%d/" % server.server_address[:2])
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
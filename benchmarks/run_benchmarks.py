@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ End to end benchmark of every CLI command against benchmarks/mock_api.py.
+ Reports wall time, requests per second and peak RSS per command and account size.
+
+    python benchmarks/run_benchmarks.py                          # sizes 10, 1000 and 10000
+    python benchmarks/run_benchmarks.py --sizes 100000 --commands list-msl-streams list-cpcodes
+    python benchmarks/run_benchmarks.py --latency 20 --rate-429 0.02 --report results.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+if sys.version_info[0] >= 3:
+    from urllib.request import urlopen
+else:
+    from urllib2 import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, 'bin', 'akamai-mediaservices')
+MOCK_API = os.path.join(ROOT, 'benchmarks', 'mock_api.py')
+
+DOMAIN = 'live0.example.com'
+# Command line of every command, run with -t <output type> unless it has no output type
+COMMANDS = [
+    ['list-domains'],
+    ['list-streams', DOMAIN],
+    ['list-streams', '--all-domains'],
+    ['list-events', DOMAIN, '0'],
+    ['list-events', DOMAIN, '--all-streams'],
+    ['list-rtmp-configs'],
+    ['list-rtmp-streams'],
+    ['list-storage-group'],
+    ['get-domain', DOMAIN],
+    ['get-stream', DOMAIN, '0'],
+    ['get-event', DOMAIN, '0', 'event-0-0'],
+    ['get-rtmp-config', '100000'],
+    ['get-rtmp-stream', '0'],
+    ['list-msl-streams'],
+    ['get-msl-streams', '0'],
+    ['get-msl-streams', '--all'],
+    ['list-CDNs'],
+    ['list-cpcodes'],
+    ['inventory', '--no-events'],
+]
+NO_OUTPUT_TYPE = ('inventory',)
+
+
+def startMockApi(python, size, args):
+    """ Starts the mock API on a free port and returns the process and its base URL """
+    command = [python, MOCK_API, '--port', '0', '--streams', str(size), '--domains', str(args.domains),
+               '--events', str(args.events), '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--rate-429', str(args.rate_429), '--rate-5xx', str(args.rate_5xx), '--retry-after', '0']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving '):
+        process.kill()
+        sys.exit("ERROR: The mock API did not start: %r" % line)
+    return process, line.split()[1].rstrip('/')
+
+
+def apiStats(baseurl):
+    return json.loads(urlopen(baseurl + '/__stats').read().decode('utf-8'))
+
+
+def writeEdgerc(directory, baseurl):
+    path = os.path.join(directory, 'edgerc')
+    with open(path, 'w') as edgerc:
+        edgerc.write('[mediaservices]\n')
+        edgerc.write('host = %s\n' % baseurl)
+        edgerc.write('client_token = akab-client-token\n')
+        edgerc.write('client_secret = benchmark-client-secret\n')
+        edgerc.write('access_token = akab-access-token\n')
+    return path
+
+
+def runCommand(python, edgerc, command, output_type, log):
+    """ Runs one CLI command and returns its exit status, wall time and peak RSS in MB """
+    argv = [python, ENTRY, '-e', edgerc, '--no-cache', '--no-daemon'] + command
+    if command[0] not in NO_OUTPUT_TYPE:
+        argv += ['-t', output_type]
+    start = time.time()
+    process = subprocess.Popen(argv, stdout=subprocess.DEVNULL if hasattr(subprocess, 'DEVNULL') else open(os.devnull, 'w'),
+                               stderr=log)
+    # wait4 gives the resource usage of this very child, ru_maxrss is in KB on Linux and in bytes on macOS
+    pid, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - start
+    process.returncode = status
+    rss = usage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1, seconds, rss
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every akamai-mediaservices command against a local mock API.')
+    parser.add_argument('--sizes', default='10,1000,10000', help='Comma separated numbers of streams and cpcodes per account')
+    parser.add_argument('--domains', type=int, default=10, help='Number of v1 domains')
+    parser.add_argument('--events', type=int, default=2, help='Number of events per v1 stream')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency added by the mock API in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency variation in milliseconds')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests throttled with 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per command, the median is reported')
+    parser.add_argument('--output-type', '-t', default='text', help='Output type passed to the commands')
+    parser.add_argument('--commands', nargs='*', default=None, help='Only run the commands starting with these names')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter running the CLI')
+    parser.add_argument('--report', default=None, metavar='results.json', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    commands = [command for command in COMMANDS
+                if not args.commands or any(' '.join(command).startswith(name) for name in args.commands)]
+    directory = tempfile.mkdtemp(prefix='mediaservices-benchmark-')
+    log = open(os.path.join(directory, 'stderr.log'), 'w+')
+    results = []
+    print("%8s  %-38s %6s %9s %9s %10s %9s" % ('size', 'command', 'exit', 'wall s', 'requests', 'req/s', 'RSS MB'))
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            mock, baseurl = startMockApi(args.python, size, args)
+            try:
+                edgerc = writeEdgerc(directory, baseurl)
+                for command in commands:
+                    runs = []
+                    for run in range(args.runs):
+                        before = apiStats(baseurl)['requests']
+                        status, seconds, rss = runCommand(args.python, edgerc, command, args.output_type, log)
+                        requests = apiStats(baseurl)['requests'] - before
+                        runs.append((seconds, status, requests, rss))
+                    seconds = median([run[0] for run in runs])
+                    status = max(run[1] for run in runs)
+                    requests = median([run[2] for run in runs])
+                    rss = max(run[3] for run in runs)
+                    result = {'size': size, 'command': ' '.join(command), 'exit': status, 'seconds': round(seconds, 3),
+                              'requests': requests, 'requestsPerSecond': round(requests / seconds, 1) if seconds else 0,
+                              'peakRssMB': round(rss, 1)}
+                    results.append(result)
+                    print("%8d  %-38s %6d %9.3f %9d %10.1f %9.1f" % (
+                        size, result['command'][:38], status, seconds, requests, result['requestsPerSecond'], rss))
+                    sys.stdout.flush()
+            finally:
+                mock.terminate()
+                mock.wait()
+    finally:
+        log.seek(0)
+        errors = log.read()
+        log.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.report:
+        with open(args.report, 'w') as report:
+            json.dump({'latencyMs': args.latency, 'rate429': args.rate_429, 'rate5xx': args.rate_5xx,
+                       'outputType': args.output_type, 'results': results}, report, indent=2)
+    if any(result['exit'] for result in results):
+        print("\nSome commands failed, their stderr:\n%s" % errors[-4000:])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Python edgegrid module - multi account runs for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import copy
+import logging
+from batch import runTagged
+from endpointdef import setConcurrency
+
+logger = logging.getLogger(__name__)
+
+# Commands that cannot be repeated per account
+SINGLE_ACCOUNT_COMMANDS = ('batch', 'serve')
+
+
+def accountConfig(baseConfig, account):
+    """ Copy of the configuration switched to one account """
+    config = copy.copy(baseConfig)
+    config.accountSwitchKey = account
+    config.accounts = [account]
+    return config
+
+
+def runAccount(account, baseConfig, fetch):
+    """ Runs the command for one account and returns its result tagged with the switch key """
+    return runTagged({'accountSwitchKey': account}, lambda: fetch(accountConfig(baseConfig, account)))
+
+
+def runAccounts(accounts, baseConfig, fetch, concurrency=4):
+    """ Yields the tagged result of every account, in input order, a failed account does not stop the others """
+    if baseConfig.command in SINGLE_ACCOUNT_COMMANDS:
+        exit("ERROR: %s cannot be run for several accounts" % baseConfig.command)
+    if concurrency <= 1:
+        for account in accounts:
+            yield runAccount(account, baseConfig, fetch)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    setConcurrency(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in executor.map(lambda account: runAccount(account, baseConfig, fetch), accounts):
+            yield record
@@ -0,0 +1,318 @@
+# Python edgegrid module - asyncio HTTP caller for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Coroutine versions of getResult, postResult, putResult and deleteResult on an
+ aiohttp session, thousands of requests can be in flight on one thread. aiohttp
+ is optional, only this caller needs it (pip install aiohttp).
+
+ Requests are signed by the same EdgeGridAuth as the requests session: every
+ call is prepared with requests, signed, and its exact URL, headers and body
+ are sent by aiohttp. Retries, the rate limiter, the response cache, the
+ timings and the error handling are the ones of EdgeGridHttpCaller.
+"""
+from __future__ import print_function
+import time
+import asyncio
+import threading
+import logging
+from jsonbackend import dumps
+from http_calls import EdgeGridHttpCaller, RETRY_STATUSES, IDEMPOTENT_METHODS, jsonBody, retryAfter, nextPage, \
+    flightKey, parse
+
+logger = logging.getLogger(__name__)
+
+AIOHTTP_MISSING = "ERROR: --transport async needs aiohttp, install it with 'pip install aiohttp'"
+
+
+def importAiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        exit(AIOHTTP_MISSING)
+    return aiohttp
+
+
+class AsyncResponse():
+    """ Status, headers and body of a response, read in full before the connection goes back to the pool """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class AsyncEdgeGridHttpCaller():
+    def __init__(self, auth, headers, debug, verbose, baseurl, cache=None, limiter=None, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0, timings=None, connections=100):
+        self.aiohttp = importAiohttp()
+        self.auth = auth
+        self.headers = headers
+        self.debug = debug
+        self.verbose = verbose
+        self.baseurl = baseurl
+        self.cache = cache
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timings = timings
+        self.connections = connections
+        self.stats = {'requests': 0, 'retries': 0, 'throttleWait': 0.0, 'backoffWait': 0.0, 'cacheHits': 0, 'coalesced': 0}
+        # Threads running their own event loop share the counters
+        self.statsLock = threading.Lock()
+        # aiohttp sessions and futures belong to an event loop, one per loop when threads run their own
+        self.sessions = {}
+        self.inflight = {}
+        return None
+
+    # Helpers that do not depend on the transport
+    backoff = EdgeGridHttpCaller.backoff
+    httpErrors = EdgeGridHttpCaller.httpErrors
+    printStats = EdgeGridHttpCaller.printStats
+    countHit = EdgeGridHttpCaller.countHit
+    countStat = EdgeGridHttpCaller.countStat
+    urlJoin = EdgeGridHttpCaller.urlJoin
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(loop)
+        if session is None:
+            connector = self.aiohttp.TCPConnector(limit=self.connections)
+            traces = [self.connectTrace()] if self.timings else []
+            session = self.sessions[loop] = self.aiohttp.ClientSession(connector=connector, trace_configs=traces)
+        return session
+
+    def connectTrace(self):
+        """ aiohttp trace adding the time to open a new connection to the 'connect' of the request context """
+        trace = self.aiohttp.TraceConfig()
+
+        async def started(session, context, params):
+            context.connectStart = time.time()
+
+        async def ended(session, context, params):
+            context.trace_request_ctx['connect'] += time.time() - context.connectStart
+        trace.on_connection_create_start.append(started)
+        trace.on_connection_create_end.append(ended)
+        return trace
+
+    async def close(self):
+        """ Closes the session of the running loop and its connections """
+        session = self.sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def signed(self, method, url, parameters=None, body=None, headers=None):
+        """ The request prepared and signed by requests and EdgeGridAuth """
+        import requests
+        request = requests.Request(method, url, params=parameters, data=body,
+                                   headers=dict(self.headers, **(headers or {})))
+        return self.auth(request.prepare())
+
+    async def send(self, method, url, parameters, body, headers):
+        """ Sends one signed request and reads the whole response """
+        from yarl import URL
+        start = time.time()
+        prepared = self.signed(method, url, parameters, body, headers)
+        phases = {'connect': 0.0}
+        async with self.session().request(method, URL(prepared.url, encoded=True), data=prepared.body,
+                                          headers=dict(prepared.headers), allow_redirects=False,
+                                          trace_request_ctx=phases) as response:
+            wait = time.time() - start
+            content = await response.read()
+            if self.timings:
+                self.timings.addRequest(response.status, wait, max(0.0, time.time() - start - wait), len(content),
+                                        phases['connect'])
+            return AsyncResponse(response.status, response.headers, content)
+
+    async def request(self, method, endpoint, params=None, data=None, headers=None):
+        """ Sends a request through the rate limiter, retrying throttled and failed calls with backoff """
+        url = parse.urljoin(self.baseurl, endpoint)
+        attempt = 0
+        while True:
+            if self.limiter:
+                waited = self.limiter.reserve()
+                if waited:
+                    self.countStat('throttleWait', waited)
+                    if self.verbose: print("LOG: THROTTLE %s %s waited %.2fs for the rate limiter" % (method, endpoint, waited))
+                    await asyncio.sleep(waited)
+            self.countStat('requests')
+            try:
+                endpoint_result = await self.send(method, url, params, data, headers)
+            except (self.aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if attempt >= self.max_retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                reason = type(error).__name__
+                delay = self.backoff(attempt)
+            else:
+                status = endpoint_result.status_code
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return endpoint_result
+                # A throttled call was not processed, anything else is only safe to replay when idempotent
+                if status != 429 and method not in IDEMPOTENT_METHODS:
+                    return endpoint_result
+                reason = status
+                delay = retryAfter(endpoint_result)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if status == 429 and self.limiter:
+                    self.limiter.penalize(delay)
+            attempt += 1
+            self.countStat('retries')
+            self.countStat('backoffWait', delay)
+            if self.verbose:
+                print("LOG: RETRY %s %s after %s, waiting %.2fs (attempt %d of %d)" % (
+                    method, endpoint, reason, delay, attempt, self.max_retries))
+            await asyncio.sleep(delay)
+
+    async def offload(self, function, *args):
+        """ Runs a blocking call, the file reads and writes of the response cache, on the default executor """
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def getResult(self, endpoint, parameters=None):
+        """ Executes a GET API call and returns the JSON output
+
+        Concurrent calls for the same endpoint and parameters await one request and
+        share its parsed result, which callers must not modify.
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, flightKey(endpoint, parameters))
+        flight = self.inflight.get(key)
+        if flight is not None:
+            self.countStat('coalesced')
+            if self.verbose: print("LOG: GET %s shared the response of an identical request in flight" % endpoint)
+            # A cancelled waiter must not cancel the request of the others
+            return await asyncio.shield(flight)
+        flight = self.inflight[key] = loop.create_future()
+        try:
+            result = await self.fetchResult(endpoint, parameters)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as error:
+            flight.set_exception(error)
+            # Marks it retrieved, there may be nobody waiting
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+        finally:
+            del self.inflight[key]
+        return result
+
+    async def fetchResult(self, endpoint, parameters=None):
+        """ Executes a GET API call and returns the JSON output """
+        path = endpoint
+        headers = None
+        stored = None
+        if self.cache:
+            cache_key = self.cache.key(self.baseurl, endpoint, parameters)
+            cached = await self.offload(self.cache.get, cache_key, endpoint)
+            if cached is not None:
+                self.countHit(endpoint, "served from cache")
+                return cached['result']
+            stored = await self.offload(self.cache.load, cache_key)
+            headers = self.cache.conditionalHeaders(stored)
+        endpoint_result = await self.request('GET', path, params=parameters, headers=headers)
+        status = endpoint_result.status_code
+        if status == 304 and stored is not None:
+            # Not modified, the stored parsed result is still valid
+            self.countHit(endpoint, "304 revalidated cached response")
+            await self.offload(self.cache.put, cache_key, endpoint, stored['result'], stored.get('etag'),
+                               stored.get('lastModified'))
+            return stored['result']
+        if endpoint_result.headers.get('Content-Type', '').startswith('application/xml'):
+            import xmltodict
+            start = time.time()
+            result = xmltodict.parse(endpoint_result.content)
+            if self.timings: self.timings.add('parse', time.time() - start)
+            if self.verbose: print("LOG: GET %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
+        else:
+            start = time.time()
+            result = jsonBody(endpoint_result)
+            if self.timings: self.timings.add('parse', time.time() - start)
+            if self.verbose: print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+            if self.verbose: print("LOG: GET %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
+            self.httpErrors(endpoint_result.status_code, path, result)
+        if self.cache and status == 200:
+            await self.offload(self.cache.put, cache_key, endpoint, result,
+                               endpoint_result.headers.get('ETag'), endpoint_result.headers.get('Last-Modified'))
+        return result
+
+    async def iterPages(self, endpoint, parameters=None, itemsKey=None, pageSize=100, limit=None):
+        """ Executes paginated GET calls and yields the records as each page arrives """
+        parameters = dict(parameters or {})
+        page = 1
+        count = 0
+        while True:
+            page_parameters = dict(parameters, page=page, pageSize=pageSize)
+            result = await self.getResult(endpoint, page_parameters)
+            records = (result.get(itemsKey) if itemsKey else result) or []
+            for record in records:
+                yield record
+                count += 1
+                if limit and count >= limit:
+                    return
+            following = nextPage(result, records, endpoint, parameters, page, pageSize)
+            if following is None:
+                return
+            endpoint, parameters, page, pageSize = following
+
+    async def postResult(self, endpoint, body, parameters=None):
+        """ Executes a POST API call and returns the JSON output """
+        headers = {'content-type': 'application/json'}
+        endpoint_result = await self.request('POST', endpoint, params=parameters, data=body, headers=headers)
+        status = endpoint_result.status_code
+        if self.verbose:
+            print("LOG: POST %s %s %s %s %s" % (endpoint, body, parameters, status, endpoint_result.headers.get("content-type")))
+        if status == 204:
+            return {}
+        result = jsonBody(endpoint_result)
+        self.httpErrors(endpoint_result.status_code, endpoint, result)
+
+        if self.verbose:
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
+
+    async def putResult(self, endpoint, body, parameters=None):
+        """ Executes a PUT API call and returns the JSON output """
+        headers = {'content-type': 'application/json'}
+        endpoint_result = await self.request('PUT', endpoint, params=parameters, data=body, headers=headers)
+        status = endpoint_result.status_code
+        if self.verbose:
+            print("LOG: PUT %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
+        if status == 204:
+            return {}
+        result = jsonBody(endpoint_result)
+        if self.verbose:
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
+
+    async def deleteResult(self, endpoint, parameters=None):
+        """ Executes a DELETE API call and returns the JSON output """
+        endpoint_result = await self.request('DELETE', endpoint, params=parameters)
+        status = endpoint_result.status_code
+        if self.verbose:
+            print("LOG: DELETE %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
+        if status == 204:
+            return {}
+        result = jsonBody(endpoint_result)
+        if self.verbose:
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
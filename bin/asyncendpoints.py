@@ -0,0 +1,197 @@
+# Python edgegrid module - asyncio endpoints for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Coroutine versions of the endpointdef functions, with the same names and
+ arguments, on the asyncio caller:
+
+    streams = await asyncendpoints.listStreams(domainName, accountSwitchKey)
+    details = await asyncendpoints.fanOut(lambda streamId: getmslStreams(key, streamId), ids, 500)
+"""
+from __future__ import print_function
+import sys
+import asyncio
+import logging
+from http_calls import asList, recordCopies
+from endpointdef import getAsyncHttpCaller, domainNameOf
+
+logger = logging.getLogger(__name__)
+
+
+async def fanOut(function, items, concurrency):
+    """ Awaits function(item) for every item with at most concurrency in flight, results keep the order of items """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(item):
+        async with semaphore:
+            return await function(item)
+    return await asyncio.gather(*[bounded(item) for item in items])
+
+
+def accountParameters(accountSwitchKey, **parameters):
+    if accountSwitchKey:
+        parameters['accountSwitchKey'] = accountSwitchKey
+    return parameters or None
+
+
+async def listDomains(accountSwitchKey=None):
+    """ List the Domains associated with the account """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v1/live', accountParameters(accountSwitchKey))
+
+
+async def listStreams(domainName, accountSwitchKey=None):
+    """ List the Streams associated with the account """
+    listStreamsEndpoint = '/config-media-live/v1/live/{domain}/stream'.format(domain=domainName)
+    return await getAsyncHttpCaller().getResult(listStreamsEndpoint, accountParameters(accountSwitchKey))
+
+
+async def listEvents(domainName, streamId, accountSwitchKey=None):
+    """ List the Events associated with the account """
+    listEventsEndpoint = '/config-media-live/v1/live/{domain}/stream/{streamId}/event'.format(
+        domain=domainName, streamId=streamId)
+    return await getAsyncHttpCaller().getResult(listEventsEndpoint, accountParameters(accountSwitchKey))
+
+
+async def listRTMPConfigs(accountSwitchKey=None):
+    """ List the RTMP Configs associated with the account """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v1/live/rtmp/configuration',
+                                                accountParameters(accountSwitchKey))
+
+
+async def listRTMPStreams(accountSwitchKey=None):
+    """ List the RTMP Streams associated with the account """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v1/live/rtmp/stream',
+                                                accountParameters(accountSwitchKey))
+
+
+async def listStorageGroup(accountSwitchKey=None):
+    """ List the Storage Groups associated with the account """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v1/live/rtmp/storage-group',
+                                                accountParameters(accountSwitchKey))
+
+
+async def GetDomain(domainName, accountSwitchKey=None):
+    """ Get the Domain Info  """
+    getDomainEndpoint = '/config-media-live/v1/live/{domain}'.format(domain=domainName)
+    return await getAsyncHttpCaller().getResult(getDomainEndpoint, accountParameters(accountSwitchKey))
+
+
+async def GetStream(domainName, streamId, accountSwitchKey=None):
+    """ Get the Stream Info  """
+    getstreamEndpoint = '/config-media-live/v1/live/{domain}/stream/{streamId}'.format(
+        domain=domainName, streamId=streamId)
+    return await getAsyncHttpCaller().getResult(getstreamEndpoint, accountParameters(accountSwitchKey))
+
+
+async def GetEvent(domainName, streamId, eventName, accountSwitchKey=None):
+    """ Get the Event Info  """
+    getEventEndpoint = '/config-media-live/v1/live/{domain}/stream/{streamId}/event/{eventName}'.format(
+        domain=domainName, streamId=streamId, eventName=eventName)
+    return await getAsyncHttpCaller().getResult(getEventEndpoint, accountParameters(accountSwitchKey))
+
+
+async def GetRTMPConfig(cpCode, accountSwitchKey=None):
+    """ Get the RTMP Config Info  """
+    getRTMPConfigEndpoint = '/config-media-live/v1/live/rtmp/configuration/{cpcode}'.format(cpcode=cpCode)
+    return await getAsyncHttpCaller().getResult(getRTMPConfigEndpoint, accountParameters(accountSwitchKey))
+
+
+async def GetRTMPStream(streamId, accountSwitchKey=None):
+    """ Get the RTMP Stream Info  """
+    getRTMPStreamEndpoint = '/config-media-live/v1/live/rtmp/stream/{streamId}'.format(streamId=streamId)
+    return await getAsyncHttpCaller().getResult(getRTMPStreamEndpoint, accountParameters(accountSwitchKey))
+
+
+def iterMslStreams(accountSwitchKey=None, pageSize=100, limit=None, sortKey='createdDate', sortOrder='DESC'):
+    """ Async iterator over the MSL streams page by page """
+    params = accountParameters(accountSwitchKey, sortKey=sortKey, sortOrder=sortOrder)
+    return getAsyncHttpCaller().iterPages('/config-media-live/v2/msl-origin/streams', params, 'streams', pageSize, limit)
+
+
+async def listmslStreams(accountSwitchKey=None, sortKey='createdDate', sortOrder='DESC'):
+    """ Get list of MSL streams"""
+    return {'streams': [stream async for stream in iterMslStreams(accountSwitchKey, sortKey=sortKey, sortOrder=sortOrder)]}
+
+
+async def getmslStreams(accountSwitchKey, streamid):
+    "Get a stream details"
+    getStreamsEndpoint = '/config-media-live/v2/msl-origin/streams/{streamId}'.format(streamId=streamid)
+    return await getAsyncHttpCaller().getResult(getStreamsEndpoint, accountParameters(accountSwitchKey))
+
+
+async def getAllMslStreams(accountSwitchKey=None, streamIds=None, concurrency=8):
+    """ Get the details of many MSL streams concurrently, all of the account when no ids are given """
+    if streamIds is None:
+        streamIds = [stream['id'] async for stream in iterMslStreams(accountSwitchKey)]
+
+    async def fetch(streamId):
+        try:
+            return await getmslStreams(accountSwitchKey, streamId)
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to get the MSL stream %s: %s" % (streamId, error), file=sys.stderr)
+            return None
+
+    return {'streams': [streamInfo for streamInfo in await fanOut(fetch, streamIds, concurrency) if streamInfo]}
+
+
+async def listcdns(accountSwitchKey=None):
+    """ Get list of CDN's """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v2/msl-origin/cdns',
+                                                accountParameters(accountSwitchKey))
+
+
+async def listcpcodes(accountSwitchKey=None, type="INGEST", unused="true"):
+    """ Get list of cpcodes """
+    return await getAsyncHttpCaller().getResult('/config-media-live/v2/msl-origin/cpcodes',
+                                                accountParameters(accountSwitchKey, type=type, unused=unused))
+
+
+async def listAllStreams(accountSwitchKey=None, concurrency=8):
+    """ List the Streams of every Domain in the account, fetched concurrently """
+    domainList = await listDomains(accountSwitchKey)
+    domainNames = [domainNameOf(domain) for domain in asList(((domainList or {}).get('domains') or {}).get('domain'))]
+
+    async def fetch(domainName):
+        try:
+            return await listStreams(domainName, accountSwitchKey)
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to list the streams of %s: %s" % (domainName, error), file=sys.stderr)
+            return None
+
+    streams = []
+    for domainName, streamList in zip(domainNames, await fanOut(fetch, domainNames, concurrency)):
+        streams.extend(recordCopies(asList(((streamList or {}).get('streams') or {}).get('stream')),
+                                    {'domain-name': domainName}))
+    return {'streams': {'stream': streams}}
+
+
+async def listAllEvents(domainName, accountSwitchKey=None, concurrency=8):
+    """ List the Events of every Stream in a Domain, fetched concurrently """
+    streamList = await listStreams(domainName, accountSwitchKey)
+    streamIds = [stream['stream-id'] for stream in asList((streamList.get('streams') or {}).get('stream'))]
+
+    async def fetch(streamId):
+        try:
+            return await listEvents(domainName, streamId, accountSwitchKey)
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to list the events of stream %s: %s" % (streamId, error), file=sys.stderr)
+            return None
+
+    events = []
+    for streamId, eventList in zip(streamIds, await fanOut(fetch, streamIds, concurrency)):
+        if not eventList:
+            continue
+        events.extend(recordCopies(asList((eventList.get('events') or {}).get('event')), {'stream-id': streamId}))
+    return {'events': {'event': events}}
@@ -0,0 +1,115 @@
+# Python edgegrid module - batch mode for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import sys
+import copy
+import json
+import time
+import shlex
+import logging
+from config import buildParser, splitAccounts
+from endpointdef import setConcurrency
+
+logger = logging.getLogger(__name__)
+
+# Every command of a batch shares the session (and so the credentials) of the batch itself
+IGNORED_OPTIONS = ('edgerc', 'section', 'socket', 'no_daemon')
+NESTED_COMMANDS = ('batch', 'serve')
+
+
+def readCommands(path):
+    """ Yields the argv of every command of a batch file: one command line per line or a JSON array """
+    stream = sys.stdin if path == '-' else open(path)
+    for line in stream:
+        if not line.strip():
+            continue
+        if line.lstrip().startswith('['):
+            commands = json.loads(line + stream.read())
+            for command in commands:
+                if isinstance(command, list):
+                    yield [str(token) for token in command]
+                else:
+                    yield shlex.split(command)
+            break
+        argv = shlex.split(line, comments=True)
+        if argv:
+            yield argv
+    if stream is not sys.stdin:
+        stream.close()
+
+
+def commandConfig(argv, baseConfig):
+    """ Parses one batch command, options it does not set are taken from the batch invocation """
+    arguments = splitAccounts(vars(buildParser(argv).parse_args(argv)))
+    config = copy.copy(baseConfig)
+    for key, value in arguments.items():
+        if key in IGNORED_OPTIONS:
+            continue
+        if value is None or value is False or value == []:
+            if hasattr(baseConfig, key):
+                continue
+        setattr(config, key, value)
+    return config
+
+
+def materialize(result):
+    """ Turns the iterators returned by paginated commands into lists """
+    if isinstance(result, (dict, list)) or not hasattr(result, '__iter__'):
+        return result
+    return list(result)
+
+
+def runTagged(record, function):
+    """ Calls function and stores its result, or the error that stopped it, in record """
+    start = time.time()
+    try:
+        result = function()
+        record['status'] = 'ok'
+        record['result'] = materialize(result)
+    except SystemExit as error:
+        record['status'] = 'error'
+        record['error'] = str(error.code) if error.code not in (None, 0, 2) else 'invalid command'
+    except Exception as error:
+        record['status'] = 'error'
+        record['error'] = '%s: %s' % (type(error).__name__, error)
+    record['seconds'] = round(time.time() - start, 3)
+    return record
+
+
+def runCommand(index, argv, baseConfig, fetch):
+    """ Runs one command through fetch and returns its tagged result """
+    def run():
+        config = commandConfig(argv, baseConfig)
+        if config.command in NESTED_COMMANDS:
+            raise ValueError("%s cannot be run from a batch" % config.command)
+        if len(config.accounts) > 1:
+            raise ValueError("a batch command takes a single account switch key")
+        return fetch(config)
+
+    return runTagged({'index': index, 'command': ' '.join(argv)}, run)
+
+
+def runBatch(commands, baseConfig, fetch, concurrency=1):
+    """ Yields the tagged result of every command, in input order """
+    if concurrency <= 1:
+        for index, argv in enumerate(commands):
+            yield runCommand(index, argv, baseConfig, fetch)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    setConcurrency(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in executor.map(lambda item: runCommand(item[0], item[1], baseConfig, fetch), enumerate(commands)):
+            yield record
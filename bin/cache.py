@@ -0,0 +1,236 @@
+# Python edgegrid module - on-disk response cache for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import sys
+import os
+import re
+import json
+from jsonbackend import loads, dumps
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+if sys.version_info[0] >= 3:
+    # python3
+    from urllib import parse
+else:
+    # python2.7
+    import urlparse as parse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '~/.akamai-cli/cache/mediaservices'
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TTL = 300
+# The running size misses writes of other processes, the directory is scanned again after this many puts
+RESCAN_PUTS = 1000
+# Eviction goes below the limit so the next puts do not scan again right away
+EVICT_TO = 0.9
+
+# Time to live (in seconds) per endpoint, first match wins.
+# CDNs and cpcodes rarely change, single objects are the most volatile.
+ENDPOINT_TTLS = [
+    (re.compile(r'^/config-media-live/v2/msl-origin/cdns$'), 86400),
+    (re.compile(r'^/config-media-live/v2/msl-origin/cpcodes$'), 3600),
+    (re.compile(r'^/config-media-live/v2/msl-origin/streams$'), 300),
+    (re.compile(r'^/config-media-live/v2/msl-origin/streams/[^/]+$'), 120),
+    (re.compile(r'^/config-media-live/v1/live/rtmp/'), 600),
+    (re.compile(r'^/config-media-live/v1/live$'), 600),
+    (re.compile(r'^/config-media-live/v1/live/'), 300),
+]
+
+
+def isEnabled(value):
+    """ Interprets a flag coming either from the command line or from .edgerc """
+    if value is None:
+        return False
+    return str(value).strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def splitEndpoint(endpoint, parameters=None):
+    """ Returns the endpoint path and the merged, sorted query parameters """
+    url = parse.urlsplit(endpoint)
+    query = dict(parse.parse_qsl(url.query))
+    if parameters:
+        for key in parameters:
+            query[key] = str(parameters[key])
+    return url.path, sorted(query.items())
+
+
+class ResponseCache():
+    """ Size bounded, LRU evicted cache of parsed GET responses """
+
+    def __init__(self, cache_dir=None, max_bytes=None, default_ttl=None, refresh=False):
+        self.cache_dir = os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR)
+        self.max_bytes = int(max_bytes or DEFAULT_MAX_BYTES)
+        self.default_ttl = int(default_ttl) if default_ttl is not None else None
+        self.refresh = refresh
+        # Bytes in the directory, None until the first put scans it
+        self.total = None
+        self.puts = 0
+        self.sizeLock = threading.Lock()
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def key(self, baseurl, endpoint, parameters=None):
+        """ Builds the cache key from the host, endpoint, query parameters and accountSwitchKey """
+        path, query = splitEndpoint(endpoint, parameters)
+        raw = json.dumps([baseurl, path, query])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def ttlFor(self, endpoint):
+        """ Returns the time to live for an endpoint """
+        path = parse.urlsplit(endpoint).path
+        for pattern, ttl in ENDPOINT_TTLS:
+            if pattern.match(path):
+                return ttl if self.default_ttl is None else min(ttl, self.default_ttl)
+        return DEFAULT_TTL if self.default_ttl is None else self.default_ttl
+
+    def entryPath(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key, endpoint):
+        """ Returns the stored entry if it is still fresh, None otherwise """
+        if self.refresh:
+            return None
+        entry = self.load(key)
+        if entry is None:
+            return None
+        if time.time() - entry['stored'] > self.ttlFor(endpoint):
+            return None
+        self.touch(key)
+        return entry
+
+    def load(self, key):
+        """ Reads an entry regardless of its age """
+        try:
+            with open(self.entryPath(key), 'rb') as entry_file:
+                return loads(entry_file.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def conditionalHeaders(self, entry):
+        """ Returns the If-None-Match / If-Modified-Since headers for a stored entry """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('lastModified'):
+            headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def touch(self, key):
+        """ Marks an entry as recently used, eviction goes by modification time """
+        try:
+            os.utime(self.entryPath(key), None)
+        except OSError:
+            pass
+
+    def put(self, key, endpoint, result, etag=None, last_modified=None):
+        """ Stores a parsed result with its validators and evicts the least recently used entries """
+        entry = {'endpoint': endpoint, 'stored': time.time(), 'result': result,
+                 'etag': etag, 'lastModified': last_modified}
+        entry_path = self.entryPath(key)
+        tmp_path = '%s.%d.%d.tmp' % (entry_path, os.getpid(), threading.current_thread().ident)
+        try:
+            content = dumps(entry).encode('utf-8')
+            with open(tmp_path, 'wb') as entry_file:
+                entry_file.write(content)
+            try:
+                replaced = os.stat(entry_path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, entry_path)
+        except (IOError, OSError, TypeError, ValueError) as error:
+            logger.debug("Unable to cache %s: %s", endpoint, error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self.sizeLock:
+            self.puts += 1
+            if self.total is not None and self.puts % RESCAN_PUTS:
+                self.total += len(content) - replaced
+                if self.total <= self.max_bytes:
+                    return
+        # First put, over the limit or time for a rescan
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits in max_bytes and resets the running size """
+        with self.sizeLock:
+            self.total = self.scan()
+
+    def scan(self):
+        """ Evicts from a listing of the directory and returns the bytes left in it """
+        entries = []
+        total = 0
+        for item in os.scandir(self.cache_dir):
+            if not item.name.endswith('.json'):
+                continue
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes * EVICT_TO:
+                break
+        return total
+
+
+class MemoryResponseCache(ResponseCache):
+    """ In-memory variant of ResponseCache for the long running serve daemon """
+
+    def __init__(self, max_entries=1000, default_ttl=None, refresh=False):
+        self.max_entries = max_entries
+        self.default_ttl = int(default_ttl) if default_ttl is not None else None
+        self.refresh = refresh
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        # Callers mutate the results they get, every hit decodes its own copy
+        return dict(entry, result=loads(entry['result']))
+
+    def touch(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+    def put(self, key, endpoint, result, etag=None, last_modified=None):
+        entry = {'endpoint': endpoint, 'stored': time.time(), 'result': dumps(result),
+                 'etag': etag, 'lastModified': last_modified}
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -23,121 +23,309 @@ import logging
 if sys.version_info[0] >= 3:
     # python3
     from configparser import ConfigParser
-    import http.client as http_client
 else:
     # python2.7
     from ConfigParser import ConfigParser
-    import httplib as http_client
 
 PACKAGE_VERSION = "0.1.8"
+OUTPUT_TYPES = ['json', 'text', 'ndjson', 'json-compact']
+INVENTORY_KINDS = ['domain', 'stream', 'rtmpConfig', 'storageGroup', 'mslStream', 'cdn', 'cpcode']
 
 logger = logging.getLogger(__name__)
 
 
-class EdgeGridConfig():
+def addOutputType(parser):
+    parser.add_argument('--output-type', '-t', default='text', choices=OUTPUT_TYPES, metavar='json/text/ndjson/json-compact',
+                        help=' Output type {json, text, ndjson, json-compact}. Default is text')
+
+
+def addRecordFilter(parser):
+    parser.add_argument('--fields', default=None, metavar='id,name,origin.hostName',
+                        help=' Only keep these fields of every record, dotted paths for nested ones')
+    parser.add_argument('--filter', default=None, metavar="\"format==HLS and encoderZone=='US_EAST'\"",
+                        help=' Only keep the records matching the expression (and, or, not, ==, !=, <, >, in)')
+
+
+def listArguments(parser):
+    addOutputType(parser)
+    addRecordFilter(parser)
+
+
+def listStreamsArguments(parser):
+    parser.add_argument(
+        'domainName', nargs='?', help="Domain Name for which streams has to be fetched.", action='store')
+    parser.add_argument('--all-domains', default=False, action='store_true',
+                        help=' Fetch the streams of every domain in the account')
+    parser.add_argument('--concurrency', default=8, type=int, metavar='N',
+                        help=' Number of parallel requests with --all-domains. Default is 8')
+    listArguments(parser)
+
+
+def listEventsArguments(parser):
+    parser.add_argument(
+        'domainName', help="Domain Name for which streams has to be fetched.", action='store')
+    parser.add_argument(
+        'streamId', nargs='?', help="Stream Id for which events has to be fetched.", action='store')
+    parser.add_argument('--all-streams', default=False, action='store_true',
+                        help=' Fetch the events of every stream in the domain')
+    parser.add_argument('--concurrency', default=8, type=int, metavar='N',
+                        help=' Number of parallel requests with --all-streams. Default is 8')
+    listArguments(parser)
+
+
+def getDomainArguments(parser):
+    parser.add_argument(
+        'domain', help="Domain Name for which info has to be fetched.", action='store')
+    addOutputType(parser)
+
+
+def getStreamArguments(parser):
+    parser.add_argument('domain', help="Domain Name", action='store')
+    parser.add_argument('streamid', help="Stream Id", action='store')
+    addOutputType(parser)
 
+
+def getEventArguments(parser):
+    parser.add_argument('domain', help="Domain Name", action='store')
+    parser.add_argument('streamid', help="Stream Id", action='store')
+    parser.add_argument('eventname', help="Stream Id", action='store')
+    addOutputType(parser)
+
+
+def getRTMPConfigArguments(parser):
+    parser.add_argument(
+        'cpcode', metavar='cp-code', help="CP Code of the RTMP Config to be fetched.", action='store')
+    addOutputType(parser)
+
+
+def getRTMPStreamArguments(parser):
+    parser.add_argument(
+        'streamid', help="Stream id of the RTMP Stream", action='store')
+    addOutputType(parser)
+
+
+def listMSLStreamsArguments(parser):
+    parser.add_argument('--page-size', default=100, type=int, metavar='N',
+                        help=' Number of streams requested per page. Default is 100')
+    parser.add_argument('--limit', default=None, type=int, metavar='N',
+                        help=' Stop after N streams')
+    listArguments(parser)
+
+
+def getMSLStreamArguments(parser):
+    parser.add_argument('streamid', help="Stream Id, several ids or - to read them from stdin", nargs='*')
+    parser.add_argument('--all', default=False, action='store_true',
+                        help=' Get the details of every MSL stream of the account')
+    parser.add_argument('--concurrency', default=8, type=int, metavar='N',
+                        help=' Number of parallel requests. Default is 8')
+    listArguments(parser)
+
+
+def listCpcodesArguments(parser):
+    # No default here, a --filter on type or unused fills the ones not given (INGEST and true otherwise)
+    parser.add_argument('--type', default=None, choices=[
+        'INGEST', 'STORAGE', 'DELIVERY'], help='Identify the cpcode type. Default is INGEST')
+    parser.add_argument('--unused', default=None, choices=[
+        'true', 'false'], help=' lists only CP codes that have not already been used to provision an origin. Default is true')
+    listArguments(parser)
+
+
+def batchArguments(parser):
+    parser.add_argument('file', nargs='?', default='-',
+                        help="File with one command per line or a JSON array of commands. Default is stdin")
+    parser.add_argument('--concurrency', default=1, type=int, metavar='N',
+                        help=' Number of commands run in parallel. Default is 1')
+
+
+def serveArguments(parser):
+    parser.add_argument('--max-entries', default=1000, type=int, metavar='N',
+                        help=' Number of responses kept in the in-memory cache. Default is 1000')
+
+
+def inventoryArguments(parser):
+    parser.add_argument('--concurrency', default=16, type=int, metavar='N',
+                        help=' Number of parallel requests per level. Default is 16')
+    parser.add_argument('--no-events', default=False, action='store_true',
+                        help=' Do not fetch the events of every stream')
+    parser.add_argument('--output-file', '-o', default=None, metavar='snapshot.json',
+                        help=' Write the snapshot to a file instead of stdout')
+    parser.add_argument('--transport', default='threads', choices=['threads', 'async'],
+                        help=' Run the requests of a level on a thread pool, or on one asyncio event loop (needs aiohttp)'
+                             ' where --concurrency can be in the thousands. Default is threads')
+
+
+def inventoryDbArgument(parser):
+    parser.add_argument('--db', default=None, metavar='inventory.db',
+                        help=' SQLite inventory index (inventory_db in .edgerc, default ~/.akamai-cli/cache/mediaservices/inventory.db)')
+
+
+def inventoryKindArgument(parser):
+    parser.add_argument('--kind', default=None, action='append', choices=INVENTORY_KINDS,
+                        help=' Only return resources of this kind, can be repeated')
+
+
+def syncArguments(parser):
+    inventoryDbArgument(parser)
+    parser.add_argument('--concurrency', default=16, type=int, metavar='N',
+                        help=' Number of parallel requests per level. Default is 16')
+    parser.add_argument('--snapshot', default=None, metavar='snapshot.json',
+                        help=' Index an inventory snapshot file instead of calling the API')
+    parser.add_argument('--incremental', default=False, action='store_true',
+                        help=' Only refresh the MSL streams modified since the last sync')
+    addOutputType(parser)
+
+
+def queryArguments(parser):
+    inventoryDbArgument(parser)
+    inventoryKindArgument(parser)
+    parser.add_argument('--id', default=None, help=' Resource id (domain name, stream id, cpcode...)')
+    parser.add_argument('--name', default=None, help=' Resource name')
+    parser.add_argument('--cpcode', default=None, help=' Any cpcode of the resource')
+    parser.add_argument('--origin-host-name', default=None, help=' Origin hostname of an MSL stream')
+    parser.add_argument('--host-name', default=None, help=' Hostname of a domain')
+    parser.add_argument('--encoder-zone', default=None, help=' Encoder zone of an MSL stream')
+    parser.add_argument('--limit', default=None, type=int, metavar='N', help=' Stop after N resources')
+    listArguments(parser)
+
+
+def searchArguments(parser):
+    parser.add_argument('term', help="Start of an id, name, cpcode, hostname or encoder zone, case insensitive")
+    inventoryDbArgument(parser)
+    inventoryKindArgument(parser)
+    parser.add_argument('--limit', default=100, type=int, metavar='N',
+                        help=' Maximum number of resources. Default is 100')
+    listArguments(parser)
+
+
+def diffArguments(parser):
+    parser.add_argument('old', metavar='old.json', help="Inventory snapshot written by 'inventory -o'")
+    parser.add_argument('new', nargs='?', default=None, metavar='new.json',
+                        help="Snapshot to compare it with. Default is the live account of the old snapshot")
+    parser.add_argument('--kind', default=None, action='append', choices=INVENTORY_KINDS + ['event'],
+                        help=' Only compare resources of this kind, can be repeated')
+    parser.add_argument('--concurrency', default=16, type=int, metavar='N',
+                        help=' Number of parallel requests per level of the live crawl. Default is 16')
+    parser.add_argument('--no-events', default=False, action='store_true',
+                        help=' Do not fetch and compare the events of every stream')
+    addOutputType(parser)
+
+
+# Command name, help and the function adding its arguments.
+# Arguments are only added for the command being run, which keeps startup cheap.
+COMMANDS = [
+    ("list-domains", "List all Domains", listArguments),
+    ("list-streams", "List all Streams.", listStreamsArguments),
+    ("list-events", "List all Events.", listEventsArguments),
+    ("list-rtmp-configs", "List all RTMP Configs.", listArguments),
+    ("list-rtmp-streams", "List all RTMP Streams.", listArguments),
+    ("list-storage-group", "List all Storage Groups.", listArguments),
+    ("get-domain", "Get Domain.", getDomainArguments),
+    ("get-stream", "Get Stream.", getStreamArguments),
+    ("get-event", "Get Event.", getEventArguments),
+    ("get-rtmp-config", "Get RTMP Config.", getRTMPConfigArguments),
+    ("get-rtmp-stream", "Get RTMP Stream.", getRTMPStreamArguments),
+    ("list-msl-streams", "List all MSL Streams.", listMSLStreamsArguments),
+    ("get-msl-streams", "Get MSL Stream details.", getMSLStreamArguments),
+    ("list-CDNs", "Get list of CDN's", listArguments),
+    ("list-cpcodes", "Get list of cpcodes", listCpcodesArguments),
+    ("inventory", "Crawl domains, streams, events, MSL streams, CDNs and cpcodes into one snapshot.",
+     inventoryArguments),
+    ("batch", "Run many commands from a file or stdin over one session, results as NDJSON.", batchArguments),
+    ("serve", "Keep a warm session and response cache and answer commands over a Unix socket.", serveArguments),
+    ("sync", "Store domains, streams, RTMP configs, storage groups, MSL streams, CDNs and cpcodes in a local index.",
+     syncArguments),
+    ("query", "Find resources in the local index by id, name, cpcode, hostname or encoder zone.", queryArguments),
+    ("search", "Search every indexed field of the local index by prefix.", searchArguments),
+    ("diff", "Show the added, removed and modified resources between two inventory snapshots, or a snapshot and the account.",
+     diffArguments),
+]
+
+
+def buildParser(argv):
+    """ Builds the argument parser, only the subcommands named in argv get their arguments """
     parser = argparse.ArgumentParser(description='Process command line options.')
+    parser.add_argument('--verbose', '-v', default=False, action='count', help=' Verbose mode')
+    parser.add_argument('--debug', '-d', default=False, action='count',
+                        help=' Debug mode (prints HTTP headers)')
+    parser.add_argument('--edgerc', '-e', default='~/.edgerc', metavar='credentials_file',
+                        help=' Location of the credentials file (default is ~/.edgerc)')
+    parser.add_argument('--section', '-c', default='mediaservices', metavar='credentials_file_section',
+                        action='store', help=' Credentials file Section\'s name to use')
+    parser.add_argument('--accountSwitchKey', '-a', metavar='Account Switch Key',
+                        action='append', help=' Switch key to different account, repeat it to run the command for several accounts')
+    parser.add_argument('--accounts-file', default=None, metavar='path',
+                        help=' File with one account switch key per line (- for stdin), the command runs for every account')
+    parser.add_argument('--account-concurrency', default=4, type=int, metavar='N',
+                        help=' Number of accounts processed in parallel. Default is 4')
+    parser.add_argument('--cache', default=None, action='store_true',
+                        help=' Cache GET responses on disk (can also be set with cache = true in .edgerc)')
+    parser.add_argument('--no-cache', default=False, action='store_true',
+                        help=' Do not read or write the response cache')
+    parser.add_argument('--refresh', default=False, action='store_true',
+                        help=' Revalidate cached responses with the API instead of trusting their TTL')
+    parser.add_argument('--timings', default=False, action='store_true',
+                        help=' Print the time spent connecting, waiting, downloading, parsing and rendering on stderr')
+    parser.add_argument('--metrics-file', default=None, metavar='path',
+                        help=' Write the timings as JSON, or in the Prometheus textfile format for a .prom file')
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help=' Profile the command and print a sorted report with the network/parse/format split on stderr')
+    parser.add_argument('--profile-file', default=None, metavar='path',
+                        help=' Write the profile to a .pstats, .collapsed (flame graph) or text file, implies --profile')
+    parser.add_argument('--profile-sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'],
+                        help=' Sort order of the profile report. Default is cumulative')
+    parser.add_argument('--watch', default=None, type=float, metavar='SECONDS',
+                        help=' Repeat the command every SECONDS and only print the added, removed and modified records')
+    parser.add_argument('--watch-count', default=None, type=int, metavar='N',
+                        help=' Stop watching after N polls')
+    parser.add_argument('--exit-on-change', default=False, action='store_true',
+                        help=' Stop watching at the first change, with exit status 2')
+    parser.add_argument('--on-change', default=None, metavar='command',
+                        help=' Shell command run on every change, the changes are on its stdin as NDJSON')
+    parser.add_argument('--no-daemon', default=False, action='store_true',
+                        help=' Do not send the command to a running serve daemon')
+    parser.add_argument('--socket', default=None, metavar='path',
+                        help=' Unix socket of the serve daemon (default is derived from --edgerc and --section)')
+
+    subparsers = parser.add_subparsers(help='commands', dest="command")
+    requested = set(argv)
+    for name, help, addArguments in COMMANDS:
+        command_parser = subparsers.add_parser(name, help=help)
+        if name in requested:
+            addArguments(command_parser)
+    return parser
+
+
+def readAccounts(path):
+    """ Reads account switch keys, one per line, blank lines and # comments are skipped """
+    stream = sys.stdin if path == '-' else open(os.path.expanduser(path))
+    accounts = []
+    for line in stream:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            accounts.append(line.split()[0])
+    if stream is not sys.stdin:
+        stream.close()
+    return accounts
+
+
+def splitAccounts(arguments):
+    """ Gathers the switch keys of -a and --accounts-file in accounts, accountSwitchKey keeps a single key """
+    accounts = list(arguments.get('accountSwitchKey') or [])
+    if arguments.get('accounts_file'):
+        accounts.extend(readAccounts(arguments['accounts_file']))
+    # Keep the order of the command line, drop duplicates
+    seen = set()
+    arguments['accounts'] = [key for key in accounts if not (key in seen or seen.add(key))]
+    arguments['accountSwitchKey'] = arguments['accounts'][0] if len(arguments['accounts']) == 1 else None
+    return arguments
+
+
+class EdgeGridConfig():
 
-    def __init__(self, config_values, configuration, flags=None):
-        parser = self.parser
-        parser.add_argument('--verbose', '-v', default=False, action='count', help=' Verbose mode')
-        parser.add_argument('--debug', '-d', default=False, action='count',
-                            help=' Debug mode (prints HTTP headers)')
-        parser.add_argument('--edgerc', '-e', default='~/.edgerc', metavar='credentials_file',
-                            help=' Location of the credentials file (default is ~/.edgerc)')
-        parser.add_argument('--section', '-c', default='mediaservices', metavar='credentials_file_section',
-                            action='store', help=' Credentials file Section\'s name to use')
-        parser.add_argument('--accountSwitchKey', '-a', metavar='Account Switch Key',
-                            action='store', help=' Switch key to different account')
-
-        subparsers = parser.add_subparsers(help='commands', dest="command")
-
-        list_domains_parser = subparsers.add_parser("list-domains", help="List all Domains")
-        list_domains_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                         'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_streams_parser = subparsers.add_parser("list-streams", help="List all Streams.")
-        list_streams_parser.add_argument(
-            'domainName', help="Domain Name for which streams has to be fetched.", action='store')
-        list_streams_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                         'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_events_parser = subparsers.add_parser("list-events", help="List all Events.")
-        list_events_parser.add_argument(
-            'domainName', help="Domain Name for which streams has to be fetched.", action='store')
-        list_events_parser.add_argument(
-            'streamId', help="Stream Id for which events has to be fetched.", action='store')
-        list_events_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                        'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_rtmp_config_parser = subparsers.add_parser(
-            "list-rtmp-configs", help="List all RTMP Configs.")
-        list_rtmp_config_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                             'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_rtmp_streams_parser = subparsers.add_parser(
-            "list-rtmp-streams", help="List all RTMP Streams.")
-        list_rtmp_streams_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                              'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_storage_group_parser = subparsers.add_parser(
-            "list-storage-group", help="List all Storage Groups.")
-        list_storage_group_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                               'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_domain_parser = subparsers.add_parser("get-domain", help="Get Domain.")
-        get_domain_parser.add_argument(
-            'domain', help="Domain Name for which info has to be fetched.", action='store')
-        get_domain_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                       'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_stream_parser = subparsers.add_parser("get-stream", help="Get Stream.")
-        get_stream_parser.add_argument('domain', help="Domain Name", action='store')
-        get_stream_parser.add_argument('streamid', help="Stream Id", action='store')
-        get_stream_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                       'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_event_parser = subparsers.add_parser("get-event", help="Get Event.")
-        get_event_parser.add_argument('domain', help="Domain Name", action='store')
-        get_event_parser.add_argument('streamid', help="Stream Id", action='store')
-        get_event_parser.add_argument('eventname', help="Stream Id", action='store')
-        get_event_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                      'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_rtmp_config_parser = subparsers.add_parser("get-rtmp-config", help="Get RTMP Config.")
-        get_rtmp_config_parser.add_argument(
-            'cp-code', help="CP Code of the RTMP Config to be fetched.", action='store')
-        get_rtmp_config_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                            'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_rtmp_stream_parser = subparsers.add_parser("get-rtmp-stream", help="Get RTMP Stream.")
-        get_rtmp_stream_parser.add_argument(
-            'streamid', help="Stream id of the RTMP Stream", action='store')
-        get_rtmp_stream_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                            'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        list_msl_streams_parser = subparsers.add_parser(
-            "list-msl-streams", help="List all MSL Streams.")
-        list_msl_streams_parser.add_argument('--output-type', '-t', default='text', choices=[
-                                             'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_msl_stream_parser = subparsers.add_parser(
-            "get-msl-streams", help="Get MSL Stream details.")
-        get_msl_stream_parser.add_argument('streamid', help="Stream Id", action='store')
-        get_msl_stream_parser.add_argument('--output-type', '-t', default='text', choices=[
-            'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_cdn_list_parser = subparsers.add_parser("list-CDNs", help="Get list of CDN's")
-        get_cdn_list_parser.add_argument('--output-type', '-t', default='text', choices=[
-            'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
-
-        get_cpcode_list_parser = subparsers.add_parser("list-cpcodes", help="Get list of cpcodes")
-        get_cpcode_list_parser.add_argument('--type', default='INGEST', choices=[
-            'INGEST', 'STORAGE', 'DELIVERY'], help='Identify the cpcode type')
-        get_cpcode_list_parser.add_argument('--unused', default='true', choices=[
-            'true', 'false'], help=' lists only CP codes that have not already been used to provision an origin')
-        get_cpcode_list_parser.add_argument('--output-type', '-t', default='text', choices=[
-            'json', 'text'], metavar='json/text', help=' Output type {json, text}. Default is text')
+    def __init__(self, config_values, configuration, flags=None, argv=None):
+        if argv is None:
+            argv = sys.argv[1:]
+        parser = self.parser = buildParser(argv)
 
         if flags:
             for argument in flags.keys():
@@ -152,13 +340,17 @@ class EdgeGridConfig():
                 arguments[argument] = config_values[argument]
 
         try:
-            args = parser.parse_args()
+            args = parser.parse_args(argv)
         except:
             sys.exit()
 
-        arguments = vars(args)
+        arguments = splitAccounts(vars(args))
 
         if arguments['debug']:
+            if sys.version_info[0] >= 3:
+                import http.client as http_client
+            else:
+                import httplib as http_client
             http_client.HTTPConnection.debuglevel = 1
             logging.basicConfig()
             logging.getLogger().setLevel(logging.DEBUG)
@@ -0,0 +1,155 @@
+# Python edgegrid module - serve daemon for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ 'serve' keeps one EdgeGridHttpCaller, its connection pool and an in-memory
+ response cache alive and answers commands over a Unix socket. Every other
+ invocation of the CLI first tries that socket and only falls back to calling
+ the API itself when no daemon is listening.
+
+ Protocol: one JSON line {"argv": [...]} per connection, answered with one
+ JSON line {"status": "ok", "result": ...} or {"status": "error", "error": ...}.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import signal
+import socket
+import hashlib
+import logging
+from jsonbackend import loads, dumps
+
+logger = logging.getLogger(__name__)
+
+# Commands that are never sent to the daemon, the inventory index and diff ones work on local files
+LOCAL_COMMANDS = ('batch', 'serve', 'sync', 'query', 'search', 'diff')
+CONNECT_TIMEOUT = 0.5
+
+
+def socketPath(config):
+    """ One daemon per credentials file and section, unless --socket says otherwise """
+    if config.socket:
+        return os.path.expanduser(config.socket)
+    identity = '%s:%s' % (os.path.abspath(config.edgerc), config.section)
+    digest = hashlib.sha256(identity.encode('utf-8')).hexdigest()[:12]
+    return os.path.expanduser('~/.akamai-cli/mediaservices-%s.sock' % digest)
+
+
+def readLine(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks)
+
+
+def daemonListening(path):
+    """ Tells whether something accepts connections on the socket """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(CONNECT_TIMEOUT)
+        connection.connect(path)
+        return True
+    except (IOError, OSError):
+        return False
+    finally:
+        connection.close()
+
+
+def proxyCommand(path, argv, verbose=False):
+    """ Sends a command to the daemon, returns its answer or None when no daemon is listening """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(CONNECT_TIMEOUT)
+        connection.connect(path)
+        connection.settimeout(None)
+        connection.sendall((json.dumps({'argv': argv}) + '\n').encode('utf-8'))
+        answer = readLine(connection)
+    except (IOError, OSError) as error:
+        if verbose:
+            print("LOG: serve daemon at %s not available (%s), calling the API directly" % (path, error),
+                  file=sys.stderr)
+        return None
+    finally:
+        connection.close()
+    if not answer:
+        return None
+    if verbose:
+        print("LOG: answered by the serve daemon at %s" % path, file=sys.stderr)
+    return loads(answer)
+
+
+def serveForever(config, fetch):
+    """ Answers commands on the Unix socket until interrupted """
+    import socketserver
+    from batch import runCommand
+    from cache import MemoryResponseCache
+    from endpointdef import getHttpCaller
+
+    path = socketPath(config)
+    if os.path.exists(path) and daemonListening(path):
+        exit("ERROR: A serve daemon is already listening on %s" % path)
+    if os.path.exists(path):
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    caller = getHttpCaller()
+    caller.cache = MemoryResponseCache(config.max_entries, getattr(config, 'cache_ttl', None))
+
+    class CommandHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                argv = json.loads(line.decode('utf-8'))['argv']
+            except (ValueError, KeyError, TypeError) as error:
+                record = {'status': 'error', 'error': 'invalid request: %s' % error}
+            else:
+                record = runCommand(0, argv, config, fetch)
+                if config.verbose:
+                    print("LOG: serve %s %s %.3fs" % (record['command'], record['status'], record['seconds']))
+            self.wfile.write((dumps(record) + '\n').encode('utf-8'))
+
+    class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    previous_umask = os.umask(0o077)
+    try:
+        server = CommandServer(path, CommandHandler)
+    finally:
+        os.umask(previous_umask)
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+    print("Serving on %s, press Ctrl-C to stop" % path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
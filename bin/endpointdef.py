@@ -17,66 +17,190 @@
 
 from __future__ import print_function
 import sys
-import os
 import logging
-import random
-import re
-import requests
-import json
-import urllib
-import texttable as tt
-from future import standard_library
-from future.builtins import next
-from future.builtins import object
-from http_calls import EdgeGridHttpCaller
-from akamai.edgegrid import EdgeGridAuth, EdgeRc
+import threading
 from config import EdgeGridConfig
-from subprocess import call
-standard_library.install_aliases()
-if sys.version_info[0] >= 3:
-    # python3
-    from urllib import parse
-else:
-    # python2.7
-    import urlparse as parse
+from cache import ResponseCache, isEnabled
+from http_calls import EdgeGridHttpCaller, TokenBucket, asList, recordCopies, timePools
+from timings import Timings
 
 logger = logging.getLogger(__name__)
 
-session = requests.Session()
 debug = False
 verbose = False
 cache = False
 format = "json"
 section_name = "default"
-
-# If all parameters are set already, use them.  Otherwise
-# use the config
-config = EdgeGridConfig({"verbose": False}, section_name)
-
-if hasattr(config, "debug") and config.debug:
-    debug = True
-
-if hasattr(config, "verbose") and config.verbose:
-    verbose = True
-
-if hasattr(config, "cache") and config.cache:
-    cache = True
-
-
-# Set the config options
-session.auth = EdgeGridAuth(
-    client_token=config.client_token,
-    client_secret=config.client_secret,
-    access_token=config.access_token
-)
-
-if hasattr(config, 'headers'):
-    session.headers.update(config.headers)
-
-session.headers.update({'User-Agent': "AkamaiCLI"})
-
-baseurl_prd = '%s://%s/' % ('https', config.host)
-prdHttpCaller = EdgeGridHttpCaller(session, debug, verbose, baseurl_prd)
+poolSize = 10
+
+# The configuration and the HTTP session are built on first use, importing
+# this module must stay cheap for --help, argument errors and the like.
+config = None
+prdHttpCaller = None
+# Only built for --transport async
+asyncHttpCaller = None
+callerLock = threading.Lock()
+# Phase timings, only recorded with --timings or --metrics-file
+recorder = None
+
+
+def getConfig(argv=None):
+    """ Parses the command line and the .edgerc section once """
+    global config, debug, verbose, cache, recorder
+    if config is not None:
+        return config
+    # If all parameters are set already, use them.  Otherwise
+    # use the config
+    config = EdgeGridConfig({"verbose": False}, section_name, argv=argv)
+
+    if hasattr(config, "debug") and config.debug:
+        debug = True
+
+    if hasattr(config, "verbose") and config.verbose:
+        verbose = True
+
+    if hasattr(config, "cache") and isEnabled(config.cache) and not config.no_cache:
+        cache = True
+
+    if getattr(config, 'timings', False) or getattr(config, 'metrics_file', None):
+        recorder = Timings()
+    return config
+
+
+def getTimings():
+    """ Returns the phase timings recorder, None unless --timings or --metrics-file is set """
+    return recorder
+
+
+def reportTimings(command):
+    """ Prints the --timings summary and writes the --metrics-file of a finished command """
+    if recorder is None:
+        return
+    if prdHttpCaller is not None:
+        recorder.count('connections', prdHttpCaller.openedConnections())
+    for caller in (prdHttpCaller, asyncHttpCaller):
+        if caller is not None:
+            recorder.count('retries', caller.stats['retries'])
+            recorder.count('throttleWait', round(caller.stats['throttleWait'], 3))
+            recorder.count('backoffWait', round(caller.stats['backoffWait'], 3))
+            recorder.count('coalesced', caller.stats['coalesced'])
+    if config.timings:
+        recorder.report()
+    if config.metrics_file:
+        recorder.writeMetrics(config.metrics_file, command)
+
+
+def getHttpCaller():
+    """ Returns the EdgeGrid HTTP caller, the requests session is created on the first call """
+    global prdHttpCaller
+    if prdHttpCaller is not None:
+        return prdHttpCaller
+    with callerLock:
+        if prdHttpCaller is None:
+            prdHttpCaller = buildHttpCaller(getConfig())
+    return prdHttpCaller
+
+
+def getAsyncHttpCaller():
+    """ Returns the asyncio EdgeGrid HTTP caller, created on the first call """
+    global asyncHttpCaller
+    if asyncHttpCaller is not None:
+        return asyncHttpCaller
+    with callerLock:
+        if asyncHttpCaller is None:
+            asyncHttpCaller = buildAsyncHttpCaller(getConfig())
+    return asyncHttpCaller
+
+
+def printHttpStats():
+    """ Prints the request, retry and throttling counters of the callers, if one was created """
+    for caller in (prdHttpCaller, asyncHttpCaller):
+        if caller is not None:
+            caller.printStats()
+
+
+def buildHttpCaller(config):
+    import requests
+
+    session = requests.Session()
+    # Set the config options
+    session.auth = edgeGridAuth(config)
+    session.headers.update(sessionHeaders(config))
+    if recorder is not None:
+        mountAdapters(session, poolSize)
+    return EdgeGridHttpCaller(session, debug, verbose, *callerOptions(config), timings=recorder)
+
+
+def buildAsyncHttpCaller(config):
+    from async_calls import AsyncEdgeGridHttpCaller
+    return AsyncEdgeGridHttpCaller(edgeGridAuth(config), sessionHeaders(config), debug, verbose, *callerOptions(config),
+                                   timings=recorder)
+
+
+def edgeGridAuth(config):
+    """ Signer of the .edgerc credentials, a requests auth applied to every prepared request """
+    from akamai.edgegrid import EdgeGridAuth
+    return EdgeGridAuth(
+        client_token=config.client_token,
+        client_secret=config.client_secret,
+        access_token=config.access_token
+    )
+
+
+def sessionHeaders(config):
+    headers = {}
+    if hasattr(config, 'headers'):
+        headers.update(config.headers)
+    headers.update({'User-Agent': "AkamaiCLI"})
+    return headers
+
+
+def callerOptions(config):
+    """ Base URL, response cache, rate limiter and retries of the .edgerc section, shared by both callers """
+    if '://' in config.host:
+        # A scheme in the host points the CLI at another API, such as benchmarks/mock_api.py
+        baseurl_prd = config.host.rstrip('/') + '/'
+    else:
+        baseurl_prd = '%s://%s/' % ('https', config.host)
+    responseCache = None
+    if cache:
+        responseCache = ResponseCache(getattr(config, 'cache_dir', None),
+                                      getattr(config, 'cache_max_bytes', None),
+                                      getattr(config, 'cache_ttl', None),
+                                      config.refresh)
+    # Client side rate limit shared by every worker, set max_requests_per_second in .edgerc to enable
+    limiter = None
+    if getattr(config, 'max_requests_per_second', None):
+        limiter = TokenBucket(float(config.max_requests_per_second), getattr(config, 'burst', None) and float(config.burst))
+    maxRetries = int(getattr(config, 'max_retries', None) or 3)
+    return baseurl_prd, responseCache, limiter, maxRetries
+
+
+def setConcurrency(concurrency):
+    """ Sizes the connection pool so that parallel workers can share the session """
+    global poolSize
+    if concurrency <= poolSize:
+        return
+    poolSize = concurrency
+    mountAdapters(getHttpCaller().session, poolSize)
+
+
+def mountAdapters(session, size):
+    """ Connection pools of the session, timing the new connections with --timings or --metrics-file """
+    from requests.adapters import HTTPAdapter
+    for prefix in ('https://', 'http://'):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        if recorder is not None:
+            timePools(adapter.poolmanager)
+        session.mount(prefix, adapter)
+
+
+def fanOut(function, items, concurrency):
+    """ Calls function for every item on a bounded worker pool, results keep the order of items """
+    from concurrent.futures import ThreadPoolExecutor
+    setConcurrency(concurrency)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(function, items))
 
 
 def listDomains(accountSwitchKey=None):
@@ -85,21 +209,34 @@ def listDomains(accountSwitchKey=None):
     listDomainsEndpoint = '/config-media-live/v1/live'
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        domainList = prdHttpCaller.getResult(listDomainsEndpoint, params)
+        domainList = getHttpCaller().getResult(listDomainsEndpoint, params)
     else:
-        domainList = prdHttpCaller.getResult(listDomainsEndpoint)
+        domainList = getHttpCaller().getResult(listDomainsEndpoint)
     return domainList
 
 
+def iterDomains(accountSwitchKey=None):
+    """ Iterate over the Domains of the account as the XML list is parsed """
+    params = {'accountSwitchKey': accountSwitchKey} if accountSwitchKey else None
+    return getHttpCaller().iterXmlRecords('/config-media-live/v1/live', params, 'domains', 'domain')
+
+
+def iterStreams(domainName, accountSwitchKey=None):
+    """ Iterate over the Streams of a Domain as the XML list is parsed """
+    listStreamsEndpoint = '/config-media-live/v1/live/{domain}/stream'.format(domain=domainName)
+    params = {'accountSwitchKey': accountSwitchKey} if accountSwitchKey else None
+    return getHttpCaller().iterXmlRecords(listStreamsEndpoint, params, 'streams', 'stream')
+
+
 def listStreams(domainName, accountSwitchKey=None):
     """ List the Streams associated with the account """
 
     listStreamsEndpoint = '/config-media-live/v1/live/{domain}/stream'.format(domain=domainName)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        streamList = prdHttpCaller.getResult(listStreamsEndpoint, params)
+        streamList = getHttpCaller().getResult(listStreamsEndpoint, params)
     else:
-        streamList = prdHttpCaller.getResult(listStreamsEndpoint)
+        streamList = getHttpCaller().getResult(listStreamsEndpoint)
     return streamList
 
 
@@ -109,10 +246,9 @@ def listEvents(domainName, streamId, accountSwitchKey=None):
         domain=domainName, streamId=streamId)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        eventList = prdHttpCaller.getResult(listEventsEndpoint, params)
+        eventList = getHttpCaller().getResult(listEventsEndpoint, params)
     else:
-        eventList = prdHttpCaller.getResult(listEventsEndpoint)
-    print(eventList)
+        eventList = getHttpCaller().getResult(listEventsEndpoint)
     return eventList
 
 
@@ -121,9 +257,9 @@ def listRTMPConfigs(accountSwitchKey=None):
     listRTMPConfigsEndpoint = '/config-media-live/v1/live/rtmp/configuration'
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        rtmpConfigList = prdHttpCaller.getResult(listRTMPConfigsEndpoint, params)
+        rtmpConfigList = getHttpCaller().getResult(listRTMPConfigsEndpoint, params)
     else:
-        rtmpConfigList = prdHttpCaller.getResult(listRTMPConfigsEndpoint)
+        rtmpConfigList = getHttpCaller().getResult(listRTMPConfigsEndpoint)
     return(rtmpConfigList)
 
 
@@ -132,9 +268,9 @@ def listRTMPStreams(accountSwitchKey=None):
     listRTMPStreamsEndpoint = '/config-media-live/v1/live/rtmp/stream'
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        rtmpStreamList = prdHttpCaller.getResult(listRTMPStreamsEndpoint, params)
+        rtmpStreamList = getHttpCaller().getResult(listRTMPStreamsEndpoint, params)
     else:
-        rtmpStreamList = prdHttpCaller.getResult(listRTMPStreamsEndpoint)
+        rtmpStreamList = getHttpCaller().getResult(listRTMPStreamsEndpoint)
     return(rtmpStreamList)
 
 
@@ -143,9 +279,9 @@ def listStorageGroup(accountSwitchKey=None):
     listStorageGroupEndpoint = '/config-media-live/v1/live/rtmp/storage-group'
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        storageGroupList = prdHttpCaller.getResult(listStorageGroupEndpoint, params)
+        storageGroupList = getHttpCaller().getResult(listStorageGroupEndpoint, params)
     else:
-        storageGroupList = prdHttpCaller.getResult(listStorageGroupEndpoint)
+        storageGroupList = getHttpCaller().getResult(listStorageGroupEndpoint)
     return(storageGroupList)
 
 
@@ -154,9 +290,9 @@ def GetDomain(domainName, accountSwitchKey=None):
     getDomainEndpoint = '/config-media-live/v1/live/{domain}'.format(domain=domainName)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        domainInfo = prdHttpCaller.getResult(getDomainEndpoint, params)
+        domainInfo = getHttpCaller().getResult(getDomainEndpoint, params)
     else:
-        domainInfo = prdHttpCaller.getResult(getDomainEndpoint)
+        domainInfo = getHttpCaller().getResult(getDomainEndpoint)
     return(domainInfo)
 
 
@@ -166,9 +302,9 @@ def GetStream(domainName, streamId, accountSwitchKey=None):
         domain=domainName, streamId=streamId)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        streamInfo = prdHttpCaller.getResult(getstreamEndpoint, params)
+        streamInfo = getHttpCaller().getResult(getstreamEndpoint, params)
     else:
-        streamInfo = prdHttpCaller.getResult(getstreamEndpoint)
+        streamInfo = getHttpCaller().getResult(getstreamEndpoint)
     return(streamInfo)
 
 
@@ -178,9 +314,9 @@ def GetRTMPConfig(cpCode, accountSwitchKey=None):
         cpcode=cpCode)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        rtmpConfigInfo = prdHttpCaller.getResult(getRTMPConfigEndpoint, params)
+        rtmpConfigInfo = getHttpCaller().getResult(getRTMPConfigEndpoint, params)
     else:
-        rtmpConfigInfo = prdHttpCaller.getResult(getRTMPConfigEndpoint)
+        rtmpConfigInfo = getHttpCaller().getResult(getRTMPConfigEndpoint)
     return(rtmpConfigInfo)
 
 
@@ -190,24 +326,26 @@ def GetRTMPStream(streamId, accountSwitchKey=None):
         streamId=streamId)
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey}
-        rtmpStreamInfo = prdHttpCaller.getResult(getRTMPStreamEndpoint, params)
+        rtmpStreamInfo = getHttpCaller().getResult(getRTMPStreamEndpoint, params)
     else:
-        rtmpStreamInfo = prdHttpCaller.getResult(getRTMPStreamEndpoint)
+        rtmpStreamInfo = getHttpCaller().getResult(getRTMPStreamEndpoint)
     return(rtmpStreamInfo)
 
 
-def listmslStreams(accountSwitchKey=None):
+def listmslStreams(accountSwitchKey=None, sortKey='createdDate', sortOrder='DESC'):
     """ Get list of MSL streams"""
-    listStreamsEndpoint = '/config-media-live/v2/msl-origin/streams?sortKey=createdDate&sortOrder=DESC'
+    return {'streams': list(iterMslStreams(accountSwitchKey, sortKey=sortKey, sortOrder=sortOrder))}
+
+
+def iterMslStreams(accountSwitchKey=None, pageSize=100, limit=None, sortKey='createdDate', sortOrder='DESC'):
+    """ Iterate over the MSL streams page by page """
+    listStreamsEndpoint = '/config-media-live/v2/msl-origin/streams'
+    params = {'sortKey': sortKey,
+              'sortOrder': sortOrder
+              }
     if accountSwitchKey:
-        params = {'accountSwitchKey': accountSwitchKey,
-                  'sortKey': 'createdDate',
-                  'sortOrder': 'DESC'
-                  }
-        streamList = prdHttpCaller.getResult(listStreamsEndpoint, params)
-    else:
-        streamList = prdHttpCaller.getResult(listStreamsEndpoint)
-    return streamList
+        params['accountSwitchKey'] = accountSwitchKey
+    return getHttpCaller().iterPages(listStreamsEndpoint, params, 'streams', pageSize, limit)
 
 
 def getmslStreams(accountSwitchKey, streamid):
@@ -217,21 +355,48 @@ def getmslStreams(accountSwitchKey, streamid):
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey
                   }
-        streaminfo = prdHttpCaller.getResult(getStreamsEndpoint, params)
+        streaminfo = getHttpCaller().getResult(getStreamsEndpoint, params)
     else:
-        streaminfo = prdHttpCaller.getResult(getStreamsEndpoint)
+        streaminfo = getHttpCaller().getResult(getStreamsEndpoint)
     return streaminfo
 
 
+def GetEvent(domainName, streamId, eventName, accountSwitchKey=None):
+    """ Get the Event Info  """
+    getEventEndpoint = '/config-media-live/v1/live/{domain}/stream/{streamId}/event/{eventName}'.format(
+        domain=domainName, streamId=streamId, eventName=eventName)
+    if accountSwitchKey:
+        params = {'accountSwitchKey': accountSwitchKey}
+        eventInfo = getHttpCaller().getResult(getEventEndpoint, params)
+    else:
+        eventInfo = getHttpCaller().getResult(getEventEndpoint)
+    return(eventInfo)
+
+
+def getAllMslStreams(accountSwitchKey=None, streamIds=None, concurrency=8):
+    """ Get the details of many MSL streams in parallel, all of the account when no ids are given """
+    if streamIds is None:
+        streamIds = [stream['id'] for stream in iterMslStreams(accountSwitchKey)]
+
+    def fetch(streamId):
+        try:
+            return getmslStreams(accountSwitchKey, streamId)
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to get the MSL stream %s: %s" % (streamId, error), file=sys.stderr)
+            return None
+
+    return {'streams': [streamInfo for streamInfo in fanOut(fetch, streamIds, concurrency) if streamInfo]}
+
+
 def listcdns(accountSwitchKey=None):
     """ Get list of CDN's """
     listcdnsEndpoint = '/config-media-live/v2/msl-origin/cdns'
     if accountSwitchKey:
         params = {'accountSwitchKey': accountSwitchKey
                   }
-        cdnList = prdHttpCaller.getResult(listcdnsEndpoint, params)
+        cdnList = getHttpCaller().getResult(listcdnsEndpoint, params)
     else:
-        cdnList = prdHttpCaller.getResult(listcdnsEndpoint)
+        cdnList = getHttpCaller().getResult(listcdnsEndpoint)
     return cdnList
 
 
@@ -244,12 +409,56 @@ def listcpcodes(accountSwitchKey=None, type="INGEST", unused="true"):
                   'unused': unused
 
                   }
-        cpcodeList = prdHttpCaller.getResult(listcpcodeEndpoint, params)
+        cpcodeList = getHttpCaller().getResult(listcpcodeEndpoint, params)
     else:
         params = {
             'type': type,
             'unused': unused
 
         }
-        cpcodeList = prdHttpCaller.getResult(listcpcodeEndpoint, params)
+        cpcodeList = getHttpCaller().getResult(listcpcodeEndpoint, params)
     return cpcodeList
+
+
+def domainNameOf(domain):
+    """ Returns the name used to address a domain from a listDomains entry """
+    if domain.get('domain-name'):
+        return domain['domain-name']
+    return domain['configuration-details']['hostname']
+
+
+def listAllStreams(accountSwitchKey=None, concurrency=8):
+    """ List the Streams of every Domain in the account, fetched in parallel """
+    domainNames = [domainNameOf(domain) for domain in iterDomains(accountSwitchKey)]
+
+    def fetch(domainName):
+        try:
+            return list(iterStreams(domainName, accountSwitchKey))
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to list the streams of %s: %s" % (domainName, error), file=sys.stderr)
+            return None
+
+    streams = []
+    for domainName, domainStreams in zip(domainNames, fanOut(fetch, domainNames, concurrency)):
+        streams.extend(recordCopies(domainStreams or [], {'domain-name': domainName}))
+    return {'streams': {'stream': streams}}
+
+
+def listAllEvents(domainName, accountSwitchKey=None, concurrency=8):
+    """ List the Events of every Stream in a Domain, fetched in parallel """
+    streamList = listStreams(domainName, accountSwitchKey)
+    streamIds = [stream['stream-id'] for stream in asList((streamList.get('streams') or {}).get('stream'))]
+
+    def fetch(streamId):
+        try:
+            return listEvents(domainName, streamId, accountSwitchKey)
+        except (Exception, SystemExit) as error:
+            print("WARNING: Unable to list the events of stream %s: %s" % (streamId, error), file=sys.stderr)
+            return None
+
+    events = []
+    for streamId, eventList in zip(streamIds, fanOut(fetch, streamIds, concurrency)):
+        if not eventList:
+            continue
+        events.extend(recordCopies(asList((eventList.get('events') or {}).get('event')), {'stream-id': streamId}))
+    return {'events': {'event': events}}
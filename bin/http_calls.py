@@ -15,13 +15,11 @@
  limitations under the License.
 """
 import sys
-import os
-import requests
+import time
+import random
 import logging
-import json
-from akamai.edgegrid import EdgeGridAuth, EdgeRc
-from config import EdgeGridConfig
-import xmltodict
+import threading
+from jsonbackend import loads, dumps
 
 if sys.version_info[0] >= 3:
     # python3
@@ -33,33 +31,480 @@ else:
 logger = logging.getLogger(__name__)
 
 
+def asList(value):
+    """ xmltodict returns a dict for a single element and None for an empty one """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def recordCopies(records, tags=None):
+    """ Copies of the records with the tags added, parsed responses may be shared with the cache and other callers """
+    return [dict(record, **(tags or {})) for record in records]
+
+
+def nextLink(result):
+    """ Returns the href of the rel=next link of a paginated response, if any """
+    if not isinstance(result, dict):
+        return None
+    for link in result.get('links') or []:
+        if isinstance(link, dict) and link.get('rel') == 'next' and link.get('href'):
+            return link['href']
+    return None
+
+
+def nextPage(result, records, endpoint, parameters, page, pageSize):
+    """ (endpoint, parameters, page, pageSize) of the page after result, None after the last one """
+    next_link = nextLink(result)
+    if next_link:
+        # Follow the link given by the API, it carries its own paging parameters
+        url = parse.urlsplit(next_link)
+        query = dict(parse.parse_qsl(url.query))
+        parameters = dict(parameters, **query)
+        return (url.path, parameters, int(query.get('page', page + 1)), int(query.get('pageSize', pageSize)))
+    if len(records) < pageSize:
+        return None
+    total = result.get('totalItems') if isinstance(result, dict) else None
+    if total is not None and page * pageSize >= int(total):
+        return None
+    return endpoint, parameters, page + 1, pageSize
+
+
+class XmlRecordParser():
+    """ Incremental expat parser turning the children of the root element into xmltodict style records
+
+    Attributes become @name, repeated tags become lists and empty elements None, as with
+    xmltodict.parse. feed() returns the records completed by a chunk of the document.
+    """
+
+    def __init__(self, recordTag):
+        from xml.parsers import expat
+        self.recordTag = recordTag
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.text
+        # One [tag, record, text parts] per open element below the root
+        self.stack = []
+        self.depth = 0
+        self.records = []
+
+    def feed(self, chunk, final=False):
+        self.parser.Parse(chunk, final)
+        records, self.records = self.records, []
+        return records
+
+    def start(self, tag, attributes):
+        self.depth += 1
+        if self.depth > 1:
+            self.stack.append([tag, dict(('@' + name, value) for name, value in attributes.items()) or None, []])
+
+    def end(self, tag):
+        self.depth -= 1
+        if not self.depth:
+            return
+        tag, record, parts = self.stack.pop()
+        text = ''.join(parts).strip()
+        if record is None:
+            value = text or None
+        else:
+            if text:
+                record['#text'] = text
+            value = record
+        if not self.stack:
+            if tag == self.recordTag:
+                self.records.append(value)
+            return
+        parent = self.stack[-1]
+        if parent[1] is None:
+            parent[1] = {}
+        siblings = parent[1]
+        if tag in siblings:
+            if not isinstance(siblings[tag], list):
+                siblings[tag] = [siblings[tag]]
+            siblings[tag].append(value)
+        else:
+            siblings[tag] = value
+
+    def text(self, data):
+        if self.stack:
+            self.stack[-1][2].append(data)
+
+
+def jsonBody(endpoint_result):
+    """ Decodes a JSON body, error pages in HTML or plain text become a problem details dict """
+    try:
+        return loads(endpoint_result.content)
+    except ValueError:
+        return {'detail': endpoint_result.text[:500]}
+
+
+def retryAfter(endpoint_result):
+    """ Returns the delay in seconds asked for by a Retry-After header, if any """
+    value = endpoint_result.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket():
+    """ Client side rate limiter shared by every worker of the process """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """ Takes one token and returns how long to wait before it is available """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self):
+        """ Takes one token, sleeping until it is available, and returns the time waited """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, seconds):
+        """ Makes every worker hold off for seconds, used when the API throttles us """
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class SingleFlight():
+    """ Lets concurrent callers of the same key share one call and its result
+
+    The first caller runs the function, the ones arriving before it returns wait
+    for it and get the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: [done event, result, exception]
+        self.calls = {}
+
+    def do(self, key, function):
+        """ Returns (result, True when it was shared from a call already in flight) """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+        try:
+            call[1] = function()
+        except BaseException as error:
+            # SystemExit of httpErrors included, every waiter fails the same way
+            call[2] = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+        return call[1], False
+
+
+def flightKey(endpoint, parameters):
+    """ Identity of a GET, the account switch key is one of its parameters """
+    return endpoint, tuple(sorted((str(name), str(value)) for name, value in (parameters or {}).items()))
+
+
+# Seconds spent opening connections by the current thread, read around every request
+connectTimes = threading.local()
+
+
+def timedConnectionClass(connectionClass):
+    """ urllib3 connection class adding the time of every connect() to connectTimes """
+
+    class TimedConnection(connectionClass):
+        def connect(self):
+            start = time.time()
+            try:
+                return super(TimedConnection, self).connect()
+            finally:
+                connectTimes.seconds = getattr(connectTimes, 'seconds', 0.0) + time.time() - start
+    return TimedConnection
+
+
+def timePools(poolmanager):
+    """ Makes the pools of a urllib3 pool manager time the connections they open """
+    poolmanager.pool_classes_by_scheme = dict(
+        (scheme, type(poolClass.__name__, (poolClass,), {'ConnectionCls': timedConnectionClass(poolClass.ConnectionCls)}))
+        for scheme, poolClass in poolmanager.pool_classes_by_scheme.items())
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
 class EdgeGridHttpCaller():
-    def __init__(self, session, debug, verbose, baseurl):
+    def __init__(self, session, debug, verbose, baseurl, cache=None, limiter=None, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0, timings=None):
         self.debug = debug
         self.verbose = verbose
         self.session = session
         self.baseurl = baseurl
+        self.cache = cache
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timings = timings
+        self.stats = {'requests': 0, 'retries': 0, 'throttleWait': 0.0, 'backoffWait': 0.0, 'cacheHits': 0, 'coalesced': 0}
+        # The counters are updated by every thread of a fan-out
+        self.statsLock = threading.Lock()
+        self.inflight = SingleFlight()
         return None
 
+    def backoff(self, attempt):
+        """ Exponential backoff with jitter: half of the delay is fixed, the other half random """
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def countStat(self, name, amount=1):
+        with self.statsLock:
+            self.stats[name] += amount
+
+    def request(self, method, endpoint, **kwargs):
+        """ Sends a request through the rate limiter, retrying throttled and failed calls with backoff """
+        import requests
+        url = parse.urljoin(self.baseurl, endpoint)
+        attempt = 0
+        while True:
+            if self.limiter:
+                waited = self.limiter.acquire()
+                if waited:
+                    self.countStat('throttleWait', waited)
+                    if self.verbose: print("LOG: THROTTLE %s %s waited %.2fs for the rate limiter" % (method, endpoint, waited))
+            self.countStat('requests')
+            try:
+                start = time.time()
+                connectTimes.seconds = 0.0
+                endpoint_result = self.session.request(method, url, **kwargs)
+                # Part of elapsed, zero when the pool had an idle connection
+                endpoint_result.connectSeconds = connectTimes.seconds
+                # A streamed body is read, and timed, by the caller
+                if self.timings and not kwargs.get('stream'):
+                    # elapsed stops at the response headers, the rest of the call reads the body
+                    wait = endpoint_result.elapsed.total_seconds()
+                    self.timings.addRequest(endpoint_result.status_code, wait, max(0.0, time.time() - start - wait),
+                                            len(endpoint_result.content), endpoint_result.connectSeconds)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if attempt >= self.max_retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                reason = type(error).__name__
+                delay = self.backoff(attempt)
+            else:
+                status = endpoint_result.status_code
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return endpoint_result
+                # A throttled call was not processed, anything else is only safe to replay when idempotent
+                if status != 429 and method not in IDEMPOTENT_METHODS:
+                    return endpoint_result
+                reason = status
+                delay = retryAfter(endpoint_result)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if status == 429 and self.limiter:
+                    self.limiter.penalize(delay)
+                # Hands the connection back to the pool, a streamed body would otherwise keep it
+                endpoint_result.close()
+            attempt += 1
+            self.countStat('retries')
+            self.countStat('backoffWait', delay)
+            if self.verbose:
+                print("LOG: RETRY %s %s after %s, waiting %.2fs (attempt %d of %d)" % (
+                    method, endpoint, reason, delay, attempt, self.max_retries))
+            time.sleep(delay)
+
+    def openedConnections(self):
+        """ Number of connections opened by the pools of the session so far """
+        total = 0
+        for adapter in self.session.adapters.values():
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def printStats(self):
+        print("LOG: %d requests, %d retries, %.2fs waiting for the rate limiter, %.2fs backing off" % (
+            self.stats['requests'], self.stats['retries'], self.stats['throttleWait'], self.stats['backoffWait']),
+            file=sys.stderr)
+        print("LOG: %d GETs served from cache, %d GETs coalesced with an identical one in flight" % (
+            self.stats['cacheHits'], self.stats['coalesced']), file=sys.stderr)
+
+    def countHit(self, endpoint, message):
+        if self.verbose: print("LOG: GET %s %s" % (endpoint, message))
+        self.countStat('cacheHits')
+        if self.timings: self.timings.count('cacheHits')
+
     def urlJoin(self, url, path):
         return parse.urljoin(url, path)
 
     def getResult(self, endpoint, parameters=None):
+        """ Executes a GET API call and returns the JSON output
+
+        Concurrent calls for the same endpoint and parameters share one request and
+        one parsed result, which callers must not modify.
+        """
+        result, shared = self.inflight.do(flightKey(endpoint, parameters),
+                                          lambda: self.fetchResult(endpoint, parameters))
+        if shared:
+            self.countStat('coalesced')
+            if self.verbose: print("LOG: GET %s shared the response of an identical request in flight" % endpoint)
+        return result
+
+    def fetchResult(self, endpoint, parameters=None):
         """ Executes a GET API call and returns the JSON output """
         path = endpoint
-        endpoint_result = self.session.get(parse.urljoin(self.baseurl,path), params=parameters)
-        json_result = ''
-        if endpoint_result.headers['Content-Type'] == 'application/xml':
-            data_dict = xmltodict.parse(endpoint_result.content)
-            #json_data = json.dumps(data_dict)
-            return data_dict
+        headers = None
+        stored = None
+        if self.cache:
+            cache_key = self.cache.key(self.baseurl, endpoint, parameters)
+            cached = self.cache.get(cache_key, endpoint)
+            if cached is not None:
+                self.countHit(endpoint, "served from cache")
+                return cached['result']
+            stored = self.cache.load(cache_key)
+            headers = self.cache.conditionalHeaders(stored)
+        endpoint_result = self.request('GET', path, params=parameters, headers=headers)
+        status = endpoint_result.status_code
+        if status == 304 and stored is not None:
+            # Not modified, the stored parsed result is still valid
+            self.countHit(endpoint, "304 revalidated cached response")
+            self.cache.put(cache_key, endpoint, stored['result'], stored.get('etag'), stored.get('lastModified'))
+            return stored['result']
+        if endpoint_result.headers.get('Content-Type', '').startswith('application/xml'):
+            import xmltodict
+            start = time.time()
+            result = xmltodict.parse(endpoint_result.content)
+            if self.timings: self.timings.add('parse', time.time() - start)
+            if self.verbose: print( "LOG: GET %s %s %s" % (endpoint,status,endpoint_result.headers.get("content-type")))
         else:
-            if self.verbose: print (">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
-            status = endpoint_result.status_code
-            if self.verbose: print( "LOG: GET %s %s %s" % (endpoint,status,endpoint_result.headers["content-type"]))
-            self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
-            return endpoint_result.json()
+            # Decoded once, the same document is printed, checked for errors and returned
+            start = time.time()
+            result = jsonBody(endpoint_result)
+            if self.timings: self.timings.add('parse', time.time() - start)
+            if self.verbose: print (">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+            if self.verbose: print( "LOG: GET %s %s %s" % (endpoint,status,endpoint_result.headers.get("content-type")))
+            self.httpErrors(endpoint_result.status_code, path, result)
+        if self.cache and status == 200:
+            self.cache.put(cache_key, endpoint, result,
+                           endpoint_result.headers.get('ETag'), endpoint_result.headers.get('Last-Modified'))
+        return result
 
+    def iterXmlRecords(self, endpoint, parameters=None, rootTag=None, recordTag=None):
+        """ Executes a GET API call and yields the recordTag elements of an XML list as they are parsed
+
+        The body is parsed incrementally while it downloads, only one record is kept in
+        memory at a time. Records have the xmltodict layout, a cached response is stored
+        as {rootTag: {recordTag: [records]}} like getResult would.
+        """
+        headers = None
+        stored = None
+        if self.cache:
+            cache_key = self.cache.key(self.baseurl, endpoint, parameters)
+            cached = self.cache.get(cache_key, endpoint)
+            if cached is not None:
+                self.countHit(endpoint, "served from cache")
+                for record in asList(((cached['result'] or {}).get(rootTag) or {}).get(recordTag)):
+                    yield record
+                return
+            stored = self.cache.load(cache_key)
+            headers = self.cache.conditionalHeaders(stored)
+        endpoint_result = self.request('GET', endpoint, params=parameters, headers=headers, stream=True)
+        status = endpoint_result.status_code
+        if status == 304 and stored is not None:
+            self.countHit(endpoint, "304 revalidated cached response")
+            endpoint_result.close()
+            self.cache.put(cache_key, endpoint, stored['result'], stored.get('etag'), stored.get('lastModified'))
+            for record in asList(((stored['result'] or {}).get(rootTag) or {}).get(recordTag)):
+                yield record
+            return
+        if not endpoint_result.headers.get('Content-Type', '').startswith('application/xml'):
+            # Error documents are small JSON, handle them the usual way
+            if self.verbose: print("LOG: GET %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
+            self.httpErrors(status, endpoint, jsonBody(endpoint_result))
+            return
+        if self.verbose: print("LOG: GET %s %s %s (streamed)" % (endpoint, status, endpoint_result.headers.get("content-type")))
+
+        parser = XmlRecordParser(recordTag)
+        records = [] if self.cache and status == 200 else None
+        size = 0
+        downloading = 0.0
+        parsing = 0.0
+        chunks = endpoint_result.iter_content(chunk_size=65536)
+        try:
+            while True:
+                # Only the time spent here and in the parser is ours, the rest belongs to the consumer
+                read_start = time.time()
+                chunk = next(chunks, None)
+                downloading += time.time() - read_start
+                parse_start = time.time()
+                completed = parser.feed(chunk or b'', chunk is None)
+                parsing += time.time() - parse_start
+                for record in completed:
+                    if records is not None:
+                        records.append(record)
+                    yield record
+                if chunk is None:
+                    break
+                size += len(chunk)
+        finally:
+            endpoint_result.close()
+        if self.timings:
+            self.timings.addRequest(status, endpoint_result.elapsed.total_seconds(), downloading, size,
+                                    endpoint_result.connectSeconds)
+            self.timings.add('parse', parsing)
+        if records is not None:
+            self.cache.put(cache_key, endpoint, {rootTag: {recordTag: records}},
+                           endpoint_result.headers.get('ETag'), endpoint_result.headers.get('Last-Modified'))
+
+    def iterPages(self, endpoint, parameters=None, itemsKey=None, pageSize=100, limit=None):
+        """ Executes paginated GET calls and yields the records as each page arrives """
+        parameters = dict(parameters or {})
+        page = 1
+        count = 0
+        while True:
+            page_parameters = dict(parameters, page=page, pageSize=pageSize)
+            result = self.getResult(endpoint, page_parameters)
+            records = (result.get(itemsKey) if itemsKey else result) or []
+            for record in records:
+                yield record
+                count += 1
+                if limit and count >= limit:
+                    return
+            following = nextPage(result, records, endpoint, parameters, page, pageSize)
+            if following is None:
+                return
+            endpoint, parameters, page, pageSize = following
 
     def httpErrors(self, status_code, endpoint, result):
         """ Basic error handling """
@@ -84,6 +529,13 @@ class EdgeGridHttpCaller():
             # exit(error_msg)
             print(error_msg)
 
+        if status_code == 429 or status_code >= 500:
+            error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
+            error_msg += "ERROR: The API is throttling or unavailable and the retries are exhausted.\n"
+            error_msg += "ERROR: Please try again later or lower max_requests_per_second in .edgerc.\n"
+            error_msg += "ERROR: Problem details: %s\n" % details
+            exit(error_msg)
+
         if status_code in [404]:
             error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
             error_msg += "ERROR: This means that the object does not exist as requested.\n"
@@ -112,56 +564,60 @@ class EdgeGridHttpCaller():
         """ Executes a GET API call and returns the JSON output """
         headers = {'content-type': 'application/json'}
         path = endpoint
-        endpoint_result = self.session.post(parse.urljoin(self.baseurl, path), data=body, headers=headers, params=parameters)
+        endpoint_result = self.request('POST', path, data=body, headers=headers, params=parameters)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: POST %s %s %s %s %s" % (path, body,parameters, status, endpoint_result.headers["content-type"]))
+            print("LOG: POST %s %s %s %s %s" % (path, body,parameters, status, endpoint_result.headers.get("content-type")))
         if status == 204:
             return {}
-        self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
+        result = jsonBody(endpoint_result)
+        self.httpErrors(endpoint_result.status_code, path, result)
 
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
-        return endpoint_result.json()
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
 
     def postFiles(self, endpoint, file,parameters=None):
         """ Executes a POST API call and returns the JSON output """
         path = endpoint
-        endpoint_result = self.session.post(parse.urljoin(self.baseurl, path), files=file,params=parameters)
+        endpoint_result = self.request('POST', path, files=file, params=parameters)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: POST FILES %s %s %s" % (path, status, endpoint_result.headers["content-type"]))
+            print("LOG: POST FILES %s %s %s" % (path, status, endpoint_result.headers.get("content-type")))
         if status == 204:
             return {}
-        self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
+        result = jsonBody(endpoint_result)
+        self.httpErrors(endpoint_result.status_code, path, result)
 
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
-        return endpoint_result.json()
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
 
     def putResult(self, endpoint, body, parameters=None):
         """ Executes a PUT API call and returns the JSON output """
         headers = {'content-type': 'application/json'}
         path = endpoint
 
-        endpoint_result = self.session.put(parse.urljoin(self.baseurl,path), data=body, headers=headers, params=parameters)
+        endpoint_result = self.request('PUT', path, data=body, headers=headers, params=parameters)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: PUT %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]))
+            print("LOG: PUT %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
         if status == 204:
             return {}
+        result = jsonBody(endpoint_result)
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
-        return endpoint_result.json()
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
 
     def deleteResult(self, endpoint,parameters=None):
         """ Executes a DELETE API call and returns the JSON output """
-        endpoint_result = self.session.delete(parse.urljoin(self.baseurl,endpoint),params=parameters)
+        endpoint_result = self.request('DELETE', endpoint, params=parameters)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: DELETE %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]))
+            print("LOG: DELETE %s %s %s" % (endpoint, status, endpoint_result.headers.get("content-type")))
         if status == 204:
             return {}
+        result = jsonBody(endpoint_result)
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
-        return endpoint_result.json()
+            print(">>>\n" + dumps(result, indent=True) + "\n<<<\n")
+        return result
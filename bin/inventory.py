@@ -0,0 +1,152 @@
+# Python edgegrid module - inventory crawl for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+from __future__ import print_function
+import time
+import logging
+from datetime import datetime
+from http_calls import asList, recordCopies
+import endpointdef
+from endpointdef import fanOut, domainNameOf
+
+logger = logging.getLogger(__name__)
+
+CPCODE_TYPES = ['INGEST', 'STORAGE', 'DELIVERY']
+TRANSPORTS = ['threads', 'async']
+
+
+class InventoryCrawler():
+    """ Walks domains -> streams -> events and the MSL resources with bounded concurrency per level
+
+    The threads transport runs every level on a worker pool with the requests session, the
+    async one runs it on an event loop with the asyncendpoints coroutines.
+    """
+
+    def __init__(self, accountSwitchKey=None, concurrency=16, events=True, details=True, transport='threads'):
+        self.accountSwitchKey = accountSwitchKey
+        self.concurrency = concurrency
+        self.events = events
+        self.details = details
+        self.transport = transport
+        self.api = endpointdef
+        self.loop = None
+        self.timings = []
+        self.errors = []
+
+    def safe(self, description, function, *args):
+        """ Runs one API call, a failure is recorded instead of aborting the crawl """
+        if self.loop is not None:
+            return self.safeAsync(description, function, *args)
+        try:
+            return function(*args)
+        except (Exception, SystemExit) as error:
+            self.errors.append({'call': description, 'error': str(error)})
+            return None
+
+    async def safeAsync(self, description, function, *args):
+        try:
+            return await function(*args)
+        except (Exception, SystemExit) as error:
+            self.errors.append({'call': description, 'error': str(error)})
+            return None
+
+    def level(self, name, function, items):
+        """ Runs function over items on the worker pool or the event loop and records the level timing """
+        start = time.time()
+        if self.loop is None:
+            results = fanOut(function, items, self.concurrency)
+        else:
+            results = self.loop.run_until_complete(self.api.fanOut(function, items, self.concurrency))
+        self.timings.append({'level': name, 'requests': len(items), 'seconds': round(time.time() - start, 3)})
+        return results
+
+    def crawl(self):
+        """ Returns the snapshot document of the whole account """
+        if self.transport != 'async':
+            return self.walk()
+        import asyncio
+        import asyncendpoints
+        # Fails here when aiohttp is missing, not once per call of the crawl
+        caller = asyncendpoints.getAsyncHttpCaller()
+        self.api = asyncendpoints
+        self.loop = asyncio.new_event_loop()
+        try:
+            return self.walk()
+        finally:
+            self.loop.run_until_complete(caller.close())
+            self.loop.close()
+
+    def walk(self):
+        key = self.accountSwitchKey
+        api = self.api
+        top = [
+            ('domains', lambda: api.listDomains(key)),
+            ('rtmpConfigs', lambda: api.listRTMPConfigs(key)),
+            ('storageGroups', lambda: api.listStorageGroup(key)),
+            ('mslStreams', lambda: api.listmslStreams(key)),
+            ('cdns', lambda: api.listcdns(key)),
+        ]
+        for cpcodeType in CPCODE_TYPES:
+            top.append(('cpcodes:' + cpcodeType,
+                        lambda cpcodeType=cpcodeType: api.listcpcodes(key, cpcodeType, 'false')))
+        results = dict(zip([name for name, call in top],
+                           self.level('account', lambda task: self.safe(task[0], task[1]), top)))
+
+        domains = recordCopies(asList(((results['domains'] or {}).get('domains') or {}).get('domain')))
+        domainNames = [domainNameOf(domain) for domain in domains]
+        streamLists = self.level('streams', lambda name: self.safe('listStreams ' + name, api.listStreams, name, key),
+                                 domainNames)
+
+        mslStreams = (results['mslStreams'] or {}).get('streams') or []
+        if self.details:
+            mslStreams = self.level('mslStreamDetails',
+                                    lambda streamId: self.safe('getmslStreams %s' % streamId, api.getmslStreams, key, streamId),
+                                    [stream['id'] for stream in mslStreams])
+
+        pairs = []
+        for domain, domainName, streamList in zip(domains, domainNames, streamLists):
+            domain['streams'] = recordCopies(asList(((streamList or {}).get('streams') or {}).get('stream')))
+            for stream in domain['streams']:
+                pairs.append((domainName, stream))
+        if self.events:
+            eventLists = self.level('events',
+                                    lambda pair: self.safe('listEvents %s %s' % (pair[0], pair[1]['stream-id']),
+                                                           api.listEvents, pair[0], pair[1]['stream-id'], key),
+                                    pairs)
+            for (domainName, stream), eventList in zip(pairs, eventLists):
+                stream['events'] = asList(((eventList or {}).get('events') or {}).get('event'))
+
+        return {
+            'generated': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'accountSwitchKey': key,
+            'domains': domains,
+            'rtmpConfigs': results['rtmpConfigs'],
+            'storageGroups': results['storageGroups'],
+            'mslStreams': [stream for stream in mslStreams if stream is not None],
+            'cdns': results['cdns'],
+            'cpcodes': dict((cpcodeType, results['cpcodes:' + cpcodeType]) for cpcodeType in CPCODE_TYPES),
+            'timings': self.timings,
+            'errors': self.errors,
+        }
+
+
+def crawlInventory(accountSwitchKey=None, concurrency=16, events=True, details=True, transport='threads'):
+    """ Crawls everything the account exposes in one snapshot document
+
+    Without details the MSL streams are the entries of the stream list, one request
+    per page instead of one per stream.
+    """
+    return InventoryCrawler(accountSwitchKey, concurrency, events, details, transport).crawl()
@@ -0,0 +1,410 @@
+# Python edgegrid module - local inventory index for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ SQLite index of an inventory snapshot. 'sync' stores every resource of the
+ account once, 'query' and 'search' answer from the index without the API.
+
+    resources  one row per domain, stream, RTMP config, storage group, MSL stream, CDN and cpcode,
+               with the modifiedDate of the record when it has one
+    fields     (resource, field, value) for id, name, cpcode, originHostName, hostName and
+               encoderZone, lower cased and indexed on (value, field)
+"""
+from __future__ import print_function
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from jsonbackend import loads, dumps
+from http_calls import asList
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = '~/.akamai-cli/cache/mediaservices/inventory.db'
+SCHEMA_VERSION = 2
+SEARCH_LIMIT = 100
+
+SCHEMA = [
+    'CREATE TABLE resources (account TEXT NOT NULL, kind TEXT NOT NULL, id TEXT, name TEXT, domain TEXT, '
+    'modified TEXT, document TEXT NOT NULL)',
+    'CREATE INDEX resources_account ON resources (account, kind, id)',
+    'CREATE TABLE fields (resource INTEGER NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL)',
+    'CREATE INDEX fields_value ON fields (value, field)',
+    'CREATE INDEX fields_resource ON fields (resource)',
+    'CREATE TABLE syncs (account TEXT PRIMARY KEY, synced TEXT NOT NULL, seconds REAL, counts TEXT NOT NULL)',
+]
+
+# Kind, keys holding its id and keys holding its name, first one present wins
+KINDS = [
+    ('domain', ('domain-name', 'hostname'), ('configuration-name',)),
+    ('stream', ('stream-id', 'id'), ('stream-name', 'name')),
+    ('rtmpConfig', ('cpcode', 'cp-code', 'id'), ('name', 'configuration-name')),
+    ('storageGroup', ('storage-group-id', 'id', 'name'), ('name', 'storage-group-name')),
+    ('mslStream', ('id',), ('name',)),
+    ('cdn', ('code', 'id'), ('name',)),
+    ('cpcode', ('id', 'cpcode'), ('name',)),
+]
+KIND_NAMES = [kind for kind, idKeys, nameKeys in KINDS]
+KIND_KEYS = dict((kind, (idKeys, nameKeys)) for kind, idKeys, nameKeys in KINDS)
+
+# One writer at a time when several accounts are synced in parallel
+writeLock = threading.Lock()
+
+
+def kindName(value):
+    """ Exact name of a kind written in any case, None for an unknown one """
+    for kind in KIND_NAMES:
+        if kind.lower() == str(value).lower():
+            return kind
+    return None
+
+
+def dbPath(config):
+    """ --db, then inventory_db in .edgerc, then the default next to the response cache """
+    path = getattr(config, 'db', None) or getattr(config, 'inventory_db', None) or DEFAULT_DB_PATH
+    return os.path.expanduser(path)
+
+
+def connect(path):
+    """ Opens the index, creating it or rebuilding it when the schema changed """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    connection = sqlite3.connect(path, timeout=30)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != SCHEMA_VERSION:
+        # The index is derived from the API, an old layout is dropped instead of migrated
+        for table in ('resources', 'fields', 'syncs'):
+            connection.execute('DROP TABLE IF EXISTS %s' % table)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        connection.commit()
+    return connection
+
+
+# Documents repeat the same keys, both are computed once per key or path
+normalizedKeys = {}
+pathFields = {}
+
+
+def normalized(key):
+    name = normalizedKeys.get(key)
+    if name is None:
+        name = normalizedKeys[key] = key.replace('-', '').replace('_', '').lower()
+    return name
+
+
+def leaves(document, path=()):
+    """ Yields (path of normalized keys, value) for every scalar of a document """
+    if isinstance(document, dict):
+        for key, value in document.items():
+            for item in leaves(value, path + (normalized(key),)):
+                yield item
+    elif isinstance(document, list):
+        for value in document:
+            for item in leaves(value, path):
+                yield item
+    elif document is not None and path:
+        yield path, document
+
+
+def fieldOf(path):
+    """ Indexed field of a leaf, None when it is not looked up """
+    if path not in pathFields:
+        pathFields[path] = leafField(path)
+    return pathFields[path]
+
+
+def leafField(path):
+    key = path[-1]
+    if key.endswith('cpcode'):
+        return 'cpcode'
+    if key == 'originhostname' or (key == 'hostname' and len(path) > 1 and path[-2] == 'origin'):
+        return 'originHostName'
+    if key == 'hostname':
+        return 'hostName'
+    if key == 'encoderzone':
+        return 'encoderZone'
+    return None
+
+
+def firstValue(document, keys):
+    for key in keys:
+        value = document.get(key)
+        if value is not None and not isinstance(value, (dict, list)):
+            return str(value)
+    # Domains keep their name under configuration-details
+    wanted = [normalized(key) for key in keys]
+    for path, value in leaves(document):
+        if path[-1] in wanted:
+            return str(value)
+    return None
+
+
+def recordsOf(document):
+    """ Records of a list response: a JSON list, or the repeated element of an XML list """
+    while isinstance(document, dict) and len(document) == 1:
+        document = list(document.values())[0]
+    return [record for record in asList(document) if isinstance(record, dict)]
+
+
+def snapshotResources(snapshot):
+    """ Yields (kind, record, domain name) for every resource of an inventory snapshot """
+    for domain in snapshot.get('domains') or []:
+        streams = domain.get('streams') or []
+        record = dict((key, value) for key, value in domain.items() if key != 'streams')
+        yield 'domain', record, None
+        domainName = firstValue(record, ('domain-name', 'hostname'))
+        for stream in streams:
+            yield 'stream', dict((key, value) for key, value in stream.items() if key != 'events'), domainName
+    for kind, key in (('rtmpConfig', 'rtmpConfigs'), ('storageGroup', 'storageGroups'),
+                      ('mslStream', 'mslStreams'), ('cdn', 'cdns')):
+        for record in recordsOf(snapshot.get(key)):
+            yield kind, record, None
+    for cpcodeType, cpcodes in sorted((snapshot.get('cpcodes') or {}).items()):
+        for record in recordsOf(cpcodes):
+            yield 'cpcode', record, None
+
+
+def indexRows(resource, account, kind, record, domain):
+    """ Resource row and field rows of one record """
+    idKeys, nameKeys = KIND_KEYS[kind]
+    resourceId = firstValue(record, idKeys)
+    name = firstValue(record, nameKeys)
+    values = set()
+    if resourceId is not None:
+        values.add(('id', resourceId.lower()))
+    if name is not None:
+        values.add(('name', name.lower()))
+    for path, value in leaves(record):
+        field = fieldOf(path)
+        if field:
+            values.add((field, str(value).lower()))
+    if kind == 'cpcode' and resourceId is not None:
+        values.add(('cpcode', resourceId.lower()))
+    return ((resource, account, kind, resourceId, name, domain, record.get('modifiedDate'), dumps(record)),
+            [(resource, field, value) for field, value in sorted(values)])
+
+
+def insertResources(connection, account, items):
+    """ Inserts (kind, record, domain name) items and returns the count per kind """
+    # Row ids are assigned here so resources and fields go in with two executemany calls
+    resource = (connection.execute('SELECT MAX(rowid) FROM resources').fetchone()[0] or 0) + 1
+    resources = []
+    fields = []
+    counts = dict((kind, 0) for kind in KIND_NAMES)
+    for kind, record, domain in items:
+        row, rowFields = indexRows(resource, account, kind, record, domain)
+        resources.append(row)
+        fields.extend(rowFields)
+        counts[kind] += 1
+        resource += 1
+    connection.executemany('INSERT INTO resources (rowid, account, kind, id, name, domain, modified, document) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', resources)
+    connection.executemany('INSERT INTO fields (resource, field, value) VALUES (?, ?, ?)', fields)
+    return counts
+
+
+def recordSync(connection, account, synced, seconds):
+    """ Updates the sync time and the resource counts of an account """
+    counts = dict((kind, 0) for kind in KIND_NAMES)
+    counts.update(connection.execute('SELECT kind, COUNT(*) FROM resources WHERE account = ? GROUP BY kind', (account,)))
+    connection.execute('INSERT OR REPLACE INTO syncs (account, synced, seconds, counts) VALUES (?, ?, ?, ?)',
+                       (account, synced or datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'), seconds, dumps(counts)))
+    return counts
+
+
+def storeSnapshot(path, snapshot, seconds=None):
+    """ Replaces the resources of the snapshot's account in the index and returns the count per kind """
+    account = snapshot.get('accountSwitchKey') or ''
+    with writeLock:
+        connection = connect(path)
+        try:
+            with connection:
+                connection.execute('DELETE FROM fields WHERE resource IN (SELECT rowid FROM resources WHERE account = ?)',
+                                   (account,))
+                connection.execute('DELETE FROM resources WHERE account = ?', (account,))
+                insertResources(connection, account, snapshotResources(snapshot))
+                return recordSync(connection, account, snapshot.get('generated'), seconds)
+        finally:
+            connection.close()
+
+
+def mslState(path, account):
+    """ Watermark (newest modifiedDate) and modifiedDate per id of the MSL streams of an account """
+    connection = connect(path)
+    try:
+        modified = dict(connection.execute('SELECT id, modified FROM resources WHERE account = ? AND kind = ?',
+                                           (account, 'mslStream')))
+    finally:
+        connection.close()
+    dates = [date for date in modified.values() if date]
+    return (max(dates) if dates else None), modified
+
+
+def storeMslStreams(path, account, streams, seconds=None):
+    """ Replaces the given MSL streams of an account in the index and returns the count per kind """
+    ids = [str(stream['id']) for stream in streams]
+    with writeLock:
+        connection = connect(path)
+        try:
+            with connection:
+                # Chunked to stay under the SQLite limit on bound parameters
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    selected = 'SELECT rowid FROM resources WHERE account = ? AND kind = ? AND id IN (%s)' % (
+                        ', '.join('?' * len(chunk)))
+                    parameters = [account, 'mslStream'] + chunk
+                    connection.execute('DELETE FROM fields WHERE resource IN (%s)' % selected, parameters)
+                    connection.execute('DELETE FROM resources WHERE rowid IN (%s)' % selected, parameters)
+                insertResources(connection, account, [('mslStream', stream, None) for stream in streams])
+                return recordSync(connection, account, None, seconds)
+        finally:
+            connection.close()
+
+
+def syncMslStreams(path, accountSwitchKey=None, concurrency=16, pageSize=100):
+    """ Refreshes the MSL streams modified since the last sync
+
+    The list is read newest modifiedDate first and paging stops at the first stream
+    older than the watermark; only new or changed streams get a getmslStreams call.
+    Deleted streams are only dropped by a full sync.
+    """
+    from endpointdef import iterMslStreams, getmslStreams, fanOut
+    account = accountSwitchKey or ''
+    watermark, known = mslState(path, account)
+    if watermark is None:
+        exit("ERROR: No MSL streams of %s in %s yet, run a full sync first" % (accountSwitchKey or 'the account', path))
+
+    start = time.time()
+    scanned = 0
+    changed = []
+    for stream in iterMslStreams(accountSwitchKey, pageSize, sortKey='modifiedDate', sortOrder='DESC'):
+        modified = stream.get('modifiedDate')
+        if modified and modified < watermark:
+            break
+        scanned += 1
+        if modified is None or known.get(str(stream['id'])) != modified:
+            changed.append(stream['id'])
+
+    errors = []
+
+    def details(streamId):
+        try:
+            return getmslStreams(accountSwitchKey, streamId)
+        except (Exception, SystemExit) as error:
+            errors.append({'call': 'getmslStreams %s' % streamId, 'error': str(error)})
+            return None
+
+    streams = [stream for stream in fanOut(details, changed, concurrency) if stream]
+    crawled = time.time() - start
+    counts = storeMslStreams(path, account, streams, round(crawled, 3))
+    return {'db': path, 'accountSwitchKey': accountSwitchKey, 'counts': counts, 'watermark': watermark,
+            'scanned': scanned, 'changed': len(streams), 'crawlSeconds': round(crawled, 3),
+            'storeSeconds': round(time.time() - start - crawled, 3), 'errors': errors}
+
+
+def syncInventory(path, accountSwitchKey=None, concurrency=16, snapshotFile=None):
+    """ Crawls the account, or reads an inventory snapshot, into the index """
+    from inventory import crawlInventory
+    start = time.time()
+    if snapshotFile:
+        with open(os.path.expanduser(snapshotFile), 'rb') as snapshot_file:
+            snapshot = loads(snapshot_file.read())
+        errors = snapshot.get('errors') or []
+    else:
+        snapshot = crawlInventory(accountSwitchKey, concurrency, events=False, details=False)
+        errors = snapshot['errors']
+    crawled = time.time() - start
+    counts = storeSnapshot(path, snapshot, round(crawled, 3))
+    return {'db': path, 'accountSwitchKey': snapshot.get('accountSwitchKey'), 'counts': counts,
+            'crawlSeconds': round(crawled, 3), 'storeSeconds': round(time.time() - start - crawled, 3),
+            'errors': errors}
+
+
+def resultRecord(row, matched=None):
+    account, kind, resourceId, name, domain, document = row[:6]
+    record = {'kind': kind, 'accountSwitchKey': account or None, 'id': resourceId, 'name': name}
+    if domain:
+        record['domain'] = domain
+    if matched:
+        record['matched'] = matched
+    record['document'] = loads(document)
+    return record
+
+
+def accountClause(accountSwitchKey, kinds):
+    clauses = []
+    parameters = []
+    if accountSwitchKey:
+        clauses.append('r.account = ?')
+        parameters.append(accountSwitchKey)
+    if kinds:
+        clauses.append('r.kind IN (%s)' % ', '.join('?' * len(kinds)))
+        parameters.extend(kinds)
+    return ''.join(' AND ' + clause for clause in clauses), parameters
+
+
+def checkIndex(connection, path):
+    if not connection.execute('SELECT COUNT(*) FROM syncs').fetchone()[0]:
+        exit("ERROR: The inventory index %s is empty, run 'akamai mediaservices sync' first" % path)
+
+
+def queryInventory(path, criteria, accountSwitchKey=None, kinds=None, limit=None):
+    """ Resources matching every (field, value) of criteria exactly, case insensitive """
+    if not os.path.isfile(path):
+        exit("ERROR: No inventory index at %s, run 'akamai mediaservices sync' first" % path)
+    connection = connect(path)
+    try:
+        checkIndex(connection, path)
+        joins = []
+        parameters = []
+        for index, (field, value) in enumerate(criteria):
+            joins.append('JOIN fields f%d ON f%d.resource = r.rowid AND f%d.value = ? AND f%d.field = ?' % (
+                index, index, index, index))
+            parameters.extend([str(value).lower(), field])
+        where, whereParameters = accountClause(accountSwitchKey, kinds)
+        statement = 'SELECT DISTINCT r.account, r.kind, r.id, r.name, r.domain, r.document FROM resources r %s WHERE 1%s' % (
+            ' '.join(joins), where)
+        if limit:
+            statement += ' LIMIT %d' % limit
+        return [resultRecord(row) for row in connection.execute(statement, parameters + whereParameters)]
+    finally:
+        connection.close()
+
+
+def searchInventory(path, term, accountSwitchKey=None, kinds=None, limit=SEARCH_LIMIT):
+    """ Resources with an indexed field starting with term, exact matches first """
+    if not os.path.isfile(path):
+        exit("ERROR: No inventory index at %s, run 'akamai mediaservices sync' first" % path)
+    term = term.lower()
+    connection = connect(path)
+    try:
+        checkIndex(connection, path)
+        where, parameters = accountClause(accountSwitchKey, kinds)
+        # A range on the (value, field) index instead of LIKE, which SQLite cannot serve from it
+        statement = ('SELECT r.account, r.kind, r.id, r.name, r.domain, r.document, MIN(f.value != ?), f.field '
+                     'FROM fields f JOIN resources r ON r.rowid = f.resource '
+                     'WHERE f.value >= ? AND f.value < ?%s GROUP BY r.rowid ORDER BY 7, r.kind, r.name' % where)
+        if limit:
+            statement += ' LIMIT %d' % limit
+        rows = connection.execute(statement, [term, term, term + u'\U0010ffff'] + parameters)
+        return [resultRecord(row, row[7]) for row in rows]
+    finally:
+        connection.close()
+
@@ -0,0 +1,93 @@
+# Python edgegrid module - JSON backend for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ JSON decoding and encoding through orjson when it is installed, the standard
+ library otherwise. Set MEDIASERVICES_JSON=json to force the standard library.
+ Both produce the same documents; orjson writes non ASCII characters as UTF-8
+ instead of \\u escapes.
+"""
+import os
+import json
+
+COMPACT_SEPARATORS = (',', ':')
+
+# Resolved on first use, importing orjson costs more than --help itself
+orjson = None
+BACKEND = None
+
+
+def backend():
+    """ Returns 'orjson' when it is installed and not disabled, 'json' otherwise """
+    global BACKEND, orjson
+    if BACKEND is None:
+        try:
+            if os.environ.get('MEDIASERVICES_JSON', '').lower() == 'json':
+                raise ImportError('standard library requested')
+            import orjson
+            BACKEND = 'orjson'
+        except ImportError:
+            BACKEND = 'json'
+    return BACKEND
+
+
+def useBackend(name):
+    """ Switches between 'orjson' and 'json', used by the benchmarks """
+    global BACKEND, orjson
+    if name == 'orjson':
+        import orjson
+    BACKEND = name
+
+
+def loads(data):
+    """ Decodes a JSON document from bytes or text """
+    if (BACKEND or backend()) == 'orjson':
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def dumps(document, indent=False):
+    """ Encodes a document compact, or indented by two spaces like json.dumps(indent=2) """
+    if (BACKEND or backend()) == 'orjson':
+        try:
+            options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+            return orjson.dumps(document, option=options).decode('utf-8')
+        except TypeError:
+            # Integers over 64 bits and other types orjson refuses
+            pass
+    if indent:
+        return json.dumps(document, indent=2)
+    return json.dumps(document, separators=COMPACT_SEPARATORS)
+
+
+def canonical(document):
+    """ Compact UTF-8 encoding with sorted keys, equal documents give equal bytes """
+    if (BACKEND or backend()) == 'orjson':
+        try:
+            return orjson.dumps(document, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(document, sort_keys=True, separators=COMPACT_SEPARATORS, ensure_ascii=False).encode('utf-8')
+
+
+def encodeChunks(document, indent=False):
+    """ Encodes a document as chunks, the standard library streams large documents """
+    if (BACKEND or backend()) == 'orjson':
+        return [dumps(document, indent)]
+    if indent:
+        return json.JSONEncoder(indent=2).iterencode(document)
+    return json.JSONEncoder(separators=COMPACT_SEPARATORS).iterencode(document)
@@ -17,154 +17,374 @@
 *  Media Services CLI module by Achuthananda M P (apadmana@akamai.com) & Suhas Bharadwaj (sbharadw@akamai.com)*
 ************************************************************************
 """
+from __future__ import print_function
 import sys
-import os
-import requests
 import logging
-import json
-import texttable as tt
-
-
-from akamai.edgegrid import EdgeGridAuth, EdgeRc
-from config import EdgeGridConfig
-if sys.version_info[0] >= 3:
-    # python3
-    from urllib import parse
-else:
-    # python2.7
-    import urlparse as parse
+from jsonbackend import dumps, encodeChunks
+from streamtable import StreamingTable
+from http_calls import asList
 
 logger = logging.getLogger(__name__)
 
+JSON_OUTPUT_TYPES = ('json', 'json-compact', 'ndjson')
+CHUNK_SIZE = 65536
+
+
+def writeChunks(chunks):
+    """ Writes string chunks to stdout in blocks of about CHUNK_SIZE characters """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            sys.stdout.write(''.join(buffer))
+            buffer = []
+            size = 0
+    sys.stdout.write(''.join(buffer))
+    sys.stdout.flush()
+
+
+def ndjsonChunks(records):
+    for record in records:
+        yield dumps(record) + '\n'
+
+
+def printJson(document, output_type, records=()):
+    """ Prints a document (json, json-compact) or one compact line per record (ndjson) """
+    if output_type == 'ndjson':
+        writeChunks(ndjsonChunks(records))
+    elif output_type == 'json-compact':
+        writeChunks(encodeChunks(document))
+        print()
+    else:
+        writeChunks(encodeChunks(document, indent=True))
+        print()
+
+
+def jsonListChunks(key, records, output_type):
+    """ Encodes {key: [records]} one record at a time, the same way json.dumps does
+
+    key may also be a tuple of nested keys, ('domains', 'domain') encodes {"domains": {"domain": [records]}}
+    """
+    keys = key if isinstance(key, tuple) else (key,)
+    depth = len(keys)
+    if output_type == 'json-compact':
+        yield ''.join('{"%s":' % name for name in keys) + '['
+        separator = ''
+        for record in records:
+            yield separator + dumps(record)
+            separator = ','
+        yield ']' + '}' * depth + '\n'
+        return
+    yield '{' + ''.join('\n%s"%s": %s' % ('  ' * (level + 1), name, '[' if level == depth - 1 else '{')
+                        for level, name in enumerate(keys))
+    indent = '  ' * (depth + 1)
+    empty = True
+    for record in records:
+        yield ('\n' if empty else ',\n') + indent + dumps(record, indent=True).replace('\n', '\n' + indent)
+        empty = False
+    yield ('' if empty else '\n' + '  ' * depth) + ']' + ''.join('\n' + '  ' * level + '}' for level in range(depth - 1, -1, -1)) + '\n'
+
+
+def printJsonList(key, records, output_type='json'):
+    """ Prints {key: [records]} (json, json-compact) or one line per record (ndjson) from an iterator """
+    if output_type == 'ndjson':
+        writeChunks(ndjsonChunks(records))
+    else:
+        writeChunks(jsonListChunks(key, records, output_type))
+
 
 def formatOutputDomainList(domainList, output_type):
-    """ Formats the output on a given format (json or text) """
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    # Accept both a listDomains document and the records of iterDomains
+    if isinstance(domainList, dict):
+        domains = asList((domainList.get('domains') or {}).get('domain'))
+    else:
+        domains = domainList
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(domainList, indent=2))
+        printJsonList(('domains', 'domain'), domains, output_type)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([30, 30, 15])
-        ParentTable.set_cols_align(['c', 'c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm', 'm'])
         Parentheader = ['Config Name', 'HostName', 'Reporting CP Code']
-        ParentTable.header(Parentheader)
-        for my_item in domainList['domains']['domain']:
+        ParentTable = StreamingTable(Parentheader, [30, 30, 15])
+        for my_item in domains:
             Parentrow = [my_item["configuration-details"]['configuration-name'],
                          my_item["configuration-details"]['hostname'], my_item["configuration-details"]['reporting-cpcode']]
             ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable.close()
 
 
 def formatOutputStreamList(streamList, output_type):
-    """ Formats the output on a given format (json or text) """
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    # Accept both a listStreams or listAllStreams document and the records of iterStreams
+    if isinstance(streamList, dict):
+        streams = asList((streamList.get('streams') or {}).get('stream'))
+        # Streams merged from several domains (--all-domains) carry their domain name
+        all_domains = any('domain-name' in my_item for my_item in streams)
+    else:
+        streams = streamList
+        all_domains = False
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(streamList, indent=2))
+        printJsonList(('streams', 'stream'), streams, output_type)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([30, 30, 15])
-        ParentTable.set_cols_align(['c', 'c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm', 'm'])
-        Parentheader = ['StreamID', 'Type', 'Name']
-        ParentTable.header(Parentheader)
-        for my_item in streamList['streams']['stream']:
+        if all_domains:
+            ParentTable = StreamingTable(['Domain', 'StreamID', 'Type', 'Name'], [30, 30, 30, 15])
+        else:
+            ParentTable = StreamingTable(['StreamID', 'Type', 'Name'], [30, 30, 15])
+        for my_item in streams:
             Parentrow = [my_item["stream-id"], my_item["stream-type"], my_item["stream-name"]]
+            if all_domains:
+                Parentrow.insert(0, my_item.get("domain-name"))
             ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable.close()
+
+
+def formatOutputEventList(eventList, output_type):
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    if output_type in JSON_OUTPUT_TYPES:
+        # Let's print the JSON
+        printJson(eventList, output_type, asList((eventList.get('events') or {}).get('event')))
+
+    if output_type == "text":
+        # Iterate over the dictionary and print the selected information
+        events = asList((eventList.get('events') or {}).get('event'))
+        Parentheader = ['StreamID', 'Event Name', 'Start Time', 'End Time']
+        ParentTable = StreamingTable(Parentheader, [15, 30, 25, 25])
+        for my_item in events:
+            Parentrow = [my_item.get("stream-id"), my_item.get("event-name"),
+                         my_item.get("event-start-time"), my_item.get("event-end-time")]
+            ParentTable.add_row(Parentrow)
+        ParentTable.close()
 
 
 def formatOutputMSLStreamList(streamList, output_type):
-    """ Formats the output on a given format (json or text) """
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    # Accept both a listmslStreams document and an iterMslStreams iterator
+    streams = streamList['streams'] if isinstance(streamList, dict) else streamList
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(streamList, indent=2))
+        printJsonList('streams', streams, output_type)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([15, 30, 15, 15, 40, 30, 30, 15, 15])
-        ParentTable.set_cols_align(['c', 'c', 'c', 'c', 'c', 'c', 'c', 'c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm', 'm', 'm', 'm', 'm', 'm', 'm', 'm'])
         Parentheader = ['ID', 'Name', 'Format', 'CPcode', 'Origin',
                         'CreatedDate', 'ModifiedDate', 'DVR Window', 'Encoder Location']
-        ParentTable.header(Parentheader)
-        for my_item in streamList['streams']:
+        ParentTable = StreamingTable(Parentheader, [15, 30, 15, 15, 40, 30, 30, 15, 15])
+        for my_item in streams:
             Parentrow = [my_item["id"], my_item["name"], my_item["format"], my_item['cpcode'],
                          my_item['originHostName'], my_item['createdDate'], my_item['modifiedDate'], my_item['dvrWindowInMin'], my_item['encoderZone']]
             ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable.close()
 
 
 def formatOutputgetMSLStream(streamInfo, output_type):
-    """ Formats the output on a given format (json or text) """
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    # One getmslStreams document or the {'streams': [...]} of getAllMslStreams
+    streams = streamInfo['streams'] if 'streams' in streamInfo else [streamInfo]
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(streamInfo, indent=2))
+        printJson(streamInfo, output_type, streams)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([8, 10, 8, 8, 30, 25, 25, 8, 15, 30, 30, 30])
-        ParentTable.set_cols_align(['c', 'c', 'c', 'c', 'c', 'c', 'c', 'c', 'c', 'c', 'c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm', 'm', 'm', 'm', 'm', 'm', 'm', 'm', 'm', 'm', 'm'])
         Parentheader = ['ID', 'Name', 'Format', 'CPcode', 'Origin',
                         'CreatedDate', 'ModifiedDate', 'storage cpcode', 'Encoder Location', 'Primary URL', 'Backup URL', 'Allowed IPs']
-        ParentTable.header(Parentheader)
-        Parentrow = [streamInfo["id"], streamInfo["name"], streamInfo["format"], streamInfo['cpcode'],
-                     streamInfo['origin']['hostName'], streamInfo['createdDate'], streamInfo['modifiedDate'], streamInfo['storageGroup']['cpcode'], streamInfo['encoderZone'], streamInfo['primaryPublishingUrl'], streamInfo['backupPublishingUrl'], str(streamInfo['allowedIps'])]
-        ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable = StreamingTable(Parentheader, [8, 10, 8, 8, 30, 25, 25, 8, 15, 30, 30, 30])
+        for streamInfo in streams:
+            Parentrow = [streamInfo["id"], streamInfo["name"], streamInfo["format"], streamInfo['cpcode'],
+                         streamInfo['origin']['hostName'], streamInfo['createdDate'], streamInfo['modifiedDate'], streamInfo['storageGroup']['cpcode'], streamInfo['encoderZone'], streamInfo['primaryPublishingUrl'], streamInfo['backupPublishingUrl'], str(streamInfo['allowedIps'])]
+            ParentTable.add_row(Parentrow)
+        ParentTable.close()
 
 
 def formatOutputcdnlist(cdnList, output_type):
-    """ Formats the output on a given format (json or text) """
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(cdnList, indent=2))
+        printJson(cdnList, output_type, cdnList)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([15, 15])
-        ParentTable.set_cols_align(['c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm'])
         Parentheader = ['Code', 'CDN Name']
-        ParentTable.header(Parentheader)
+        ParentTable = StreamingTable(Parentheader, [15, 15])
         for each_item in cdnList:
             Parentrow = [each_item["code"], each_item["name"]]
             ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable.close()
 
 
 def formatOutputcpcodelist(cpcodelist, output_type):
-    if output_type == "json":
+    """ Formats the output on a given format (json, json-compact, ndjson or text) """
+    if output_type in JSON_OUTPUT_TYPES:
         # Let's print the JSON
-        print(json.dumps(cpcodelist, indent=2))
+        printJson(cpcodelist, output_type, cpcodelist)
 
     if output_type == "text":
         # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([15, 15, 30])
-        ParentTable.set_cols_align(['c', 'c', 'c'])
-        ParentTable.set_cols_valign(['m', 'm', 'm'])
         Parentheader = ['CPcode', 'Name', 'ContractId']
-        ParentTable.header(Parentheader)
+        ParentTable = StreamingTable(Parentheader, [15, 15, 30])
         for each_item in cpcodelist:
             Parentrow = [each_item["id"], each_item["name"], str(each_item["contractIds"])]
             ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
+        ParentTable.close()
+
+
+def flatten(value, prefix=''):
+    """ Yields (dotted key, leaf value) pairs of a nested document """
+    if isinstance(value, dict):
+        for key in value:
+            for item in flatten(value[key], '%s.%s' % (prefix, key) if prefix else key):
+                yield item
+    elif isinstance(value, list):
+        for index, element in enumerate(value):
+            for item in flatten(element, '%s[%d]' % (prefix, index)):
+                yield item
+    else:
+        yield prefix, value
+
+
+def formatOutputDocument(document, output_type):
+    """ Formats a document without a dedicated layout on a given format (json, json-compact, ndjson or text) """
+    if output_type in JSON_OUTPUT_TYPES:
+        # Let's print the JSON
+        printJson(document, output_type, [document])
+
+    if output_type == "text":
+        ParentTable = StreamingTable(['Key', 'Value'], [50, 60])
+        for key, value in flatten(document):
+            ParentTable.add_row([key, value])
+        ParentTable.close()
+
+
+def formatOutputFields(result, fields):
+    """ Prints the --fields columns of the records of a list result as a table """
+    from recordfilter import splitRecords, fieldNames, lookup
+    columns = fieldNames(fields)
+    paths = [column.split('.') for column in columns]
+    records = splitRecords(result)[0]
+    ParentTable = StreamingTable(columns)
+    for record in records:
+        ParentTable.add_row([lookup(record, path) for path in paths])
+    ParentTable.close()
+
+
+def formatOutputChanges(changes, output_type, timestamp=None):
+    """ Prints watch or diff changes as they come, one JSON line per change or one text line per record """
+    if output_type in JSON_OUTPUT_TYPES:
+        for change in changes:
+            sys.stdout.write(dumps(dict(change, time=timestamp) if timestamp else change) + '\n')
+    else:
+        symbols = {'added': '+', 'removed': '-', 'modified': '~'}
+        for change in changes:
+            if change['change'] == 'modified':
+                detail = ', '.join('%s: %s -> %s' % (path, values[0], values[1])
+                                   for path, values in sorted(change['fields'].items()))
+            else:
+                record = change['record']
+                detail = record.get('name') or record.get('stream-name') or ''
+            prefix = [timestamp] if timestamp else []
+            if 'section' in change:
+                prefix.append(change['section'])
+            sys.stdout.write(' '.join(prefix + [symbols[change['change']], change['id'], str(detail)]) + '\n')
+    sys.stdout.flush()
+
+
+def formatOutputBatch(records):
+    """ Prints the tagged result of every batch command as NDJSON, as soon as it is available """
+    for record in records:
+        sys.stdout.write(dumps(record) + '\n')
+        sys.stdout.flush()
+
+
+def formatOutputAccounts(records, output_type, formatter, output_file=None):
+    """ Prints the result of every account tagged with its switch key and returns the failed accounts """
+    failed = []
+
+    def checked():
+        for record in records:
+            if record['status'] != 'ok':
+                failed.append(record)
+                print("WARNING: account %s failed: %s" % (record['accountSwitchKey'], record['error'].strip().split('\n')[0]),
+                      file=sys.stderr)
+            yield record
+
+    if output_type == 'ndjson':
+        formatOutputBatch(checked())
+    elif output_type in JSON_OUTPUT_TYPES:
+        records = list(checked())
+        document = {
+            'accounts': [record for record in records if record['status'] == 'ok'],
+            'failed': [{'accountSwitchKey': record['accountSwitchKey'], 'error': record['error']} for record in failed]
+        }
+        if output_file:
+            with open(output_file, 'w') as document_file:
+                document_file.write(dumps(document, indent=True) + '\n')
+        else:
+            printJson(document, output_type)
+    else:
+        for record in checked():
+            if record['status'] == 'ok':
+                print("Account: %s" % record['accountSwitchKey'])
+                if record['result'] is not None:
+                    formatter(record['result'], output_type)
+    return failed
+
+
+def formatOutputInventory(snapshot, output_file=None):
+    """ Writes the inventory snapshot as JSON and reports the per level timings on stderr """
+    if output_file:
+        with open(output_file, 'w') as snapshot_file:
+            snapshot_file.write(dumps(snapshot, indent=True) + '\n')
+    else:
+        printJson(snapshot, 'json')
+
+    total = 0
+    for timing in snapshot['timings']:
+        print("LOG: inventory %-18s %6d requests %8.3fs" % (timing['level'], timing['requests'], timing['seconds']),
+              file=sys.stderr)
+        total += timing['seconds']
+    print("LOG: inventory %-18s %15s %8.3fs" % ('total', '', total), file=sys.stderr)
+    for error in snapshot['errors']:
+        print("WARNING: %s failed: %s" % (error['call'], error['error']), file=sys.stderr)
+
+
+def formatOutputSync(summary, output_type):
+    """ Prints the resources stored per kind by sync and its timings on stderr """
+    if output_type in JSON_OUTPUT_TYPES:
+        printJson(summary, output_type, [summary])
 
+    if output_type == "text":
+        ParentTable = StreamingTable(['Kind', 'Resources'], [15, 10])
+        for kind, count in summary['counts'].items():
+            ParentTable.add_row([kind, count])
+        ParentTable.close()
+
+    if 'watermark' in summary:
+        print("LOG: sync scanned %d MSL streams modified since %s, %d changed" % (
+            summary['scanned'], summary['watermark'], summary['changed']), file=sys.stderr)
+    print("LOG: sync crawled in %.3fs, stored in %.3fs into %s" % (
+        summary['crawlSeconds'], summary['storeSeconds'], summary['db']), file=sys.stderr)
+    for error in summary['errors']:
+        print("WARNING: %s failed: %s" % (error['call'], error['error']), file=sys.stderr)
+
+
+def formatOutputResources(resources, output_type):
+    """ Formats the query and search results on a given format (json, json-compact, ndjson or text) """
+    if output_type in JSON_OUTPUT_TYPES:
+        printJsonList('resources', resources, output_type)
+
+    if output_type == "text":
+        ParentTable = StreamingTable(['Kind', 'Id', 'Name', 'Domain', 'Account', 'Matched'])
+        for resource in resources:
+            ParentTable.add_row([resource['kind'], resource['id'], resource['name'], resource.get('domain'),
+                                 resource['accountSwitchKey'], resource.get('matched')])
+        ParentTable.close()
 
 '''
 def formatOutputConnectorList(connectorlist, output_type):
@@ -0,0 +1,159 @@
+# Python edgegrid module - --profile support for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ --profile runs the command under cProfile, which only sees the main thread,
+ and a sampling thread that walks the stacks of every thread. The samples give
+ the network / parse / format / import breakdown and the collapsed stacks for flame graphs.
+
+    --profile                         sorted report on stderr
+    --profile-file run.pstats         cProfile stats for pstats, snakeviz...  (.pstats or .prof)
+    --profile-file run.collapsed      collapsed stacks for flamegraph.pl or speedscope (.collapsed or .folded)
+    --profile-file run.txt            sorted report in a file
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import threading
+
+SAMPLE_INTERVAL = 0.005
+REPORT_LINES = 30
+
+# Innermost matching frame decides the category of a sample
+CATEGORIES = [
+    ('network', ('/requests/', '/urllib3/', '/ssl.py', '/socket.py', '/http/client.py', '/akamai/edgegrid/')),
+    ('parse', ('xmltodict', '/json/', 'jsonbackend.py', 'pyexpat', '/orjson')),
+    ('format', ('outputformat.py', 'streamtable.py', 'texttable', '/textwrap.py')),
+]
+IDLE_FILES = ('/threading.py', '/queue.py')
+
+
+def frameFile(frame):
+    return frame.f_code.co_filename.replace('\\', '/')
+
+
+def categorize(frame):
+    """ Category of a stack: import, network, parse, format, other, or idle for threads blocked on a lock or queue """
+    leaf = frame
+    category = None
+    while frame is not None:
+        filename = frameFile(frame)
+        # Lazy imports of requests and friends run module code that would look like network time
+        if filename.startswith('<frozen importlib'):
+            return 'import'
+        if category is None:
+            for name, patterns in CATEGORIES:
+                if any(pattern in filename for pattern in patterns):
+                    category = name
+                    break
+        frame = frame.f_back
+    if category:
+        return category
+    if frameFile(leaf).endswith(IDLE_FILES):
+        return 'idle'
+    return 'other'
+
+
+def stackKey(frame):
+    """ Root to leaf frames as module:function """
+    frames = []
+    while frame is not None:
+        frames.append('%s:%s' % (os.path.basename(frameFile(frame)), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class StackSampler(threading.Thread):
+    """ Samples the stacks of every other thread at a fixed interval """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        threading.Thread.__init__(self, name='profile-sampler')
+        self.daemon = True
+        self.interval = interval
+        self.stacks = {}
+        self.categories = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        own = threading.current_thread().ident
+        names = {}
+        while not self.stopped.wait(self.interval):
+            names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                category = categorize(frame)
+                self.categories[category] = self.categories.get(category, 0) + 1
+                if category == 'idle':
+                    continue
+                key = '%s;%s' % (names.get(ident, 'thread').split(' ')[0], stackKey(frame))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def breakdown(self):
+        """ Share of the busy samples per category """
+        busy = sum(count for category, count in self.categories.items() if category != 'idle')
+        shares = []
+        for category in ('network', 'parse', 'format', 'import', 'other'):
+            count = self.categories.get(category, 0)
+            shares.append((category, count * self.interval, 100.0 * count / busy if busy else 0.0))
+        return shares
+
+    def writeCollapsed(self, out):
+        for key, count in sorted(self.stacks.items()):
+            out.write('%s %d\n' % (key, count))
+
+
+def profileCommand(path, sort, function):
+    """ Runs function under cProfile and the stack sampler and writes the requested profile """
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    sampler = StackSampler()
+    start = time.time()
+    sampler.start()
+    profile.enable()
+    try:
+        return function()
+    finally:
+        profile.disable()
+        sampler.stop()
+        seconds = time.time() - start
+
+        target = os.path.expanduser(path) if path else None
+        if target and target.endswith(('.pstats', '.prof')):
+            profile.dump_stats(target)
+        elif target and target.endswith(('.collapsed', '.folded')):
+            with open(target, 'w') as out:
+                sampler.writeCollapsed(out)
+        else:
+            out = open(target, 'w') if target else sys.stderr
+            pstats.Stats(profile, stream=out).strip_dirs().sort_stats(sort).print_stats(REPORT_LINES)
+            if target:
+                out.close()
+
+        print("PROFILE: %.3fs wall, %d samples every %dms across threads" % (
+            seconds, sampler.samples, sampler.interval * 1000), file=sys.stderr)
+        for category, sampled, share in sampler.breakdown():
+            print("PROFILE: %-8s %8.3fs thread time %5.1f%%" % (category, sampled, share), file=sys.stderr)
+        if target:
+            print("PROFILE: written to %s" % target, file=sys.stderr)
@@ -0,0 +1,349 @@
+# Python edgegrid module - --filter and --fields for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Filter expressions are parsed with ast and compiled once into closures, nothing
+ is evaluated. They accept and, or, not, ==, !=, <, <=, >, >=, in and not in:
+
+    format==HLS and encoderZone=='US_EAST'
+    cpcode >= 200000 and not unused
+    encoderZone in [US_EAST, US_WEST] or origin.hostName == 'origin-7.akamaized.net'
+
+ The left operand of a comparison is a field, a dotted path for nested ones, with
+ _ or - between words (stream_type and stream-type both are stream-type). Bare words
+ on the right are strings. Values are compared as numbers or booleans when the field
+ is one, strings case insensitively.
+"""
+import ast
+import operator
+import logging
+from http_calls import asList
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda value, literal: value in literal,
+    ast.NotIn: lambda value, literal: value not in literal,
+}
+TRUE_WORDS = ('true', 'yes', '1')
+compiled = {}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def fieldPath(node):
+    """ ['origin', 'hostName'] for origin.hostName """
+    if isinstance(node, ast.Name):
+        return [node.id]
+    if isinstance(node, ast.Attribute):
+        return fieldPath(node.value) + [node.attr]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Sub):
+        # stream-type parses as stream - type
+        left = fieldPath(node.left)
+        right = fieldPath(node.right) if not isinstance(node.right, ast.Constant) else [str(node.right.value)]
+        return left[:-1] + [left[-1] + '-' + right[0]] + right[1:]
+    raise FilterError("expected a field name, got %s" % ast.dump(node))
+
+
+def lookup(record, path):
+    """ Value of a field path, None when it is missing """
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        if key in value:
+            value = value[key]
+        else:
+            value = value.get(key.replace('_', '-'))
+    return value
+
+
+def literal(node):
+    """ Constant of the right operand, a bare word is a string """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.Name, ast.Attribute, ast.BinOp)):
+        return '.'.join(fieldPath(node))
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [literal(element) for element in node.elts]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    raise FilterError("expected a value, got %s" % ast.dump(node))
+
+
+def coerce(value, constant):
+    """ Converts the constant to the type of the record value (XML values are all strings) """
+    if isinstance(constant, list):
+        return [coerce(value, element) for element in constant]
+    if isinstance(value, bool):
+        if isinstance(constant, str):
+            return constant.lower() in TRUE_WORDS
+        return constant
+    if isinstance(value, (int, float)) and isinstance(constant, str):
+        try:
+            return float(constant)
+        except ValueError:
+            return constant
+    if isinstance(value, str) and not isinstance(constant, str) and constant is not None:
+        return str(constant).lower() if isinstance(constant, bool) else str(constant)
+    return constant
+
+
+def folded(value):
+    """ Strings compare case insensitively """
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, list):
+        return [folded(element) for element in value]
+    return value
+
+
+def compileComparison(node):
+    if len(node.ops) != 1:
+        raise FilterError("chained comparisons are not supported")
+    path = fieldPath(node.left)
+    compare = OPERATORS.get(type(node.ops[0]))
+    if compare is None:
+        raise FilterError("unsupported operator %s" % type(node.ops[0]).__name__)
+    constant = literal(node.comparators[0])
+    op = node.ops[0]
+    numeric = isinstance(constant, (int, float)) and not isinstance(constant, bool)
+
+    stringConstant = folded(constant) if isinstance(constant, str) else None
+    key = path[0] if len(path) == 1 else None
+    alternative = key.replace('_', '-') if key else None
+
+    def predicate(record):
+        if key is not None:
+            value = record.get(key)
+            if value is None:
+                value = record.get(alternative)
+        else:
+            value = lookup(record, path)
+        if stringConstant is not None and value.__class__ is str:
+            # The common case, a string field against a word
+            return compare(value.lower(), stringConstant)
+        if value is None:
+            # A missing field only satisfies == None, != and not in
+            return compare(None, constant) if isinstance(op, (ast.Eq, ast.NotEq)) else isinstance(op, ast.NotIn)
+        if numeric and isinstance(value, str):
+            # '200042' from XML against 200042
+            try:
+                return compare(float(value), constant)
+            except ValueError:
+                pass
+        try:
+            return compare(folded(value), folded(coerce(value, constant)))
+        except TypeError:
+            return False
+    return predicate
+
+
+def compileNode(node):
+    """ Turns an expression node into a predicate on one record """
+    if isinstance(node, ast.BoolOp):
+        predicates = [compileNode(value) for value in node.values]
+        combined = predicates[0]
+        # Nested closures short circuit without the generator of all() and any()
+        for predicate in predicates[1:]:
+            if isinstance(node.op, ast.And):
+                combined = (lambda first, second: lambda record: first(record) and second(record))(combined, predicate)
+            else:
+                combined = (lambda first, second: lambda record: first(record) or second(record))(combined, predicate)
+        return combined
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        inner = compileNode(node.operand)
+        return lambda record: not inner(record)
+    if isinstance(node, ast.Compare):
+        return compileComparison(node)
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        path = fieldPath(node)
+
+        def truthy(record):
+            value = lookup(record, path)
+            return bool(value) and str(value).lower() != 'false'
+        return truthy
+    raise FilterError("unsupported expression %s" % ast.dump(node))
+
+
+def parseFilter(expression):
+    try:
+        return ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError as error:
+        raise FilterError("invalid filter %r: %s" % (expression, error.msg))
+
+
+def compileFilter(expression):
+    """ Predicate of a --filter expression, None without one """
+    if not expression:
+        return None
+    # Batches and multi account runs compile the same expression once
+    if ('filter', expression) not in compiled:
+        compiled[('filter', expression)] = compileNode(parseFilter(expression))
+    return compiled[('filter', expression)]
+
+
+def fieldEquality(condition):
+    """ (field, value) of a field == value condition, None for any other """
+    if isinstance(condition, ast.Compare) and len(condition.ops) == 1 and isinstance(condition.ops[0], ast.Eq) \
+            and isinstance(condition.left, ast.Name):
+        value = literal(condition.comparators[0])
+        if not isinstance(value, list):
+            return condition.left.id, value
+    return None
+
+
+def conjuncts(node):
+    return node.values if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) else [node]
+
+
+def testedFields(node):
+    """ First name of the path of every field the expression tests, once per condition """
+    if isinstance(node, ast.BoolOp):
+        return [field for value in node.values for field in testedFields(value)]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return testedFields(node.operand)
+    if isinstance(node, ast.Compare):
+        return [fieldPath(node.left)[0]]
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        return [fieldPath(node)[0]]
+    return []
+
+
+def equalities(expression):
+    """ field == value conditions every matching record satisfies, the ones that can go in a query string
+
+    A field tested by any other condition is left out, type==INGEST and type==DELIVERY
+    must keep matching nothing.
+    """
+    if not expression:
+        return {}
+    tree = parseFilter(expression)
+    tested = testedFields(tree)
+    found = {}
+    for condition in conjuncts(tree):
+        equality = fieldEquality(condition)
+        if equality is not None and tested.count(equality[0]) == 1:
+            found[equality[0]] = equality[1]
+    return found
+
+
+def compileRemaining(expression, pushed):
+    """ Predicate of the conditions the API or the index did not apply, None when none is left
+
+    A condition pushed to the API is not checked again, the records it filtered
+    on may not even have the field (cpcodes have no type).
+    """
+    if not pushed:
+        return compileFilter(expression)
+    key = ('remaining', expression, tuple(sorted(pushed)))
+    if key not in compiled:
+        remaining = [condition for condition in conjuncts(parseFilter(expression))
+                     if (fieldEquality(condition) or (None,))[0] not in pushed]
+        if not remaining:
+            compiled[key] = None
+        elif len(remaining) == 1:
+            compiled[key] = compileNode(remaining[0])
+        else:
+            compiled[key] = compileNode(ast.BoolOp(op=ast.And(), values=remaining))
+    return compiled[key]
+
+
+def compileFields(spec):
+    """ Projection of --fields id,name,origin.hostName keeping the nesting of the records, None without one """
+    if not spec:
+        return None
+    if ('fields', spec) in compiled:
+        return compiled[('fields', spec)]
+    paths = [field.split('.') for field in fieldNames(spec)]
+
+    def project(record):
+        projected = {}
+        for path in paths:
+            source = record
+            target = projected
+            for depth, key in enumerate(path):
+                if not isinstance(source, dict):
+                    break
+                if key not in source and key.replace('_', '-') in source:
+                    key = key.replace('_', '-')
+                if key not in source:
+                    break
+                if depth == len(path) - 1:
+                    target[key] = source[key]
+                else:
+                    source = source[key]
+                    target = target.setdefault(key, {})
+        return projected
+    compiled[('fields', spec)] = project
+    return project
+
+
+def fieldNames(spec):
+    return [field.strip() for field in spec.split(',') if field.strip()]
+
+
+def splitRecords(result):
+    """ Records of a list result and the function putting records back in the same layout
+
+    Handles iterators, JSON lists and the nested {'streams': {'stream': [...]}} documents of the v1 API.
+    A single record filtered out is rebuilt as None, there is nothing to print.
+    """
+    if result is None:
+        return iter([]), lambda records: None
+    if isinstance(result, list):
+        return iter(result), list
+    if not isinstance(result, dict):
+        return result, lambda records: records
+    keys = []
+    document = result
+    while isinstance(document, dict) and len(document) == 1:
+        key = list(document.keys())[0]
+        keys.append(key)
+        document = document[key]
+    if not keys:
+        # A single record
+        return iter([result]), lambda records: next(iter(records), None)
+
+    def rebuild(records):
+        rebuilt = list(records)
+        for key in reversed(keys):
+            rebuilt = {key: rebuilt}
+        return rebuilt
+    return iter([record for record in asList(document) if isinstance(record, dict)]), rebuild
+
+
+def narrowRecords(records, predicate=None, projection=None):
+    """ Yields the records matching the filter, projected to the fields """
+    for record in records:
+        if predicate is not None and not predicate(record):
+            continue
+        yield projection(record) if projection is not None else record
+
+
+def narrowResult(result, predicate=None, projection=None):
+    """ Applies the filter and the projection to a list result, iterators stay lazy """
+    if predicate is None and projection is None:
+        return result
+    records, rebuild = splitRecords(result)
+    return rebuild(narrowRecords(records, predicate, projection))
@@ -0,0 +1,259 @@
+# Python edgegrid module - record diffs for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Records are indexed by their id with a hash of their content, two indexes are
+ compared in one pass and only modified records are walked field by field.
+
+ 'diff' compares two inventory snapshots, or a snapshot and the live account,
+ section by section: domains, streams, events, RTMP configs, storage groups,
+ MSL streams, CDNs and cpcodes. The old snapshot is indexed, the new one is
+ read once against it and every change is printed as soon as it is found.
+
+    exit status 0   the snapshots are the same
+    exit status 2   something was added, removed or modified
+"""
+from __future__ import print_function
+import os
+import sys
+import hashlib
+import logging
+from jsonbackend import canonical, loads
+
+logger = logging.getLogger(__name__)
+
+CHANGED_EXIT_STATUS = 2
+# Fields identifying a record, the first one present wins
+KEY_FIELDS = ('id', 'stream-id', 'event-name', 'domain-name', 'code', 'cpcode', 'name')
+
+
+def recordKey(record):
+    """ Id of a record, prefixed with its domain for v1 streams merged from several domains """
+    for field in KEY_FIELDS:
+        value = record.get(field)
+        if value is not None and not isinstance(value, (dict, list)):
+            if field != 'domain-name' and record.get('domain-name'):
+                return '%s/%s' % (record['domain-name'], value)
+            return str(value)
+    # Without an id the content is the identity, a change shows as removed and added
+    return 'sha1:' + recordHash(record)
+
+
+def recordHash(record):
+    return hashlib.sha1(canonical(record)).hexdigest()
+
+
+def indexRecords(records, key=recordKey):
+    """ {id: (content hash, record)} of an iterable of records """
+    index = {}
+    for record in records:
+        index[key(record)] = (recordHash(record), record)
+    return index
+
+
+def leafValues(value, prefix=''):
+    """ {dotted path: value} of the scalars of a record, lists keep their position """
+    leaves = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            leaves.update(leafValues(item, '%s.%s' % (prefix, key) if prefix else key))
+    elif isinstance(value, list):
+        for position, item in enumerate(value):
+            leaves.update(leafValues(item, '%s[%d]' % (prefix, position)))
+    else:
+        leaves[prefix] = value
+    return leaves
+
+
+def changedFields(old, new):
+    """ {path: [old value, new value]} of the fields that differ, None for a missing side """
+    before = leafValues(old)
+    after = leafValues(new)
+    changes = {}
+    for path in before:
+        if path not in after:
+            changes[path] = [before[path], None]
+        elif before[path] != after[path]:
+            changes[path] = [before[path], after[path]]
+    for path in after:
+        if path not in before:
+            changes[path] = [None, after[path]]
+    return changes
+
+
+def recordChange(key, previous, digest, record, section=None):
+    """ Change of one record against its (hash, record) in the old index, None when it is the same """
+    if previous is None:
+        change = {'change': 'added', 'id': key, 'record': record}
+    elif previous[0] != digest:
+        change = {'change': 'modified', 'id': key, 'fields': changedFields(previous[1], record)}
+    else:
+        return None
+    if section:
+        change['section'] = section
+    return change
+
+
+def removedChange(key, record, section=None):
+    change = {'change': 'removed', 'id': key, 'record': record}
+    if section:
+        change['section'] = section
+    return change
+
+
+def diffIndexes(old, new, section=None):
+    """ Yields the added, removed and modified records between two indexes """
+    for key, (digest, record) in new.items():
+        change = recordChange(key, old.get(key), digest, record, section)
+        if change is not None:
+            yield change
+    for key, (digest, record) in old.items():
+        if key not in new:
+            yield removedChange(key, record, section)
+
+
+def countChanges(changes):
+    counts = {'added': 0, 'removed': 0, 'modified': 0}
+    for change in changes:
+        counts[change['change']] += 1
+    return counts
+
+
+def hasEvents(snapshot):
+    """ True when the snapshot was crawled with the events of its streams """
+    return any('events' in stream for domain in snapshot.get('domains') or [] for stream in domain.get('streams') or [])
+
+
+def snapshotRecords(snapshot, sections=None, events=True):
+    """ Yields (section, id, record) for every resource of an inventory snapshot
+
+    Streams are keyed by domain and events by domain and stream, a stream record
+    leaves its events out so a new event is not also a modified stream.
+    """
+    from inventorydb import KIND_KEYS, firstValue, recordsOf
+
+    def wanted(section):
+        return not sections or section in sections
+
+    for domain in snapshot.get('domains') or []:
+        record = dict((key, value) for key, value in domain.items() if key != 'streams')
+        domainName = firstValue(record, KIND_KEYS['domain'][0])
+        if wanted('domain'):
+            yield 'domain', domainName, record
+        for stream in domain.get('streams') or []:
+            streamId = '%s/%s' % (domainName, firstValue(stream, KIND_KEYS['stream'][0]))
+            if wanted('stream'):
+                yield 'stream', streamId, dict((key, value) for key, value in stream.items() if key != 'events')
+            if events and wanted('event'):
+                for event in stream.get('events') or []:
+                    yield 'event', '%s/%s' % (streamId, event.get('event-name')), event
+    for section, key in (('rtmpConfig', 'rtmpConfigs'), ('storageGroup', 'storageGroups'),
+                         ('mslStream', 'mslStreams'), ('cdn', 'cdns')):
+        if wanted(section):
+            idKeys = KIND_KEYS[section][0]
+            for record in recordsOf(snapshot.get(key)):
+                yield section, firstValue(record, idKeys) or recordKey(record), record
+    if wanted('cpcode'):
+        # The same cpcode can be listed under several types
+        for cpcodeType, cpcodes in sorted((snapshot.get('cpcodes') or {}).items()):
+            for record in recordsOf(cpcodes):
+                yield 'cpcode', '%s/%s' % (cpcodeType, firstValue(record, KIND_KEYS['cpcode'][0])), record
+
+
+def indexSnapshot(snapshot, sections=None, events=True):
+    """ {(section, id): (content hash, record)} of an inventory snapshot """
+    index = {}
+    for section, key, record in snapshotRecords(snapshot, sections, events):
+        index[(section, key)] = (recordHash(record), record)
+    return index
+
+
+def diffSnapshotIndexes(old, new):
+    """ Yields the changes between two indexSnapshot indexes, tagged with their section """
+    for (section, key), (digest, record) in new.items():
+        change = recordChange(key, old.get((section, key)), digest, record, section)
+        if change is not None:
+            yield change
+    for (section, key), (digest, record) in old.items():
+        if (section, key) not in new:
+            yield removedChange(key, record, section)
+
+
+def diffSnapshots(old, new, sections=None, events=True):
+    """ Yields the changes from the old snapshot to the new one in one pass over each
+
+    Events are only compared when both snapshots have them.
+    """
+    events = events and hasEvents(old) and hasEvents(new)
+    index = indexSnapshot(old, sections, events)
+    for section, key, record in snapshotRecords(new, sections, events):
+        change = recordChange(key, index.pop((section, key), None), recordHash(record), record, section)
+        if change is not None:
+            yield change
+    # What is left of the old index is not in the new snapshot
+    for (section, key), (digest, record) in index.items():
+        yield removedChange(key, record, section)
+
+
+def readSnapshot(path):
+    """ Inventory snapshot written by 'inventory -o' """
+    try:
+        with open(os.path.expanduser(path), 'rb') as snapshot_file:
+            snapshot = loads(snapshot_file.read())
+    except (IOError, OSError) as error:
+        exit("ERROR: Cannot read the snapshot %s: %s" % (path, error))
+    except ValueError as error:
+        exit("ERROR: %s is not a JSON document: %s" % (path, error))
+    if not isinstance(snapshot, dict) or 'domains' not in snapshot:
+        exit("ERROR: %s is not an inventory snapshot, write one with 'akamai mediaservices inventory -o'" % path)
+    return snapshot
+
+
+def liveSnapshot(config, old):
+    """ Crawls the account of the old snapshot, with events only when the old snapshot has them """
+    from inventory import crawlInventory
+    accountSwitchKey = config.accountSwitchKey or old.get('accountSwitchKey')
+    snapshot = crawlInventory(accountSwitchKey, config.concurrency, hasEvents(old) and not config.no_events)
+    for error in snapshot['errors']:
+        # A failed list makes its records look removed
+        print("WARNING: %s failed: %s" % (error['call'], error['error']), file=sys.stderr)
+    return snapshot
+
+
+def countedChanges(changes, counts):
+    """ Passes the changes through and counts them per section """
+    for change in changes:
+        counts.setdefault(change['section'], {'added': 0, 'removed': 0, 'modified': 0})[change['change']] += 1
+        yield change
+
+
+def diffCommand(config, formatChanges):
+    """ Prints the changes between two snapshots, or a snapshot and the live account, and returns the exit status """
+    if len(config.accounts) > 1:
+        exit("ERROR: diff compares a single account")
+    old = readSnapshot(config.old)
+    if config.new:
+        new = readSnapshot(config.new)
+    else:
+        new = liveSnapshot(config, old)
+    counts = {}
+    formatChanges(countedChanges(diffSnapshots(old, new, config.kind, not config.no_events), counts), config.output_type, None)
+    for section, sectionCounts in sorted(counts.items()):
+        print("LOG: diff %s: %d added, %d removed, %d modified" % (
+            section, sectionCounts['added'], sectionCounts['removed'], sectionCounts['modified']), file=sys.stderr)
+    if not counts:
+        print("LOG: diff found no change between %s and %s" % (
+            old.get('generated'), new.get('generated')), file=sys.stderr)
+    return CHANGED_EXIT_STATUS if counts else 0
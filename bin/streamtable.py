@@ -0,0 +1,107 @@
+# Python edgegrid module - incremental table renderer for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import sys
+import textwrap
+
+
+class StreamingTable():
+    """ Draws a texttable style table row by row instead of buffering the whole table
+
+    Column widths are either given up front or sampled from the header and the first
+    sample rows, every row is wrapped once and written as soon as it is added so the
+    cost grows linearly with the number of rows.
+    """
+
+    def __init__(self, header, widths=None, sample=50, max_width=40, out=None):
+        self.header = [str(cell) for cell in header]
+        self.widths = list(widths) if widths else None
+        self.sample = sample
+        self.max_width = max_width
+        self.out = out or sys.stdout
+        self.pending = []
+        self.rows = 0
+        self.started = False
+
+    def add_row(self, row):
+        cells = ['' if cell is None else str(cell) for cell in row]
+        if self.widths is None:
+            self.pending.append(cells)
+            if len(self.pending) >= self.sample:
+                self.flushPending()
+            return
+        self.start()
+        self.writeRow(cells)
+
+    def close(self):
+        """ Writes whatever is still pending, prints the bottom border of an empty table """
+        if self.widths is None:
+            self.flushPending()
+        self.start()
+        if not self.rows:
+            self.out.write(self.rule('-'))
+        self.out.flush()
+
+    def flushPending(self):
+        """ Fixes the column widths from the sampled rows and writes them """
+        widths = [len(cell) for cell in self.header]
+        for cells in self.pending:
+            for index, cell in enumerate(cells):
+                longest = max(len(line) for line in cell.split('\n'))
+                widths[index] = max(widths[index], longest)
+        self.widths = [max(1, min(width, self.max_width)) for width in widths]
+        self.start()
+        for cells in self.pending:
+            self.writeRow(cells)
+        self.pending = []
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self.out.write(self.rule('-'))
+        self.out.write(self.renderLines(self.header))
+        self.out.write(self.rule('='))
+
+    def rule(self, char):
+        return '+' + '+'.join(char * (width + 2) for width in self.widths) + '+\n'
+
+    def writeRow(self, cells):
+        self.out.write(self.renderLines(cells) + self.rule('-'))
+        self.rows += 1
+
+    def wrap(self, cell, width):
+        if len(cell) <= width and '\n' not in cell:
+            return [cell]
+        lines = []
+        for part in cell.split('\n'):
+            lines.extend(textwrap.wrap(part, width) or [''])
+        return lines
+
+    def renderLines(self, cells):
+        """ Wraps the cells to their column width, centers them and aligns them vertically in the middle """
+        wrapped = [self.wrap(cell, width) for cell, width in zip(cells, self.widths)]
+        height = max(len(lines) for lines in wrapped)
+        columns = []
+        for lines, width in zip(wrapped, self.widths):
+            top = (height - len(lines)) // 2
+            lines = [''] * top + lines + [''] * (height - len(lines) - top)
+            column = []
+            for line in lines:
+                fill = width - len(line)
+                column.append(' ' * (fill // 2) + line + ' ' * (fill - fill // 2))
+            columns.append(column)
+        return ''.join('| ' + ' | '.join(line) + ' |\n' for line in zip(*columns))
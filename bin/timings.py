@@ -0,0 +1,160 @@
+# Python edgegrid module - timing instrumentation for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Phases recorded for every HTTP call:
+    connect   opening a new connection (TCP and TLS), only for the calls that opened one
+    wait      signing, sending and waiting for the response headers
+    download  reading the response body
+    parse     xmltodict or JSON decoding
+ and once per command:
+    render    printing the output, minus the API calls made while rendering
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import threading
+
+PHASES = ('connect', 'wait', 'download', 'parse', 'render')
+METRIC_PREFIX = 'akamai_mediaservices_cli'
+
+
+def percentile(values, fraction):
+    """ Nearest rank percentile of sorted values """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Timings():
+    """ Thread safe recorder of the time spent in every phase of a command """
+
+    def __init__(self):
+        self.started = time.time()
+        self.samples = dict((phase, []) for phase in PHASES)
+        self.statuses = {}
+        self.counters = {'bytes': 0, 'cacheHits': 0, 'connections': 0}
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.samples[phase].append(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def addRequest(self, status, wait, download, size, connect=0.0):
+        """ Records one HTTP call, wait includes the connect time of the transports that cannot tell them apart """
+        with self.lock:
+            if connect:
+                self.samples['connect'].append(connect)
+            self.samples['wait'].append(max(0.0, wait - connect))
+            self.samples['download'].append(download)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.counters['bytes'] += size
+
+    def total(self, *phases):
+        with self.lock:
+            return sum(sum(self.samples[phase]) for phase in phases)
+
+    def summary(self):
+        """ Count, total, mean, p50, p95 and max of every phase with the request counters """
+        with self.lock:
+            phases = {}
+            for phase in PHASES:
+                values = sorted(self.samples[phase])
+                phases[phase] = {
+                    'count': len(values),
+                    'seconds': sum(values),
+                    'mean': sum(values) / len(values) if values else 0.0,
+                    'p50': percentile(values, 0.5),
+                    'p95': percentile(values, 0.95),
+                    'max': values[-1] if values else 0.0,
+                }
+            return {
+                'seconds': time.time() - self.started,
+                'requests': sum(self.statuses.values()),
+                'statuses': dict((str(status), count) for status, count in self.statuses.items()),
+                'counters': dict(self.counters),
+                'phases': phases,
+            }
+
+    def report(self, out=None):
+        """ Prints the human readable summary of --timings """
+        out = out or sys.stderr
+        summary = self.summary()
+        print("TIMINGS: %.3fs total, %d requests (%s), %d new connections, %d cache hits, %d coalesced, %.1f KB received" % (
+            summary['seconds'], summary['requests'],
+            ', '.join('%s: %d' % item for item in sorted(summary['statuses'].items())) or 'none',
+            summary['counters']['connections'], summary['counters']['cacheHits'],
+            summary['counters'].get('coalesced', 0), summary['counters']['bytes'] / 1024.0), file=out)
+        print("TIMINGS: %-9s %7s %9s %9s %9s %9s %9s" % ('phase', 'count', 'total s', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'),
+              file=out)
+        for phase in PHASES:
+            values = summary['phases'][phase]
+            print("TIMINGS: %-9s %7d %9.3f %9.1f %9.1f %9.1f %9.1f" % (
+                phase, values['count'], values['seconds'], values['mean'] * 1000, values['p50'] * 1000,
+                values['p95'] * 1000, values['max'] * 1000), file=out)
+        counters = summary['counters']
+        if counters.get('retries') or counters.get('throttleWait'):
+            print("TIMINGS: %d retries, %.3fs backing off, %.3fs waiting for the rate limiter" % (
+                counters.get('retries', 0), counters.get('backoffWait', 0), counters.get('throttleWait', 0)), file=out)
+
+    def prometheus(self, command):
+        """ Renders the summary in the Prometheus text exposition format """
+        summary = self.summary()
+        labels = 'command="%s"' % command
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append('# HELP %s_%s %s' % (METRIC_PREFIX, name, help))
+            lines.append('# TYPE %s_%s %s' % (METRIC_PREFIX, name, kind))
+            for extra, value in samples:
+                lines.append('%s_%s{%s} %s' % (METRIC_PREFIX, name, labels + extra, repr(float(value))))
+
+        metric('duration_seconds', 'gauge', 'Wall time of the last run of the command.', [('', summary['seconds'])])
+        metric('last_run_timestamp_seconds', 'gauge', 'End of the last run of the command.', [('', time.time())])
+        metric('phase_seconds', 'gauge', 'Time spent per phase in the last run.',
+               [(',phase="%s"' % phase, summary['phases'][phase]['seconds']) for phase in PHASES])
+        metric('phase_p95_seconds', 'gauge', '95th percentile of the phase per request in the last run.',
+               [(',phase="%s"' % phase, summary['phases'][phase]['p95']) for phase in PHASES])
+        metric('requests', 'gauge', 'HTTP requests sent in the last run by status.',
+               [(',status="%s"' % status, count) for status, count in sorted(summary['statuses'].items())])
+        metric('received_bytes', 'gauge', 'Response bytes received in the last run.', [('', summary['counters']['bytes'])])
+        metric('connections_opened', 'gauge', 'New HTTP connections in the last run.',
+               [('', summary['counters']['connections'])])
+        metric('cache_hits', 'gauge', 'Responses served from the cache in the last run.',
+               [('', summary['counters']['cacheHits'])])
+        metric('coalesced_requests', 'gauge', 'GETs that shared the response of an identical one in flight in the last run.',
+               [('', summary['counters'].get('coalesced', 0))])
+        metric('retries', 'gauge', 'Requests retried after a 429, a 5xx or a connection error in the last run.',
+               [('', summary['counters'].get('retries', 0))])
+        return '\n'.join(lines) + '\n'
+
+    def writeMetrics(self, path, command):
+        """ Writes JSON, or the Prometheus textfile format for .prom files, atomically """
+        path = os.path.expanduser(path)
+        if path.endswith('.prom'):
+            content = self.prometheus(command)
+        else:
+            content = json.dumps(dict(self.summary(), command=command), indent=2) + '\n'
+        # The textfile collector may read at any time, never let it see a partial file
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as metrics_file:
+            metrics_file.write(content)
+        os.rename(tmp_path, path)
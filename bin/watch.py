@@ -0,0 +1,106 @@
+# Python edgegrid module - watch mode for the Media Services CLI
+""" Copyright 2017 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ --watch SECONDS repeats a read command on one session. Responses are kept in
+ memory and revalidated with If-None-Match, the first poll is printed as usual
+ and the next ones only print the added, removed and modified records. An
+ inventory snapshot is compared section by section, like 'diff' does.
+
+    exit status 0   stopped after --watch-count polls without a change, or Ctrl-C
+    exit status 2   a change was seen with --exit-on-change or --watch-count
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import logging
+import subprocess
+from datetime import datetime
+from jsonbackend import dumps
+from snapshotdiff import CHANGED_EXIT_STATUS, indexRecords, diffIndexes, countChanges, indexSnapshot, \
+    diffSnapshotIndexes
+
+logger = logging.getLogger(__name__)
+
+# Commands that write, never end or compare snapshots themselves
+UNWATCHABLE_COMMANDS = ('batch', 'serve', 'sync', 'diff')
+
+
+def runHook(command, changes, counts):
+    """ Runs the --on-change command with the changes as NDJSON on stdin and their counts in the environment """
+    environment = dict(os.environ, WATCH_ADDED=str(counts['added']), WATCH_REMOVED=str(counts['removed']),
+                       WATCH_MODIFIED=str(counts['modified']))
+    payload = ''.join(dumps(change) + '\n' for change in changes).encode('utf-8')
+    status = subprocess.run(command, shell=True, input=payload, env=environment).returncode
+    if status:
+        print("WARNING: --on-change command exited with status %d" % status, file=sys.stderr)
+
+
+def watchCommand(config, fetch, render, formatChanges):
+    """ Polls the command every config.watch seconds and prints what changed """
+    from cache import MemoryResponseCache
+    from endpointdef import getHttpCaller
+    from recordfilter import splitRecords
+
+    if config.command in UNWATCHABLE_COMMANDS:
+        exit("ERROR: %s cannot be watched" % config.command)
+    if len(config.accounts) > 1:
+        exit("ERROR: --watch runs for a single account")
+    if config.watch <= 0:
+        exit("ERROR: --watch needs a positive number of seconds")
+
+    # Every poll revalidates its responses, unchanged ones come back as 304 without a body
+    getHttpCaller().cache = MemoryResponseCache(refresh=True)
+    previous = None
+    polls = 0
+    changed = False
+    deadline = time.time()
+    # A snapshot is one document, its resources are indexed by section and id
+    snapshot = config.command == 'inventory'
+    try:
+        while True:
+            if snapshot:
+                result = fetch(config)
+                current = indexSnapshot(result)
+            else:
+                records, rebuild = splitRecords(fetch(config))
+                records = list(records)
+                current = indexRecords(records)
+                result = rebuild(records)
+            if previous is None:
+                render(config, result)
+            else:
+                changes = list(diffSnapshotIndexes(previous, current) if snapshot else diffIndexes(previous, current))
+                if changes:
+                    changed = True
+                    counts = countChanges(changes)
+                    formatChanges(changes, getattr(config, 'output_type', 'json'), datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'))
+                    if config.on_change:
+                        runHook(config.on_change, changes, counts)
+                    if config.exit_on_change:
+                        break
+                elif config.verbose:
+                    print("LOG: watch poll %d, no change" % (polls + 1), file=sys.stderr)
+            previous = current
+            polls += 1
+            if config.watch_count and polls >= config.watch_count:
+                break
+            # Polls keep a fixed cadence, one slower than the interval starts the next right away
+            deadline = max(deadline + config.watch, time.time())
+            time.sleep(max(0.0, deadline - time.time()))
+    except KeyboardInterrupt:
+        pass
+    return CHANGED_EXIT_STATUS if changed else 0
@@ -0,0 +1,6 @@
+""" Puts bin/ first on the path, the tests import the CLI modules the way the entry point does """
+import os
+import sys
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
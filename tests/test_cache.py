@@ -0,0 +1,120 @@
+""" Tests of the on-disk and in-memory response caches """
+import os
+import time
+import cache
+
+
+BASEURL = 'https://akab-host.luna.akamaiapis.net/'
+
+
+def storedAgo(responseCache, key, seconds):
+    """ Moves the stored time of an entry back by seconds """
+    path = responseCache.entryPath(key)
+    with open(path) as entry_file:
+        entry = cache.json.load(entry_file)
+    entry['stored'] -= seconds
+    with open(path, 'w') as entry_file:
+        cache.json.dump(entry, entry_file)
+
+
+def test_isEnabled_reads_flags_from_the_command_line_and_edgerc():
+    assert cache.isEnabled(True)
+    assert cache.isEnabled('yes')
+    assert not cache.isEnabled(None)
+    assert not cache.isEnabled('Off')
+    assert not cache.isEnabled('0')
+
+
+def test_key_depends_on_host_endpoint_and_parameters(tmp_path):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    key = responseCache.key(BASEURL, '/config-media-live/v1/live', {'accountSwitchKey': 'A'})
+    assert key == responseCache.key(BASEURL, '/config-media-live/v1/live?accountSwitchKey=A')
+    assert key != responseCache.key(BASEURL, '/config-media-live/v1/live', {'accountSwitchKey': 'B'})
+    assert key != responseCache.key('https://other/', '/config-media-live/v1/live', {'accountSwitchKey': 'A'})
+
+
+def test_ttlFor_uses_the_endpoint_table_capped_by_the_default(tmp_path):
+    assert cache.ResponseCache(str(tmp_path)).ttlFor('/config-media-live/v2/msl-origin/cdns') == 86400
+    assert cache.ResponseCache(str(tmp_path)).ttlFor('/config-media-live/v2/msl-origin/streams/12') == 120
+    assert cache.ResponseCache(str(tmp_path)).ttlFor('/elsewhere') == cache.DEFAULT_TTL
+    assert cache.ResponseCache(str(tmp_path), default_ttl=60).ttlFor('/config-media-live/v2/msl-origin/cdns') == 60
+
+
+def test_get_returns_fresh_entries_only(tmp_path):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    endpoint = '/config-media-live/v2/msl-origin/streams/12'
+    key = responseCache.key(BASEURL, endpoint)
+    assert responseCache.get(key, endpoint) is None
+    responseCache.put(key, endpoint, {'id': 12})
+    assert responseCache.get(key, endpoint)['result'] == {'id': 12}
+    storedAgo(responseCache, key, 121)
+    assert responseCache.get(key, endpoint) is None
+
+
+def test_refresh_bypasses_fresh_entries(tmp_path):
+    cache.ResponseCache(str(tmp_path)).put('key', '/config-media-live/v1/live', {'domains': None})
+    assert cache.ResponseCache(str(tmp_path), refresh=True).get('key', '/config-media-live/v1/live') is None
+
+
+def test_put_evicts_the_least_recently_used_entries(tmp_path):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    for index in range(3):
+        responseCache.put('key%d' % index, '/config-media-live/v1/live', {'padding': 'x' * 250})
+        os.utime(responseCache.entryPath('key%d' % index), (time.time() - 100 + index, time.time() - 100 + index))
+    # Room for three and a half entries, the fourth one evicts a single entry
+    responseCache.max_bytes = int(os.path.getsize(responseCache.entryPath('key0')) * 3.5)
+    # Reading key0 makes key1 the least recently used
+    assert responseCache.get('key0', '/config-media-live/v1/live') is not None
+    responseCache.put('key3', '/config-media-live/v1/live', {'padding': 'x' * 250})
+    assert os.path.exists(responseCache.entryPath('key0'))
+    assert not os.path.exists(responseCache.entryPath('key1'))
+    assert os.path.exists(responseCache.entryPath('key2'))
+    assert os.path.exists(responseCache.entryPath('key3'))
+
+
+def test_put_keeps_a_running_size_instead_of_scanning_every_time(tmp_path, monkeypatch):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    scans = []
+    scan = responseCache.scan
+    monkeypatch.setattr(responseCache, 'scan', lambda: scans.append(1) or scan())
+    for index in range(50):
+        responseCache.put('key%d' % index, '/config-media-live/v1/live', {'index': index})
+    # Replacing an entry only adds the difference
+    responseCache.put('key0', '/config-media-live/v1/live', {'index': 0})
+    assert len(scans) == 1
+    assert responseCache.total == sum(os.path.getsize(os.path.join(str(tmp_path), name))
+                                      for name in os.listdir(str(tmp_path)))
+
+
+def test_conditionalHeaders_come_from_the_stored_validators(tmp_path):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    assert responseCache.conditionalHeaders(None) == {}
+    responseCache.put('key', '/config-media-live/v1/live', {'domains': None}, '"v1"', 'Mon, 05 Oct 2026 10:00:00 GMT')
+    assert responseCache.conditionalHeaders(responseCache.load('key')) == {
+        'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 05 Oct 2026 10:00:00 GMT'}
+
+
+def test_load_returns_expired_entries_for_revalidation(tmp_path):
+    responseCache = cache.ResponseCache(str(tmp_path))
+    responseCache.put('key', '/config-media-live/v2/msl-origin/streams/12', {'id': 12}, '"v1"')
+    storedAgo(responseCache, 'key', 3600)
+    assert responseCache.get('key', '/config-media-live/v2/msl-origin/streams/12') is None
+    assert responseCache.load('key')['etag'] == '"v1"'
+
+
+def test_memory_cache_evicts_the_least_recently_used_entry():
+    responseCache = cache.MemoryResponseCache(max_entries=2)
+    responseCache.put('key0', '/config-media-live/v1/live', {'index': 0})
+    responseCache.put('key1', '/config-media-live/v1/live', {'index': 1})
+    assert responseCache.get('key0', '/config-media-live/v1/live')['result'] == {'index': 0}
+    responseCache.put('key2', '/config-media-live/v1/live', {'index': 2})
+    assert responseCache.load('key0') is not None
+    assert responseCache.load('key1') is None
+    assert responseCache.load('key2') is not None
+
+
+def test_memory_cache_hits_do_not_share_the_result():
+    responseCache = cache.MemoryResponseCache()
+    responseCache.put('key', '/config-media-live/v2/msl-origin/streams', {'streams': [{'id': 1}]})
+    responseCache.load('key')['result']['streams'].append({'id': 2})
+    assert responseCache.load('key')['result'] == {'streams': [{'id': 1}]}
@@ -0,0 +1,220 @@
+""" Tests of the EdgeGrid HTTP caller against a fake requests session """
+import json
+import time
+import threading
+import xmltodict
+from requests.structures import CaseInsensitiveDict
+import cache
+import http_calls
+
+
+BASEURL = 'https://akab-host.luna.akamaiapis.net/'
+CDNS = '/config-media-live/v2/msl-origin/cdns'
+
+
+class FakeResponse():
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.content = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.headers = CaseInsensitiveDict(dict({'Content-Type': 'application/json'}, **(headers or {})))
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+class FakeSession():
+    """ Answers with the given responses in order and records the requests """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def request(self, method, url, **kwargs):
+        self.sent.append((method, url, kwargs))
+        return self.responses.pop(0)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+def caller(session, responseCache=None, **options):
+    return http_calls.EdgeGridHttpCaller(session, False, False, BASEURL, responseCache, **options)
+
+
+def test_getResult_serves_fresh_responses_from_the_cache(tmp_path):
+    session = FakeSession(FakeResponse(200, {'cdns': ['akamai']}, {'ETag': '"v1"'}))
+    httpCaller = caller(session, cache.ResponseCache(str(tmp_path)))
+    assert httpCaller.getResult(CDNS) == {'cdns': ['akamai']}
+    assert httpCaller.getResult(CDNS) == {'cdns': ['akamai']}
+    assert len(session.sent) == 1
+
+
+def test_getResult_revalidates_with_the_stored_etag(tmp_path):
+    session = FakeSession(FakeResponse(200, {'cdns': ['akamai']}, {'ETag': '"v1"'}), FakeResponse(304, b''))
+    httpCaller = caller(session, cache.ResponseCache(str(tmp_path), refresh=True))
+    assert httpCaller.getResult(CDNS) == {'cdns': ['akamai']}
+    # Not modified, the stored result is returned without a body
+    assert httpCaller.getResult(CDNS) == {'cdns': ['akamai']}
+    assert session.sent[1][2]['headers'] == {'If-None-Match': '"v1"'}
+
+
+def test_asList_evens_out_the_xmltodict_shapes():
+    assert http_calls.asList(None) == []
+    assert http_calls.asList({'stream-id': '1'}) == [{'stream-id': '1'}]
+    assert http_calls.asList([{'stream-id': '1'}]) == [{'stream-id': '1'}]
+
+
+def test_recordCopies_tags_copies_and_leaves_the_parsed_response_alone():
+    parsed = {'streams': {'stream': [{'stream-id': '1'}, {'stream-id': '2'}]}}
+    tagged = http_calls.recordCopies(parsed['streams']['stream'], {'domain-name': 'live.example.com'})
+    assert tagged == [{'stream-id': '1', 'domain-name': 'live.example.com'},
+                      {'stream-id': '2', 'domain-name': 'live.example.com'}]
+    assert parsed == {'streams': {'stream': [{'stream-id': '1'}, {'stream-id': '2'}]}}
+    tagged[0]['events'] = []
+    assert 'events' not in parsed['streams']['stream'][0]
+
+
+def streamsPage(ids, **extra):
+    return FakeResponse(200, dict({'streams': [{'id': streamId} for streamId in ids]}, **extra))
+
+
+def test_iterPages_reads_until_a_short_page():
+    session = FakeSession(streamsPage([1, 2]), streamsPage([3, 4]), streamsPage([5]))
+    streams = list(caller(session).iterPages('/config-media-live/v2/msl-origin/streams', None, 'streams', 2))
+    assert [stream['id'] for stream in streams] == [1, 2, 3, 4, 5]
+    assert [sent[2]['params']['page'] for sent in session.sent] == [1, 2, 3]
+
+
+def test_iterPages_stops_at_totalItems_and_at_the_limit():
+    session = FakeSession(streamsPage([1, 2], totalItems=4), streamsPage([3, 4], totalItems=4))
+    assert len(list(caller(session).iterPages('/config-media-live/v2/msl-origin/streams', None, 'streams', 2))) == 4
+    assert len(session.sent) == 2
+    session = FakeSession(streamsPage([1, 2]), streamsPage([3, 4]))
+    assert len(list(caller(session).iterPages('/config-media-live/v2/msl-origin/streams', None, 'streams', 2, 3))) == 3
+    assert len(session.sent) == 2
+
+
+def test_iterPages_follows_the_next_link():
+    following = '/config-media-live/v2/msl-origin/streams?page=2&pageSize=2&cursor=abc'
+    session = FakeSession(streamsPage([1, 2], links=[{'rel': 'next', 'href': following}]), streamsPage([3]))
+    streams = list(caller(session).iterPages('/config-media-live/v2/msl-origin/streams', None, 'streams', 2))
+    assert [stream['id'] for stream in streams] == [1, 2, 3]
+    assert session.sent[1][2]['params'] == {'page': 2, 'pageSize': 2, 'cursor': 'abc'}
+
+
+def test_retryAfter_reads_seconds_and_http_dates():
+    assert http_calls.retryAfter(FakeResponse(429, {}, {'Retry-After': '2'})) == 2.0
+    assert http_calls.retryAfter(FakeResponse(429, {})) is None
+    assert http_calls.retryAfter(FakeResponse(429, {}, {'Retry-After': 'Mon, 05 Oct 2020 10:00:00 GMT'})) == 0.0
+    assert http_calls.retryAfter(FakeResponse(429, {}, {'Retry-After': 'soon'})) is None
+
+
+def test_token_bucket_waits_once_the_burst_is_spent(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, 'sleep', slept.append)
+    bucket = http_calls.TokenBucket(10, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() > 0.0
+    assert len(slept) == 1
+    bucket.penalize(1.0)
+    assert bucket.acquire() > 1.0
+
+
+def test_request_retries_throttled_calls_after_the_asked_delay(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, 'sleep', slept.append)
+    session = FakeSession(FakeResponse(429, {}, {'Retry-After': '3'}), FakeResponse(200, {'cdns': ['akamai']}))
+    httpCaller = caller(session)
+    assert httpCaller.getResult(CDNS) == {'cdns': ['akamai']}
+    assert slept == [3.0]
+    assert httpCaller.stats['retries'] == 1
+
+
+def test_request_gives_up_after_max_retries_and_never_replays_a_post(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    session = FakeSession(*[FakeResponse(503, {}) for attempt in range(3)])
+    assert caller(session, max_retries=2).request('GET', CDNS).status_code == 503
+    assert len(session.sent) == 3
+    session = FakeSession(FakeResponse(503, {}))
+    assert caller(session).request('POST', CDNS).status_code == 503
+    assert len(session.sent) == 1
+
+
+DOMAINS = (b'<domains><domain id="1"><name>one.example</name><cdn>akamai</cdn><cdn>other</cdn></domain>'
+           b'<domain id="2"><name>two.example</name><origin/></domain></domains>')
+
+
+def test_xml_records_match_xmltodict_whatever_the_chunk_size():
+    expected = xmltodict.parse(DOMAINS)['domains']['domain']
+    for size in (1, 7, len(DOMAINS)):
+        parser = http_calls.XmlRecordParser('domain')
+        records = []
+        for start in range(0, len(DOMAINS), size):
+            records.extend(parser.feed(DOMAINS[start:start + size]))
+        records.extend(parser.feed(b'', True))
+        assert records == expected
+
+
+def inFlight(function, callers):
+    """ Runs function through one SingleFlight from several threads at once """
+    flight = http_calls.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    outcomes = []
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return function()
+
+    def run(call):
+        try:
+            outcomes.append(flight.do('key', call))
+        except Exception as error:
+            outcomes.append(error)
+
+    threads = [threading.Thread(target=run, args=(leader,))]
+    threads[0].start()
+    started.wait(5)
+    for index in range(callers - 1):
+        threads.append(threading.Thread(target=run, args=(function,)))
+        threads[-1].start()
+    # Let the waiters reach the call in flight before it returns
+    while len(threads) > 1 and not all(thread.is_alive() for thread in threads[1:]):
+        pass
+    threading.Event().wait(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return flight, outcomes
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    calls = []
+    flight, outcomes = inFlight(lambda: calls.append(1) or {'id': 9}, 4)
+    assert len(calls) == 1
+    assert sorted(shared for result, shared in outcomes) == [False, True, True, True]
+    assert all(result == {'id': 9} for result, shared in outcomes)
+    assert flight.calls == {}
+
+
+def test_single_flight_raises_the_error_in_every_caller():
+    def failing():
+        raise ValueError('boom')
+    flight, outcomes = inFlight(failing, 3)
+    assert [str(outcome) for outcome in outcomes] == ['boom'] * 3
+    # The next call runs again instead of replaying the failure
+    assert flight.do('key', lambda: 1) == (1, False)
+
+
+def test_flightKey_ignores_the_order_of_the_parameters():
+    assert http_calls.flightKey(CDNS, {'a': 1, 'b': 2}) == http_calls.flightKey(CDNS, {'b': '2', 'a': '1'})
+    assert http_calls.flightKey(CDNS, None) != http_calls.flightKey(CDNS, {'a': 1})
@@ -0,0 +1,98 @@
+""" Tests of the SQLite inventory index """
+import json
+import pytest
+import inventorydb
+import endpointdef
+
+
+SNAPSHOT = {
+    'accountSwitchKey': 'ACC-1',
+    'generated': '2026-10-01T10:00:00Z',
+    'domains': [{'domain-name': 'live.example.com', 'configuration-details': {'configuration-name': 'Live'},
+                 'streams': [{'stream-id': '12', 'stream-name': 'News', 'cpcode': '4567',
+                              'origin': {'host-name': 'Origin.Example.com'}, 'events': [{'id': '1'}]}]}],
+    'mslStreams': [{'id': 9, 'name': 'Sports', 'encoderZone': 'EUROPE', 'modifiedDate': '2026-09-30T08:00:00Z'}],
+    'cpcodes': {'INGEST': {'cpcodes': [{'id': 4567, 'name': 'news ingest'}]}},
+}
+
+
+@pytest.fixture
+def indexPath(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    inventorydb.storeSnapshot(path, SNAPSHOT)
+    return path
+
+
+def found(records):
+    return sorted((record['kind'], record['id']) for record in records)
+
+
+def test_storeSnapshot_counts_every_kind(tmp_path):
+    counts = inventorydb.storeSnapshot(str(tmp_path / 'inventory.db'), SNAPSHOT)
+    assert counts == {'domain': 1, 'stream': 1, 'rtmpConfig': 0, 'storageGroup': 0, 'mslStream': 1, 'cdn': 0, 'cpcode': 1}
+
+
+def test_query_matches_indexed_fields_case_insensitively(indexPath):
+    assert found(inventorydb.queryInventory(indexPath, [('cpcode', '4567')])) == [('cpcode', '4567'), ('stream', '12')]
+    assert found(inventorydb.queryInventory(indexPath, [('originHostName', 'origin.example.com')])) == [('stream', '12')]
+    assert found(inventorydb.queryInventory(indexPath, [('cpcode', '4567')], kinds=['stream'])) == [('stream', '12')]
+    assert inventorydb.queryInventory(indexPath, [('cpcode', '4567')], accountSwitchKey='ACC-2') == []
+    stream = inventorydb.queryInventory(indexPath, [('name', 'news')])[0]
+    assert stream['domain'] == 'live.example.com'
+    assert 'events' not in stream['document']
+
+
+def test_search_matches_prefixes_with_exact_matches_first(indexPath):
+    records = inventorydb.searchInventory(indexPath, 'News')
+    assert [(record['kind'], record['id']) for record in records] == [('stream', '12'), ('cpcode', '4567')]
+    assert records[0]['matched'] == 'name'
+    assert found(inventorydb.searchInventory(indexPath, 'europe')) == [('mslStream', '9')]
+    assert found(inventorydb.searchInventory(indexPath, 'live')) == [('domain', 'live.example.com')]
+
+
+def test_syncInventory_reads_a_snapshot_file(tmp_path):
+    snapshotFile = tmp_path / 'snapshot.json'
+    snapshotFile.write_text(json.dumps(SNAPSHOT))
+    path = str(tmp_path / 'inventory.db')
+    result = inventorydb.syncInventory(path, snapshotFile=str(snapshotFile))
+    assert result['accountSwitchKey'] == 'ACC-1'
+    assert result['counts']['stream'] == 1
+    # A second sync replaces the account instead of adding to it
+    inventorydb.syncInventory(path, snapshotFile=str(snapshotFile))
+    assert len(inventorydb.queryInventory(path, [('id', '12')])) == 1
+
+
+def test_an_empty_or_missing_index_exits(tmp_path):
+    with pytest.raises(SystemExit):
+        inventorydb.queryInventory(str(tmp_path / 'missing.db'), [('id', '12')])
+
+
+def test_syncMslStreams_fetches_only_streams_changed_since_the_watermark(indexPath, monkeypatch):
+    listed = [{'id': 11, 'modifiedDate': '2026-10-02T00:00:00Z'}, {'id': 9, 'modifiedDate': '2026-09-30T08:00:00Z'},
+              {'id': 5, 'modifiedDate': '2026-09-01T00:00:00Z'}]
+    pages = []
+    fetched = []
+
+    def iterMslStreams(accountSwitchKey, pageSize, **sorting):
+        pages.append(sorting)
+        for stream in listed:
+            yield stream
+
+    def getmslStreams(accountSwitchKey, streamId):
+        fetched.append(streamId)
+        return {'id': streamId, 'name': 'New %s' % streamId, 'modifiedDate': '2026-10-02T00:00:00Z'}
+
+    monkeypatch.setattr(endpointdef, 'iterMslStreams', iterMslStreams)
+    monkeypatch.setattr(endpointdef, 'getmslStreams', getmslStreams)
+    monkeypatch.setattr(endpointdef, 'fanOut', lambda function, items, concurrency: [function(item) for item in items])
+    result = inventorydb.syncMslStreams(indexPath, 'ACC-1')
+    assert pages == [{'sortKey': 'modifiedDate', 'sortOrder': 'DESC'}]
+    # 9 is unchanged at the watermark, paging stops at 5
+    assert fetched == [11]
+    assert (result['scanned'], result['changed'], result['counts']['mslStream']) == (2, 1, 2)
+    assert inventorydb.mslState(indexPath, 'ACC-1')[0] == '2026-10-02T00:00:00Z'
+
+
+def test_syncMslStreams_needs_a_full_sync_first(tmp_path):
+    with pytest.raises(SystemExit):
+        inventorydb.syncMslStreams(str(tmp_path / 'inventory.db'))
@@ -0,0 +1,41 @@
+""" Tests of the JSON backends, both must produce the same documents """
+import json
+import pytest
+import jsonbackend
+
+
+DOCUMENT = {'streams': [{'id': 1, 'name': 'stream-é', 'origin': None, 'active': True, 'ratio': 0.5}], 'total': 1}
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def backendName(request, monkeypatch):
+    monkeypatch.setattr(jsonbackend, 'BACKEND', None)
+    jsonbackend.useBackend(request.param)
+    return request.param
+
+
+def test_loads_accepts_bytes_and_text(backendName):
+    assert jsonbackend.loads(json.dumps(DOCUMENT)) == DOCUMENT
+    assert jsonbackend.loads(json.dumps(DOCUMENT).encode('utf-8')) == DOCUMENT
+
+
+def test_dumps_round_trips_compact_and_indented(backendName):
+    assert jsonbackend.loads(jsonbackend.dumps(DOCUMENT)) == DOCUMENT
+    assert ' ' not in jsonbackend.dumps({'a': [1, 2]})
+    assert jsonbackend.dumps({'a': [1, 2]}, indent=True) == json.dumps({'a': [1, 2]}, indent=2)
+    assert jsonbackend.loads(''.join(jsonbackend.encodeChunks(DOCUMENT, True))) == DOCUMENT
+
+
+def test_dumps_falls_back_for_documents_orjson_refuses(backendName):
+    assert jsonbackend.loads(jsonbackend.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+
+
+def test_backend_honours_the_environment(monkeypatch):
+    monkeypatch.setattr(jsonbackend, 'BACKEND', None)
+    monkeypatch.setenv('MEDIASERVICES_JSON', 'json')
+    assert jsonbackend.backend() == 'json'
+
+
+def test_canonical_sorts_keys_and_keeps_utf8(backendName):
+    assert jsonbackend.canonical({'b': 1, 'a': 'é'}) == '{"a":"é","b":1}'.encode('utf-8')
+    assert jsonbackend.canonical({'a': 1, 'b': [1, 2]}) == jsonbackend.canonical({'b': [1, 2], 'a': 1})
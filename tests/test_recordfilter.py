@@ -0,0 +1,75 @@
+""" Tests of the --filter compiler, the --fields projection and the push-down helpers """
+import pytest
+import recordfilter
+import inventorydb
+
+
+STREAM = {'id': 12, 'format': 'HLS', 'encoderZone': 'US_EAST', 'cpcode': '200042', 'unused': False,
+          'stream-type': 'Universal', 'origin': {'hostName': 'origin-7.akamaized.net'}}
+
+
+def matches(expression, record=STREAM):
+    return recordfilter.compileFilter(expression)(record)
+
+
+def test_comparisons_fold_case_and_convert_strings():
+    assert matches("format==hls and encoderZone=='US_EAST'")
+    assert matches('cpcode >= 200000 and not unused')
+    assert not matches('cpcode < 200000')
+    assert matches('encoderZone in [US_EAST, US_WEST]')
+    assert matches('encoderZone not in [EUROPE]')
+    assert matches("origin.hostName == 'ORIGIN-7.akamaized.net'")
+    assert matches('stream_type == universal and stream-type == UNIVERSAL')
+    assert matches('unused == false')
+    assert matches('id == "12"')
+
+
+def test_missing_fields_only_match_inequalities():
+    assert not matches('missing == 1')
+    assert matches('missing != 1')
+    assert matches('missing not in [1]')
+    assert not matches('missing')
+    assert not matches('origin.missing.deeper == 1')
+
+
+def test_invalid_expressions_raise_a_filter_error():
+    for expression in ('format ==', 'format == HLS == HLS', 'len(format) == 3', 'format is HLS'):
+        with pytest.raises(recordfilter.FilterError):
+            recordfilter.compileFilter(expression)
+
+
+def test_compileFields_keeps_the_nesting():
+    project = recordfilter.compileFields('id, origin.hostName, stream_type, absent')
+    assert project(STREAM) == {'id': 12, 'origin': {'hostName': 'origin-7.akamaized.net'}, 'stream-type': 'Universal'}
+    assert recordfilter.compileFields('') is None
+
+
+def test_narrowResult_keeps_the_layout_of_the_result():
+    document = {'streams': {'stream': [{'id': '1', 'format': 'HLS'}, {'id': '2', 'format': 'DASH'}]}}
+    assert recordfilter.narrowResult(document, recordfilter.compileFilter('format==HLS')) == {
+        'streams': {'stream': [{'id': '1', 'format': 'HLS'}]}}
+    assert recordfilter.narrowResult([{'id': 1}, {'id': 2}], recordfilter.compileFilter('id==2')) == [{'id': 2}]
+    assert recordfilter.narrowResult({'id': 1, 'format': 'HLS'}, recordfilter.compileFilter('id==2')) is None
+
+
+def test_equalities_push_fields_tested_by_one_condition_only():
+    assert recordfilter.equalities('type==DELIVERY and unused==false and cpcode > 1') == {
+        'type': 'DELIVERY', 'unused': 'false'}
+    assert recordfilter.equalities("type=='INGEST' and type=='DELIVERY'") == {}
+    assert recordfilter.equalities('type==DELIVERY and not type==INGEST') == {}
+    assert recordfilter.equalities('type==DELIVERY or unused==true') == {}
+    assert recordfilter.equalities('') == {}
+
+
+def test_compileRemaining_skips_the_pushed_conditions():
+    assert recordfilter.compileRemaining('type==DELIVERY', {'type': 'DELIVERY'}) is None
+    remaining = recordfilter.compileRemaining('type==DELIVERY and cpcode > 5', {'type': 'DELIVERY'})
+    # cpcodes have no type, only the cpcode condition is checked
+    assert remaining({'cpcode': 6})
+    assert not remaining({'cpcode': 4})
+
+
+def test_kindName_normalises_the_case():
+    assert inventorydb.kindName('mslstream') == 'mslStream'
+    assert inventorydb.kindName('Stream') == 'stream'
+    assert inventorydb.kindName('unknown') is None
@@ -0,0 +1,78 @@
+""" Tests of the record and snapshot comparisons of --watch and diff """
+import copy
+import snapshotdiff
+
+
+def test_recordKey_prefers_ids_and_prefixes_merged_streams_with_their_domain():
+    assert snapshotdiff.recordKey({'id': 12, 'name': 'News'}) == '12'
+    assert snapshotdiff.recordKey({'stream-id': '12', 'domain-name': 'live.example.com'}) == 'live.example.com/12'
+    assert snapshotdiff.recordKey({'domain-name': 'live.example.com'}) == 'live.example.com'
+    assert snapshotdiff.recordKey({'format': 'HLS'}).startswith('sha1:')
+
+
+def test_diffIndexes_finds_added_removed_and_modified_records():
+    old = snapshotdiff.indexRecords([{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b', 'origin': {'hostName': 'x'}}])
+    new = snapshotdiff.indexRecords([{'id': 2, 'name': 'b', 'origin': {'hostName': 'y'}}, {'id': 3, 'name': 'c'}])
+    changes = sorted(snapshotdiff.diffIndexes(old, new), key=lambda change: change['id'])
+    assert [(change['change'], change['id']) for change in changes] == [('removed', '1'), ('modified', '2'), ('added', '3')]
+    assert changes[1]['fields'] == {'origin.hostName': ['x', 'y']}
+    assert snapshotdiff.countChanges(changes) == {'added': 1, 'removed': 1, 'modified': 1}
+
+
+def test_key_order_does_not_make_a_change():
+    old = snapshotdiff.indexRecords([{'id': 1, 'name': 'a', 'tags': ['x', 'y']}])
+    new = snapshotdiff.indexRecords([{'tags': ['x', 'y'], 'name': 'a', 'id': 1}])
+    assert list(snapshotdiff.diffIndexes(old, new)) == []
+
+
+def test_changedFields_walks_lists_by_position():
+    assert snapshotdiff.changedFields({'cdns': ['a', 'b']}, {'cdns': ['a'], 'new': 1}) == {
+        'cdns[1]': ['b', None], 'new': [None, 1]}
+
+
+SNAPSHOT = {
+    'generated': '2026-10-01T10:00:00Z',
+    'domains': [{'domain-name': 'live.example.com',
+                 'streams': [{'stream-id': '12', 'stream-name': 'News',
+                              'events': [{'event-name': 'launch', 'start': '10:00'}]}]}],
+    'mslStreams': [{'id': 9, 'name': 'Sports'}],
+    'cpcodes': {'INGEST': [{'id': 4567, 'name': 'news'}], 'DELIVERY': [{'id': 4567, 'name': 'news'}]},
+}
+
+
+def changesOf(old, new, sections=None, events=True):
+    return sorted((change['section'], change['change'], change['id'])
+                  for change in snapshotdiff.diffSnapshots(old, new, sections, events))
+
+
+def test_diffSnapshots_reports_changes_per_section():
+    new = copy.deepcopy(SNAPSHOT)
+    new['domains'][0]['streams'][0]['stream-name'] = 'World news'
+    new['domains'][0]['streams'][0]['events'].append({'event-name': 'close', 'start': '12:00'})
+    new['mslStreams'] = [{'id': 10, 'name': 'Weather'}]
+    del new['cpcodes']['DELIVERY']
+    assert changesOf(SNAPSHOT, new) == [
+        ('cpcode', 'removed', 'DELIVERY/4567'),
+        ('event', 'added', 'live.example.com/12/close'),
+        ('mslStream', 'added', '10'),
+        ('mslStream', 'removed', '9'),
+        ('stream', 'modified', 'live.example.com/12'),
+    ]
+    assert changesOf(SNAPSHOT, new, ['stream']) == [('stream', 'modified', 'live.example.com/12')]
+    assert changesOf(SNAPSHOT, copy.deepcopy(SNAPSHOT)) == []
+
+
+def test_events_are_compared_only_when_both_snapshots_have_them():
+    new = copy.deepcopy(SNAPSHOT)
+    del new['domains'][0]['streams'][0]['events']
+    assert changesOf(SNAPSHOT, new) == []
+    assert changesOf(new, SNAPSHOT) == []
+    assert changesOf(SNAPSHOT, SNAPSHOT, events=False) == []
+
+
+def test_snapshot_indexes_compare_like_diffSnapshots():
+    new = copy.deepcopy(SNAPSHOT)
+    new['mslStreams'][0]['name'] = 'Sports HD'
+    changes = list(snapshotdiff.diffSnapshotIndexes(snapshotdiff.indexSnapshot(SNAPSHOT), snapshotdiff.indexSnapshot(new)))
+    assert [(change['section'], change['change'], change['id']) for change in changes] == [('mslStream', 'modified', '9')]
+    assert changes[0]['fields'] == {'name': ['Sports', 'Sports HD']}
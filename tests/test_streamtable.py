@@ -0,0 +1,39 @@
+""" Tests of the incremental table renderer """
+import io
+import streamtable
+
+
+def render(header, rows, **options):
+    out = io.StringIO()
+    table = streamtable.StreamingTable(header, out=out, **options)
+    for row in rows:
+        table.add_row(row)
+    table.close()
+    return out.getvalue()
+
+
+def test_widths_are_sampled_from_the_header_and_the_rows():
+    assert render(['id', 'name'], [[1, 'stream-one'], [22, None]]) == (
+        '+----+------------+\n'
+        '| id |    name    |\n'
+        '+====+============+\n'
+        '| 1  | stream-one |\n'
+        '+----+------------+\n'
+        '| 22 |            |\n'
+        '+----+------------+\n')
+
+
+def test_long_cells_wrap_and_are_centered_vertically():
+    lines = render(['id', 'name'], [[1, 'alpha beta gamma']], max_width=6).split('\n')
+    assert lines[3:6] == ['|    | alpha  |', '| 1  |  beta  |', '|    | gamma  |']
+
+
+def test_rows_after_the_sample_use_the_sampled_widths():
+    lines = render(['id'], [['a'], ['bbbb']], sample=1).split('\n')
+    assert lines[0] == '+----+'
+    assert lines[5] == '| bb |'
+    assert lines[6] == '| bb |'
+
+
+def test_an_empty_table_still_has_its_header_and_border():
+    assert render(['id'], []) == '+----+\n| id |\n+====+\n+----+\n'